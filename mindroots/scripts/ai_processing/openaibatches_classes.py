@@ -1,10 +1,31 @@
 import os
 import csv
 import json
+import mmap
+import pandas as pd
+import random
 import time
-from openai import OpenAI
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 
+try:
+    import orjson
+
+    # Function to serialize one request as a JSONL line (orjson returns UTF-8 bytes directly)
+    def jsonl_line(obj):
+        return orjson.dumps(obj) + b"\n"
+
+    # Parser for raw JSONL line bytes
+    json_loads = orjson.loads
+except ImportError:
+    # One encoder reused for every line; compact separators and raw UTF-8 match orjson's output
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def jsonl_line(obj):
+        return _encode(obj).encode('utf-8') + b"\n"
+
+    json_loads = json.loads
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -17,14 +38,17 @@ if not api_key:
 # Instantiate the OpenAI client with the API key
 client = OpenAI(api_key=api_key)
 
+# Fixed seconds between batch status checks (e.g. 2 for test runs); when unset,
+# the wait follows the tiered schedule in _get_poll_interval
+POLL_INTERVAL = float(os.getenv('OPENAI_BATCH_POLL_INTERVAL') or 0) or None
+
 # Step 1: Read the CSV file and fetch Arabic words
 def read_csv(file_path):
     words_data = []
     with open(file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            word = row['word']
-            words_data.append(word)
+        reader = csv.reader(csvfile)
+        word_idx = next(reader).index('word')  # Resolve the column once from the header
+        words_data.extend(row[word_idx] for row in reader if row)
     return words_data
 
 
@@ -43,7 +67,8 @@ def create_batch_input_file(words_data, file_name="batchinput.jsonl", start_idx=
     Returns:
     - None
     """
-    with open(file_name, 'w', encoding='utf-8') as f:
+    with open(file_name, 'wb') as f:
+        lines = []
         for idx, word in enumerate(words_data[start_idx:start_idx + batch_size]):
             batch_request = {
                 "custom_id": f"request-{start_idx + idx}",
@@ -74,7 +99,8 @@ def create_batch_input_file(words_data, file_name="batchinput.jsonl", start_idx=
                     ]
                 }
             }
-            f.write(json.dumps(batch_request) + "\n")
+            lines.append(jsonl_line(batch_request))
+        f.write(b"".join(lines))  # One sequential write for the whole batch
     print(f"Batch input file '{file_name}' created with {len(words_data[start_idx:start_idx + batch_size])} entries.")
 
 
@@ -96,42 +122,86 @@ def create_batch(batch_input_file_id):
     print(f"Batch created with ID {batch.id}.")
     return batch.id
 
+# Function to pick the poll interval from how long the batch has been running:
+# short batches are noticed within seconds, long ones cost few retrieve calls
+def _get_poll_interval(elapsed):
+    if elapsed < 120:
+        return 5
+    if elapsed < 600:
+        return 15
+    if elapsed < 3600:
+        return 30
+    return 60
+
 # Step 5: Poll for batch completion status
-def poll_batch_status(batch_id):
-    status = None
-    while status != "completed":
-        batch = client.batches.retrieve(batch_id)
+def poll_batch_status(batch_id, max_retries=5, poll_interval=POLL_INTERVAL):
+    start = time.monotonic()
+    failures = 0  # Consecutive transient errors from retrieve
+    while True:
+        try:
+            batch = client.batches.retrieve(batch_id)
+        except (APIConnectionError, RateLimitError, InternalServerError) as e:
+            failures += 1
+            if failures > max_retries:
+                raise
+            backoff = min(2 ** failures, 60)
+            print(f"Checking batch {batch_id} failed ({e}); retrying in {backoff}s.")
+            time.sleep(backoff)
+            continue
+        failures = 0
         status = batch.status
         print(f"Batch {batch_id} is currently {status}.")
-        if status == "failed" or status == "cancelled":
-            raise Exception(f"Batch {batch_id} failed or was cancelled.")
-        time.sleep(60)  # Wait for 1 minute before checking again
+        if status == "completed":
+            break
+        if status in ("failed", "cancelled", "expired"):
+            raise Exception(f"Batch {batch_id} did not complete: {status}")
+        interval = poll_interval or _get_poll_interval(time.monotonic() - start)
+        time.sleep(interval + random.uniform(0, interval * 0.1))  # Jitter keeps concurrent pollers apart
     print(f"Batch {batch_id} completed.")
     return batch.output_file_id
 
 # Step 6: Retrieve the results of the batch
 def retrieve_batch_results(output_file_id, output_file_name="batch_output.jsonl"):
-    result = client.files.content(output_file_id)
-    with open(output_file_name, 'w', encoding='utf-8') as f:
-        f.write(result.text)
+    # Stream the download to disk in 1 MiB chunks instead of holding the whole output in memory;
+    # it lands under a .part name first, so an interrupted download never passes for a finished one
+    partial_name = output_file_name + ".part"
+    with client.files.with_streaming_response.content(output_file_id) as response, \
+            open(partial_name, 'wb') as f:
+        for chunk in response.iter_bytes(chunk_size=1 << 20):
+            f.write(chunk)
+    os.replace(partial_name, output_file_name)
     print(f"Batch results saved to '{output_file_name}'.")
 
 # Step 7: Process the results and classify the words
 def process_batch_results(output_file_name="batch_output.jsonl", words_data=None):
-    with open(output_file_name, 'r', encoding='utf-8') as f:
-        for line in f:
-            result = json.loads(line)
-            custom_id = result['custom_id']
-            classification = result['response']['body']['choices'][0]['message']['content'].strip()
-
-            # The custom_id is "request-{idx}", so we'll split by "-" and get the index
-            request_index = int(custom_id.split("-")[1])
-
-            # Retrieve the corresponding Arabic word from words_data using the index
-            arabic_word = words_data[request_index]
-
-            # Print the Arabic word alongside its classification
-            print(f"Arabic Word: {arabic_word} | Classification: {classification}")
+    custom_ids, classifications = [], []
+    # Memory-map the file and hand raw line bytes straight to the parser
+    # (mmap cannot map an empty file, so skip it)
+    if os.path.getsize(output_file_name):
+        with open(output_file_name, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                if not line.strip():
+                    continue
+                result = json_loads(line)
+                custom_ids.append(result['custom_id'])
+                classifications.append(result['response']['body']['choices'][0]['message']['content'].strip())
+
+    results = pd.DataFrame({'custom_id': custom_ids, 'classification': classifications}, dtype=str)  # str keeps .str usable when empty
+
+    # The custom_id is "request-{idx}", so strip the prefix from the whole column at once
+    results['idx'] = results['custom_id'].str.slice(len("request-")).astype('int64')
+
+    # Attach the corresponding Arabic word from words_data by index
+    words_df = pd.DataFrame({'arabic_word': words_data})
+    results = results.merge(words_df, left_on='idx', right_index=True)
+
+    # Print the Arabic word alongside the classification
+    for arabic_word, classification in zip(results['arabic_word'], results['classification']):
+        print(f"Arabic Word: {arabic_word} | Classification: {classification}")
+
+    # Return the mapped results for downstream use (e.g. database updates)
+    return results
 
 
 
@@ -1,11 +1,62 @@
 import os
 import csv
+import functools
+import io
 import json
+import math
+import mmap
+import random
 import time
-import xml.etree.ElementTree as ET
-from openai import OpenAI
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 
+try:
+    import orjson
+
+    # Function to serialize one request as a JSONL line (orjson returns UTF-8 bytes directly)
+    def jsonl_line(obj):
+        return orjson.dumps(obj) + b"\n"
+
+    # Serializer for a single JSON value, as bytes
+    json_dumps = orjson.dumps
+
+    # Parser for raw JSONL line bytes
+    json_loads = orjson.loads
+except ImportError:
+    # One encoder reused for every line; compact separators and raw UTF-8 match orjson's output
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def jsonl_line(obj):
+        return _encode(obj).encode('utf-8') + b"\n"
+
+    def json_dumps(obj):
+        return _encode(obj).encode('utf-8')
+
+    json_loads = json.loads
+
+# lxml's iterparse is faster when available; the stdlib ElementTree one has the same interface
+try:
+    from lxml import etree
+except ImportError:
+    import xml.etree.ElementTree as etree
+
+try:
+    import simdjson
+
+    # One parser reused for every line, so its internal buffers are allocated once
+    _simdjson_parser = simdjson.Parser()
+
+    # Function to pull (custom_id, content) from one output line, materializing only those two fields
+    def extract_response(line):
+        doc = _simdjson_parser.parse(line)
+        return doc["custom_id"], doc.at_pointer("/response/body/choices/0/message/content")
+except ImportError:
+    def extract_response(line):
+        result = json_loads(line)
+        return result['custom_id'], result['response']['body']['choices'][0]['message']['content']
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -18,65 +69,106 @@ if not api_key:
 # Instantiate the OpenAI client with the API key
 client = OpenAI(api_key=api_key)
 
+# Fixed seconds between batch status checks (e.g. 2 for test runs); when unset,
+# the wait follows the tiered schedule in _get_poll_interval
+POLL_INTERVAL = float(os.getenv('OPENAI_BATCH_POLL_INTERVAL') or 0) or None
+
+# Batches kept in flight at once; the Batch API runs them in parallel
+MAX_CONCURRENT_BATCHES = 8
+
+# Unique words per batch file; option 1 derives the number of output files from it
+BATCH_SIZE = 5000
+
 # Step 1: Parse the Quranic XML file
 def parse_quran_xml(file_path):
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    
-    words_data = []
-    for sura in root.findall('sura'):
-        sura_index = sura.get('index')
-        sura_name = sura.get('name')
-        for aya in sura.findall('aya'):
-            aya_index = aya.get('index')
-            aya_text = aya.get('text')
+    # Word data is kept as parallel columns (one entry per word) rather than a dict per word;
+    # the index columns are compact unsigned 16-bit arrays
+    words_data = {
+        "word": [],
+        "sura_index": array('H'),
+        "aya_index": array('H'),
+        "word_position": array('H')
+    }
+    # Stream the XML instead of building the whole tree, clearing each element once it is consumed
+    for event, elem in etree.iterparse(file_path, events=('start', 'end')):
+        if elem.tag == 'sura':
+            if event == 'start':
+                sura_index = int(elem.get('index'))
+            else:
+                elem.clear()
+        elif elem.tag == 'aya' and event == 'end':
+            aya_index = int(elem.get('index'))
+            aya_text = elem.get('text')
             # Split the aya text into words
             words = aya_text.split()
-            for word_position, word in enumerate(words, start=1):
-                # Build the location string in the format sura:aya:word_position
-                location = f"{sura_index}:{aya_index}:{word_position}"
-                words_data.append({
-                    "word": word,
-                    "sura_index": sura_index,
-                    "aya_index": aya_index,
-                    "word_position": word_position,
-                    "location": location,
-                    "sura_name": sura_name
-                })
+            words_data["word"].extend(words)
+            words_data["sura_index"].extend([sura_index] * len(words))
+            words_data["aya_index"].extend([aya_index] * len(words))
+            words_data["word_position"].extend(range(1, len(words) + 1))
+            elem.clear()
     return words_data
 
-# Step 2: Create batch input file for OpenAI Batch API
-def create_batch_input_file(words_data, file_name="batchinput.jsonl", start_idx=0, batch_size=1000):
-    with open(file_name, 'w', encoding='utf-8') as f:
-        for idx, word_data in enumerate(words_data[start_idx:start_idx + batch_size]):
-            word = word_data['word']
-            batch_request = {
-    "custom_id": f"request-{start_idx + idx}",
-    "method": "POST",
-    "url": "/v1/chat/completions",
-    "body": {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": 
-                "You are a helpful assistant trained to identify the grammatical nature of Arabic words. "
-                "Your task is to extract important grammatical information about the word provided. "
-                "Please respond with the following format: "
-                "'word: <word>, lemma: <lemma>, morphological pattern (wazn): <wazn>, part of speech: <POS>, gender: <gender>, number: <number>, "
-                "verb tense: <tense>, verb mood: <mood>, case: <case>, prefix: <prefix1>, suffix: <suffix1>'. "
-                "For verbs, provide the 3rd person masculine singular form. For nouns, remove articles like 'ال'. "
-                "For particles, separate them as prefixes or suffixes where applicable. Include the classical morphological pattern (wazn) such as 'Fa'ala' (فَعَلَ) for verbs and nouns."
-            },
-            {"role": "user", "content": f"Please provide the lemma, morphological pattern (wazn), and grammatical information for the following Arabic word: '{word}'."}
-        ]
+# System prompt shared by every request in the batch
+SYSTEM_PROMPT = (
+    "You are a helpful assistant trained to identify the grammatical nature of Arabic words. "
+    "Your task is to extract important grammatical information about the word provided. "
+    "Please respond with the following format: "
+    "'word: <word>, lemma: <lemma>, morphological pattern (wazn): <wazn>, part of speech: <POS>, gender: <gender>, number: <number>, "
+    "verb tense: <tense>, verb mood: <mood>, case: <case>, prefix: <prefix1>, suffix: <suffix1>'. "
+    "For verbs, provide the 3rd person masculine singular form. For nouns, remove articles like 'ال'. "
+    "For particles, separate them as prefixes or suffixes where applicable. Include the classical morphological pattern (wazn) such as 'Fa'ala' (فَعَلَ) for verbs and nouns."
+)
+
+# Function to pre-serialize a batch request line. The envelope and system prompt are the same
+# for every word, so only the request index (%d) and the user message (%s) are left to splice in.
+# Cached, so each template is serialized once per run rather than once per batch file.
+@functools.lru_cache(maxsize=None)
+def request_line_template(model, system_content, id_prefix="request"):
+    request = {
+        "custom_id": "__CUSTOM_ID__",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": "__USER_CONTENT__"}
+            ]
+        }
     }
-}
-            f.write(json.dumps(batch_request) + "\n")
-    print(f"Batch input file '{file_name}' created with {len(words_data[start_idx:start_idx + batch_size])} entries.")
+    line = jsonl_line(request).replace(b"%", b"%%")
+    custom_id = b'"' + id_prefix.encode() + b'-%d"'
+    return line.replace(b'"__CUSTOM_ID__"', custom_id, 1).replace(b'"__USER_CONTENT__"', b"%s", 1)
+
+# Function to collapse repeated surface forms before they are sent to OpenAI. Returns the unique
+# words (first-seen order, in the words_data column layout) and, for each, its positions in words_data.
+def dedupe_words(words_data):
+    positions = {}
+    for idx, word in enumerate(words_data['word']):
+        positions.setdefault(word, []).append(idx)
+    return {"word": list(positions)}, list(positions.values())
+
+# Step 2: Create batch input file for OpenAI Batch API
+def create_batch_input_file(words_data, file_name="batchinput.jsonl", start_idx=0, batch_size=1000, id_prefix="request"):
+    template = request_line_template("gpt-4o-mini", SYSTEM_PROMPT, id_prefix=id_prefix)
+
+    # Serialize the whole batch in memory; it is written to disk once and uploaded from RAM
+    buf = bytearray()
+    for idx, word in enumerate(words_data['word'][start_idx:start_idx + batch_size], start=start_idx):
+        buf += template % (idx, json_dumps(f"Please provide the lemma, morphological pattern (wazn), and grammatical information for the following Arabic word: '{word}'."))
+    with open(file_name, 'wb') as f:
+        f.write(buf)
+    print(f"Batch input file '{file_name}' created with {len(words_data['word'][start_idx:start_idx + batch_size])} entries.")
+    return buf
 
 # Step 3: Upload the batch file to OpenAI
-def upload_batch_file(file_name="batchinput.jsonl"):
-    with open(file_name, 'rb') as f:
-        batch_input_file = client.files.create(file=f, purpose="batch")
+def upload_batch_file(file_name="batchinput.jsonl", data=None):
+    if data is not None:
+        # Upload the serialized batch straight from memory instead of re-reading the file
+        batch_input_file = client.files.create(file=(os.path.basename(file_name), io.BytesIO(data)), purpose="batch")
+    else:
+        with open(file_name, 'rb') as f:
+            batch_input_file = client.files.create(file=f, purpose="batch")
     print(f"File '{file_name}' uploaded with ID {batch_input_file.id}")
     return batch_input_file.id
 
@@ -91,73 +183,138 @@ def create_batch(batch_input_file_id):
     print(f"Batch created with ID {batch.id}.")
     return batch.id
 
+# Function to pick the poll interval from how long the batch has been running:
+# short batches are noticed within seconds, long ones cost few retrieve calls
+def _get_poll_interval(elapsed):
+    if elapsed < 120:
+        return 5
+    if elapsed < 600:
+        return 15
+    if elapsed < 3600:
+        return 30
+    return 60
+
 # Step 5: Poll for batch completion status
-def poll_batch_status(batch_id):
-    status = None
-    while status != "completed":
-        batch = client.batches.retrieve(batch_id)
+def poll_batch_status(batch_id, max_retries=5, poll_interval=POLL_INTERVAL):
+    start = time.monotonic()
+    failures = 0  # Consecutive transient errors from retrieve
+    while True:
+        try:
+            batch = client.batches.retrieve(batch_id)
+        except (APIConnectionError, RateLimitError, InternalServerError) as e:
+            failures += 1
+            if failures > max_retries:
+                raise
+            backoff = min(2 ** failures, 60)
+            print(f"Checking batch {batch_id} failed ({e}); retrying in {backoff}s.")
+            time.sleep(backoff)
+            continue
+        failures = 0
         status = batch.status
         print(f"Batch {batch_id} is currently {status}.")
-        if status == "failed" or status == "cancelled":
-            raise Exception(f"Batch {batch_id} failed or was cancelled.")
-        time.sleep(60)  # Wait for 1 minute before checking again
+        if status == "completed":
+            break
+        if status in ("failed", "cancelled", "expired"):
+            raise Exception(f"Batch {batch_id} did not complete: {status}")
+        interval = poll_interval or _get_poll_interval(time.monotonic() - start)
+        time.sleep(interval + random.uniform(0, interval * 0.1))  # Jitter keeps concurrent pollers apart
     print(f"Batch {batch_id} completed.")
     return batch.output_file_id
 
 # Step 6: Retrieve the results of the batch
 def retrieve_batch_results(output_file_id, output_file_name="batch_output.jsonl"):
-    result = client.files.content(output_file_id)
-    with open(output_file_name, 'w', encoding='utf-8') as f:
-        f.write(result.text)
+    # Stream the download to disk in 1 MiB chunks instead of holding the whole output in memory;
+    # it lands under a .part name first, so an interrupted download never passes for a finished one
+    partial_name = output_file_name + ".part"
+    with client.files.with_streaming_response.content(output_file_id) as response, \
+            open(partial_name, 'wb') as f:
+        for chunk in response.iter_bytes(chunk_size=1 << 20):
+            f.write(chunk)
+    os.replace(partial_name, output_file_name)
     print(f"Batch results saved to '{output_file_name}'.")
 
 # Step 7: Process the results and generate a CSV for graph database linking
-def process_batch_results(output_file_name="batch_output.jsonl", words_data=None, append=False):
+# Function to turn one batch output file into CSV rows: [word, sura_index, aya_index, classification]
+def parse_batch_output(output_file_name, words_data, positions):
     csv_output = []
-    with open(output_file_name, 'r', encoding='utf-8') as f:
-        for line in f:
-            result = json.loads(line)
-            custom_id = result['custom_id']
-            classification = result['response']['body']['choices'][0]['message']['content'].strip()
-
-            # The custom_id is "request-{idx}", so we'll split by "-" and get the index
-            request_index = int(custom_id.split("-")[1])
-
-            # Retrieve the corresponding word data from words_data using the index
-            word_data = words_data[request_index]
-
-            # Output in CSV-compatible format
-            csv_output.append([
-                word_data['word'],  # Arabic word
-                word_data['sura_index'],  # Sura index
-                word_data['aya_index'],  # Aya index
-                classification  # Lemma, wazn, prefixes, and suffixes classification
-            ])
-
-            # Print the Arabic word alongside its classification
-            print(f"Arabic Word: {word_data['word']} | Classification: {classification}")
-    
-    # Write results to a CSV file for importing to the graph database
+    # Memory-map the file and hand raw line bytes straight to the parser
+    # (mmap cannot map an empty file, so skip it)
+    if os.path.getsize(output_file_name):
+        with open(output_file_name, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                if not line.strip():
+                    continue
+                custom_id, classification = extract_response(line)
+                classification = classification.strip()
+
+                # The custom_id is "u-{k}" for the k-th unique word, whose classification fans out
+                # to every position it occurs at. Output of older per-position ("request-{idx}")
+                # runs is rejected rather than mixed with the deduplicated file layout.
+                if not custom_id.startswith("u-"):
+                    raise ValueError(f"{output_file_name}: unexpected custom_id {custom_id!r}; "
+                                     "expected 'u-{k}' ids from a deduplicated run")
+
+                for request_index in positions[int(custom_id[len("u-"):])]:
+                    # Retrieve the corresponding word data from the words_data columns using the index
+                    word = words_data['word'][request_index]
+
+                    # Output in CSV-compatible format
+                    csv_output.append([
+                        word,  # Arabic word
+                        words_data['sura_index'][request_index],  # Sura index
+                        words_data['aya_index'][request_index],  # Aya index
+                        classification  # Lemma, wazn, prefixes, and suffixes classification
+                    ])
+
+                # Print the Arabic word alongside its classification
+                print(f"Arabic Word: {word} | Classification: {classification}")
+    return csv_output
+
+# Function to write parsed rows to the CSV for importing to the graph database
+def write_graphdb_csv(csv_output, append=False):
     # Open in append mode if append=True, otherwise write normally (for the first batch)
     mode = 'a' if append else 'w'
     with open('output_for_graphdb.csv', mode, newline='', encoding='utf-8') as csvfile:
         fieldnames = ['word', 'sura_index', 'aya_index', 'classification']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.writer(csvfile)
         
         # Write header only if we're writing the first batch (when mode == 'w')
         if mode == 'w':
-            writer.writeheader()
+            writer.writerow(fieldnames)
 
-        for row in csv_output:
-            writer.writerow({
-                'word': row[0],
-                'sura_index': row[1],
-                'aya_index': row[2],
-                'classification': row[3]
-            })
+        # Rows are already in fieldnames order, so write them all at once
+        writer.writerows(csv_output)
 
     print("Results processed and appended to output_for_graphdb.csv.")
 
+def process_batch_results(output_file_name="batch_output.jsonl", words_data=None, append=False, positions=None):
+    write_graphdb_csv(parse_batch_output(output_file_name, words_data, positions), append=append)
+
+# Word data for parse worker processes, handed over once per process rather than once per file
+_worker_words_data = None
+_worker_positions = None
+
+def _init_parse_worker(words_data, positions):
+    global _worker_words_data, _worker_positions
+    _worker_words_data = words_data
+    _worker_positions = positions
+
+def _parse_in_worker(output_file_name):
+    return parse_batch_output(output_file_name, _worker_words_data, _worker_positions)
+
+# Function to run one batch through the API: build, upload, submit, wait and download
+def run_batch(unique_words, start_idx, batch_size):
+    batch_number = start_idx // batch_size + 1
+    batch_file_name = f"batchinput_{batch_number}.jsonl"
+    batch_data = create_batch_input_file(unique_words, file_name=batch_file_name, start_idx=start_idx, batch_size=batch_size, id_prefix="u")
+    batch_input_file_id = upload_batch_file(file_name=batch_file_name, data=batch_data)
+    batch_id = create_batch(batch_input_file_id)
+    output_file_id = poll_batch_status(batch_id)
+    output_file_name = f"batch_output_{batch_number}.jsonl"
+    retrieve_batch_results(output_file_id, output_file_name=output_file_name)
+    return output_file_name
+
 
 def main():
     print("Choose an option:")
@@ -169,34 +326,38 @@ def main():
     if choice == "1":
         # Process existing batch results
         words_data = parse_quran_xml("quran-simple.xml")
+        unique_words, positions = dedupe_words(words_data)  # Resolves the "u-{k}" custom_ids
         
-        # Adjust this to handle all 16 batch files
-        num_batches = 16  # Number of batch output files
-        for batch_idx in range(1, num_batches + 1):
-            output_file_name = f"batch_output_{batch_idx}.jsonl"
-            append = batch_idx > 1  # Append after the first file
-            process_batch_results(output_file_name, words_data, append=append)
+        # Option 2 writes one output file per BATCH_SIZE unique words, so read exactly those
+        num_batches = math.ceil(len(unique_words['word']) / BATCH_SIZE)
+        output_file_names = [f"batch_output_{batch_idx}.jsonl" for batch_idx in range(1, num_batches + 1)]
+
+        # The files are independent, so parse them on all cores; executor.map yields in
+        # file order, so the CSV rows come out in the same order as a serial run
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_parse_worker,
+                                 initargs=(words_data, positions)) as executor:
+            for batch_idx, csv_output in enumerate(executor.map(_parse_in_worker, output_file_names), start=1):
+                append = batch_idx > 1  # Append after the first file
+                write_graphdb_csv(csv_output, append=append)
     
     elif choice == "2":
         # Run the full pipeline
         words_data = parse_quran_xml("quran-simple.xml")
-        total_words = len(words_data)
         
-        # Set the batch size for processing
-        batch_size = 5000  # Adjust based on needs
+        # Each distinct surface form is sent once; its classification is copied to every occurrence
+        unique_words, positions = dedupe_words(words_data)
+        total_words = len(unique_words['word'])
+        print(f"Sending {total_words} unique words for {len(words_data['word'])} word positions.")
         
-        # Process in batches
-        for start_idx in range(0, total_words, batch_size):
-            batch_file_name = f"batchinput_{start_idx//batch_size + 1}.jsonl"
-            create_batch_input_file(words_data, file_name=batch_file_name, start_idx=start_idx, batch_size=batch_size)
-            batch_input_file_id = upload_batch_file(file_name=batch_file_name)
-            batch_id = create_batch(batch_input_file_id)
-            output_file_id = poll_batch_status(batch_id)
-            retrieve_batch_results(output_file_id, output_file_name=f"batch_output_{start_idx//batch_size + 1}.jsonl")
-            
-            # Process and append results after each batch
-            append = start_idx != 0  # Only append after the first batch
-            process_batch_results(output_file_name=f"batch_output_{start_idx//batch_size + 1}.jsonl", words_data=words_data, append=append)
+        # Run the batches concurrently (the calls are I/O bound, so threads suffice).
+        # executor.map yields in submission order, so results are still appended batch by batch.
+        start_indices = range(0, total_words, BATCH_SIZE)
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+            output_file_names = executor.map(lambda start_idx: run_batch(unique_words, start_idx, BATCH_SIZE), start_indices)
+            for start_idx, output_file_name in zip(start_indices, output_file_names):
+                # Process and append results after each batch
+                append = start_idx != 0  # Only append after the first batch
+                process_batch_results(output_file_name=output_file_name, words_data=words_data, append=append, positions=positions)
     
     else:
         print("Invalid choice. Please run the script again.")
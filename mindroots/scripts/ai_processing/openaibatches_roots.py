@@ -1,10 +1,31 @@
 import os
-import csv
 import json
+import mmap
+import pandas as pd
+import random
 import time
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 
+try:
+    import orjson
+
+    # Function to serialize one request as a JSONL line (orjson returns UTF-8 bytes directly)
+    def jsonl_line(obj):
+        return orjson.dumps(obj) + b"\n"
+
+    # Parser for raw JSONL line bytes
+    json_loads = orjson.loads
+except ImportError:
+    # One encoder reused for every line; compact separators and raw UTF-8 match orjson's output
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def jsonl_line(obj):
+        return _encode(obj).encode('utf-8') + b"\n"
+
+    json_loads = json.loads
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -17,21 +38,25 @@ if not api_key:
 # Instantiate the OpenAI client with the API key
 client = OpenAI(api_key=api_key)
 
+# Fixed seconds between batch status checks (e.g. 2 for test runs); when unset,
+# the wait follows the tiered schedule in _get_poll_interval
+POLL_INTERVAL = float(os.getenv('OPENAI_BATCH_POLL_INTERVAL') or 0) or None
+
+# Batches kept in flight at once; the Batch API runs them in parallel
+MAX_CONCURRENT_BATCHES = 8
+
 # Step 1: Read the CSV file and fetch Arabic words and their definitions
 def read_csv(file_path):
-    words_data = []
-    with open(file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            word = row['word']
-            definition = row['definition']  # Make sure 'definition' matches the column name in your CSV
-            words_data.append((word, definition))
-    return words_data
+    # Parse only the two columns needed, with pandas' C parser; values stay plain strings
+    # ('definition' must match the column name in your CSV)
+    df = pd.read_csv(file_path, usecols=['word', 'definition'], dtype=str, keep_default_na=False, encoding='utf-8')
+    return list(df[['word', 'definition']].itertuples(index=False, name=None))
 
 
 # Step 2: Create batch input file for OpenAI Batch API
 def create_batch_input_file(words_data, file_name="batchinput.jsonl", start_idx=0, batch_size=1000):
-    with open(file_name, 'w', encoding='utf-8') as f:
+    with open(file_name, 'wb') as f:
+        lines = []
         for idx, (word, _) in enumerate(words_data[start_idx:start_idx + batch_size]):
             batch_request = {
                 "custom_id": f"request-{start_idx + idx}",
@@ -45,7 +70,8 @@ def create_batch_input_file(words_data, file_name="batchinput.jsonl", start_idx=
                     ]
                 }
             }
-            f.write(json.dumps(batch_request) + "\n")
+            lines.append(jsonl_line(batch_request))
+        f.write(b"".join(lines))  # One sequential write for the whole batch
     print(f"Batch input file '{file_name}' created with {len(words_data[start_idx:start_idx + batch_size])} entries.")
 
 
@@ -67,36 +93,73 @@ def create_batch(batch_input_file_id):
     print(f"Batch created with ID {batch.id}.")
     return batch.id
 
+# Function to pick the poll interval from how long the batch has been running:
+# short batches are noticed within seconds, long ones cost few retrieve calls
+def _get_poll_interval(elapsed):
+    if elapsed < 120:
+        return 5
+    if elapsed < 600:
+        return 15
+    if elapsed < 3600:
+        return 30
+    return 60
+
 # Step 5: Poll for batch completion status
-def poll_batch_status(batch_id):
-    status = None
-    while status != "completed":
-        batch = client.batches.retrieve(batch_id)
+def poll_batch_status(batch_id, max_retries=5, poll_interval=POLL_INTERVAL):
+    start = time.monotonic()
+    failures = 0  # Consecutive transient errors from retrieve
+    while True:
+        try:
+            batch = client.batches.retrieve(batch_id)
+        except (APIConnectionError, RateLimitError, InternalServerError) as e:
+            failures += 1
+            if failures > max_retries:
+                raise
+            backoff = min(2 ** failures, 60)
+            print(f"Checking batch {batch_id} failed ({e}); retrying in {backoff}s.")
+            time.sleep(backoff)
+            continue
+        failures = 0
         status = batch.status
         print(f"Batch {batch_id} is currently {status}.")
-        if status == "failed" or status == "cancelled":
-            raise Exception(f"Batch {batch_id} failed or was cancelled.")
-        time.sleep(60)  # Wait for 1 minute before checking again
+        if status == "completed":
+            break
+        if status in ("failed", "cancelled", "expired"):
+            raise Exception(f"Batch {batch_id} did not complete: {status}")
+        interval = poll_interval or _get_poll_interval(time.monotonic() - start)
+        time.sleep(interval + random.uniform(0, interval * 0.1))  # Jitter keeps concurrent pollers apart
     print(f"Batch {batch_id} completed.")
     return batch.output_file_id
 
 # Step 6: Retrieve the results of the batch
 def retrieve_batch_results(output_file_id, output_file_name="batch_output.jsonl"):
-    result = client.files.content(output_file_id)
-    with open(output_file_name, 'w', encoding='utf-8') as f:
-        f.write(result.text)
+    # Stream the download to disk in 1 MiB chunks instead of holding the whole output in memory;
+    # it lands under a .part name first, so an interrupted download never passes for a finished one
+    partial_name = output_file_name + ".part"
+    with client.files.with_streaming_response.content(output_file_id) as response, \
+            open(partial_name, 'wb') as f:
+        for chunk in response.iter_bytes(chunk_size=1 << 20):
+            f.write(chunk)
+    os.replace(partial_name, output_file_name)
     print(f"Batch results saved to '{output_file_name}'.")
 
 # Step 7: Process the results and classify the words
 def process_batch_results(output_file_name="batch_output.jsonl", words_data=None):
-    with open(output_file_name, 'r', encoding='utf-8') as f:
-        for line in f:
-            result = json.loads(line)
+    # Memory-map the file and hand raw line bytes straight to the parser
+    # (mmap cannot map an empty file, so skip it)
+    if not os.path.getsize(output_file_name):
+        return
+    with open(output_file_name, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b''):
+            if not line.strip():
+                continue
+            result = json_loads(line)
             custom_id = result['custom_id']
             classification = result['response']['body']['choices'][0]['message']['content'].strip()
 
-            # The custom_id is "request-{idx}", so we'll split by "-" and get the index
-            request_index = int(custom_id.split("-")[1])
+            # The custom_id is "request-{idx}", so the index is everything after the fixed prefix
+            request_index = int(custom_id[len("request-"):])
 
             # Retrieve the corresponding Arabic word from words_data using the index
             arabic_word = words_data[request_index]
@@ -110,6 +173,18 @@ def process_batch_results(output_file_name="batch_output.jsonl", words_data=None
 def process_existing_batch_results(words_data):
     process_batch_results(output_file_name="batch_output.jsonl", words_data=words_data)
 
+# Function to run one batch through the API: build, upload, submit, wait and download
+def run_batch(words_data, start_idx, batch_size):
+    batch_number = start_idx // batch_size + 1
+    batch_file_name = f"batchinput_{batch_number}.jsonl"
+    create_batch_input_file(words_data, file_name=batch_file_name, start_idx=start_idx, batch_size=batch_size)
+    batch_input_file_id = upload_batch_file(file_name=batch_file_name)
+    batch_id = create_batch(batch_input_file_id)
+    output_file_id = poll_batch_status(batch_id)
+    output_file_name = f"batch_output_{batch_number}.jsonl"
+    retrieve_batch_results(output_file_id, output_file_name=output_file_name)
+    return output_file_name
+
 
 
 def main():
@@ -131,15 +206,19 @@ def main():
         # Set the batch size for testing
         batch_size = 5000  # Change this value to the number of rows you want to process (e.g., 50 or 100)
         
-        # Test with only the first few batches
-        for start_idx in range(0, total_words, batch_size):
-            batch_file_name = f"batchinput_{start_idx//batch_size + 1}.jsonl"
-            create_batch_input_file(words_data, file_name=batch_file_name, start_idx=start_idx, batch_size=batch_size)
-            batch_input_file_id = upload_batch_file(file_name=batch_file_name)
-            batch_id = create_batch(batch_input_file_id)
-            output_file_id = poll_batch_status(batch_id)
-            retrieve_batch_results(output_file_id, output_file_name=f"batch_output_{start_idx//batch_size + 1}.jsonl")
-            process_batch_results(output_file_name=f"batch_output_{start_idx//batch_size + 1}.jsonl", words_data=words_data)
+        # Run the batches concurrently (the calls are I/O bound, so threads suffice)
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+            futures = [executor.submit(run_batch, words_data, start_idx, batch_size)
+                       for start_idx in range(0, total_words, batch_size)]
+
+            # Process results in batch order; a failed batch is reported without stopping the rest
+            for future in futures:
+                try:
+                    output_file_name = future.result()
+                except Exception as e:
+                    print(f"Batch failed: {e}")
+                    continue
+                process_batch_results(output_file_name=output_file_name, words_data=words_data)
             
             
     else:
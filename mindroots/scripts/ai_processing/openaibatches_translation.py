@@ -1,12 +1,35 @@
 import os
 import csv
+import io
 import json
+import mmap
+import functools
+import pandas as pd
+import random
 import time
 import tiktoken
-import glob
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 
+try:
+    import orjson
+
+    # Function to serialize one request as a JSONL line (orjson returns UTF-8 bytes directly)
+    def jsonl_line(obj):
+        return orjson.dumps(obj) + b"\n"
+
+    # Parser for raw JSONL line bytes
+    json_loads = orjson.loads
+except ImportError:
+    # One encoder reused for every line; compact separators and raw UTF-8 match orjson's output
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def jsonl_line(obj):
+        return _encode(obj).encode('utf-8') + b"\n"
+
+    json_loads = json.loads
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -19,59 +42,87 @@ if not api_key:
 # Instantiate the OpenAI client with the API key
 client = OpenAI(api_key=api_key)
 
+# Fixed seconds between batch status checks (e.g. 2 for test runs); when unset,
+# the wait follows the tiered schedule in _get_poll_interval
+POLL_INTERVAL = float(os.getenv('OPENAI_BATCH_POLL_INTERVAL') or 0) or None
+
+MAX_CONCURRENT_UPLOADS = 8  # Uploads in flight while later batch files are still being built
+
 # Step 1: Read the CSV file and fetch word and definitions
 def read_csv_hardcoded(files, limit_definition_length=300):
     all_words_data = []
     for file_path in files:
         print(f"Reading file: {file_path}")
         with open(file_path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
+            reader = csv.reader(csvfile)
+            header = next(reader)
+            word_idx, definition_idx = header.index('word'), header.index('definitions_xml')
             for row in reader:
-                word = row['word']
-                definition = row['definitions_xml']
+                if not row:
+                    continue  # Skip blank lines, as DictReader did
+                word = row[word_idx]
+                definition = row[definition_idx]
 
-                # Limit the length of the definition
-                if len(definition) > limit_definition_length:
-                    definition = definition[:limit_definition_length] + "..."
+                # Limit the length of the definition (the slice is a no-op for short ones)
+                truncated = definition[:limit_definition_length]
+                if len(truncated) < len(definition):
+                    truncated += "..."
+                definition = truncated
 
                 all_words_data.append((word, definition))
     return all_words_data
 
-# Step 2: Create batch input file for OpenAI Batch API
+# Function to fetch the tokenizer for a model, resolved once per model per run
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    return tiktoken.encoding_for_model(model)
+
+# Step 2: Create batch input files for OpenAI Batch API, yielding (file name, bytes) as each one is written
 def create_batch_input_file_by_tokens(words_data, file_name_prefix, max_tokens=70000, model="gpt-4o"):
-    encoding = tiktoken.encoding_for_model(model)
+    encoding = get_encoding(model)
     batch_index = 1
     start_idx = 0
 
+    # The system prompt is identical for every request: build and tokenize it once
+    system_message = {
+        "role": "system",
+        "content": (
+            "You are helping me update a large graph database of Arabic words. "
+            "Be concise and do not exceed more than 1 or 2 words for each case unless it's a short phrase. "
+            "Return only the English translation, the Spanish translation, the Urdu translation and the Roman transliteration, "
+            "in the following JSON format (no extra text):\n\n"
+            "{\n"
+            "  \"english\": \"\",\n"
+            "  \"spanish\": \"\",\n"
+            "  \"urdu\": \"\",\n"
+            "  \"transliteration\": \"\"\n"
+            "}"
+        ),
+    }
+    system_tokens = len(encoding.encode(system_message["content"]))
+
+    # Build every user prompt up front and tokenize them in parallel in tiktoken's Rust thread pool
+    user_contents = [
+        f"Translate the following Arabic word or phrase: '{word}' and use this accompanying dictionary definition from Lane's Lexicon for context: {definition}"
+        for word, definition in words_data
+    ]
+    user_token_counts = [len(tokens) for tokens in encoding.encode_ordinary_batch(user_contents, num_threads=os.cpu_count() or 8)]
+
     while start_idx < len(words_data):
         batch_tokens = 0
         batch_data = []
 
-        for idx, (word, definition) in enumerate(words_data[start_idx:], start=start_idx):
+        for idx in range(start_idx, len(words_data)):
             messages = [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are helping me update a large graph database of Arabic words. "
-                        "Be concise and do not exceed more than 1 or 2 words for each case unless it's a short phrase. "
-                        "Return only the English translation, the Spanish translation, the Urdu translation and the Roman transliteration, "
-                        "in the following JSON format (no extra text):\n\n"
-                        "{\n"
-                        "  \"english\": \"\",\n"
-                        "  \"spanish\": \"\",\n"
-                        "  \"urdu\": \"\",\n"
-                        "  \"transliteration\": \"\"\n"
-                        "}"
-                    ),
-                },
+                system_message,
                 {
                     "role": "user",
-                    "content": f"Translate the following Arabic word or phrase: '{word}' and use this accompanying dictionary definition from Lane's Lexicon for context: {definition}",
+                    "content": user_contents[idx],
                 }
             ]
 
-            # Count tokens for this message
-            message_tokens = sum(len(encoding.encode(msg["content"])) for msg in messages)
+            # Count tokens for this message from the precomputed counts
+            message_tokens = system_tokens + user_token_counts[idx]
 
             # Stop adding if this request would exceed the token limit
             if batch_tokens + message_tokens > max_tokens:
@@ -88,21 +139,26 @@ def create_batch_input_file_by_tokens(words_data, file_name_prefix, max_tokens=7
                 }
             })
 
-        # Write the batch to a file
+        # Write the batch to a file, keeping the bytes so the upload need not read it back
         batch_file_name = f"{file_name_prefix}_batch_{batch_index}.jsonl"
-        with open(batch_file_name, 'w', encoding='utf-8') as f:
-            for request in batch_data:
-                f.write(json.dumps(request) + "\n")
+        data = b"".join(jsonl_line(request) for request in batch_data)
+        with open(batch_file_name, 'wb') as f:
+            f.write(data)
         print(f"Batch file '{batch_file_name}' created with {len(batch_data)} entries and {batch_tokens} tokens.")
+        yield batch_file_name, data
 
         # Update indices for next batch
         start_idx += len(batch_data)
         batch_index += 1
 
 # Step 3: Upload the batch file to OpenAI
-def upload_batch_file(file_name="batchinput.jsonl"):
-    with open(file_name, 'rb') as f:
-        batch_input_file = client.files.create(file=f, purpose="batch")
+def upload_batch_file(file_name="batchinput.jsonl", data=None):
+    if data is not None:
+        # Upload the serialized batch straight from memory instead of re-reading the file
+        batch_input_file = client.files.create(file=(os.path.basename(file_name), io.BytesIO(data)), purpose="batch")
+    else:
+        with open(file_name, 'rb') as f:
+            batch_input_file = client.files.create(file=f, purpose="batch")
     print(f"File '{file_name}' uploaded with ID {batch_input_file.id}")
     return batch_input_file.id
 
@@ -117,43 +173,103 @@ def create_batch(batch_input_file_id):
     print(f"Batch created with ID {batch.id}.")
     return batch.id
 
+# Function to pick the poll interval from how long the batch has been running:
+# short batches are noticed within seconds, long ones cost few retrieve calls
+def _get_poll_interval(elapsed):
+    if elapsed < 120:
+        return 5
+    if elapsed < 600:
+        return 15
+    if elapsed < 3600:
+        return 30
+    return 60
+
 # Step 5: Poll for batch completion status
-def poll_batch_status(batch_id):
-    status = None
-    while status != "completed":
-        batch = client.batches.retrieve(batch_id)
+def poll_batch_status(batch_id, max_retries=5, poll_interval=POLL_INTERVAL):
+    start = time.monotonic()
+    failures = 0  # Consecutive transient errors from retrieve
+    while True:
+        try:
+            batch = client.batches.retrieve(batch_id)
+        except (APIConnectionError, RateLimitError, InternalServerError) as e:
+            failures += 1
+            if failures > max_retries:
+                raise
+            backoff = min(2 ** failures, 60)
+            print(f"Checking batch {batch_id} failed ({e}); retrying in {backoff}s.")
+            time.sleep(backoff)
+            continue
+        failures = 0
         status = batch.status
         print(f"Batch {batch_id} is currently {status}.")
-        if status == "failed" or status == "cancelled":
-            raise Exception(f"Batch {batch_id} failed or was cancelled.")
-        time.sleep(300)  # Wait for 1 minute before checking again
+        if status == "completed":
+            break
+        if status in ("failed", "cancelled", "expired"):
+            raise Exception(f"Batch {batch_id} did not complete: {status}")
+        interval = poll_interval or _get_poll_interval(time.monotonic() - start)
+        time.sleep(interval + random.uniform(0, interval * 0.1))  # Jitter keeps concurrent pollers apart
     print(f"Batch {batch_id} completed.")
     return batch.output_file_id
 
 # Step 6: Retrieve the results of the batch
 def retrieve_batch_results(output_file_id, output_file_name="batched_output.jsonl"):
-    result = client.files.content(output_file_id)
-    with open(output_file_name, 'w', encoding='utf-8') as f:
-        f.write(result.text)
+    # Stream the download to disk in 1 MiB chunks instead of holding the whole output in memory;
+    # it lands under a .part name first, so an interrupted download never passes for a finished one
+    partial_name = output_file_name + ".part"
+    with client.files.with_streaming_response.content(output_file_id) as response, \
+            open(partial_name, 'wb') as f:
+        for chunk in response.iter_bytes(chunk_size=1 << 20):
+            f.write(chunk)
+    os.replace(partial_name, output_file_name)
     print(f"Batch results saved to '{output_file_name}'.")
 
 # Step 7: Optional - Update a database or process results (this step is simplified for now)
 # Step 7: Update to show the initial Arabic word with the summary
 def process_batch_results(output_file_name="batch_output.jsonl", words_data=None):
-    with open(output_file_name, 'r', encoding='utf-8') as f:
-        for line in f:
-            result = json.loads(line)
-            custom_id = result['custom_id']
-            summary = result['response']['body']['choices'][0]['message']['content'].strip()
-
-            # The custom_id is "request-{idx}", so we'll split by "-" and get the index
-            request_index = int(custom_id.split("-")[1])
-
-            # Retrieve the corresponding Arabic word and definition from words_data using the index
-            arabic_word, _ = words_data[request_index]
-
-            # Print the Arabic word alongside the summary
-            print(f"Arabic Word: {arabic_word} | Summary: {summary}")
+    custom_ids, summaries = [], []
+    # Memory-map the file and hand raw line bytes straight to the parser
+    # (mmap cannot map an empty file, so skip it)
+    if os.path.getsize(output_file_name):
+        with open(output_file_name, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                if not line.strip():
+                    continue
+                result = json_loads(line)
+                custom_ids.append(result['custom_id'])
+                summaries.append(result['response']['body']['choices'][0]['message']['content'].strip())
+
+    results = pd.DataFrame({'custom_id': custom_ids, 'summary': summaries}, dtype=str)  # str keeps .str usable when empty
+
+    # The custom_id is "request-{idx}", so strip the prefix from the whole column at once
+    results['idx'] = results['custom_id'].str.slice(len("request-")).astype('int64')
+
+    # Attach the corresponding Arabic word and definition from words_data by index
+    words_df = pd.DataFrame(words_data, columns=['arabic_word', 'definition'])
+    results = results.merge(words_df, left_on='idx', right_index=True)
+
+    # Print the Arabic word alongside the summary
+    for arabic_word, summary in zip(results['arabic_word'], results['summary']):
+        print(f"Arabic Word: {arabic_word} | Summary: {summary}")
+
+    # Return the mapped results for downstream use (e.g. database updates)
+    return results
+
+# Function to upload one batch file and submit it as a batch
+def submit_batch(batch_file, batch_data=None):
+    print(f"Uploading batch file: {batch_file}")
+    batch_input_file_id = upload_batch_file(file_name=batch_file, data=batch_data)
+    batch_id = create_batch(batch_input_file_id)
+    print(f"Batch ID {batch_id} created for file: {batch_file}")
+    return batch_id
+
+# Function to wait for one batch and download its results
+def wait_and_retrieve(batch_id, batch_file):
+    print(f"Polling for batch ID {batch_id}...")
+    output_file_id = poll_batch_status(batch_id)
+    output_file_name = f"batch_output_for_{batch_file}.jsonl"
+    retrieve_batch_results(output_file_id, output_file_name=output_file_name)
+    return output_file_name
 
 def process_existing_batch_results(words_data):
     process_batch_results(output_file_name="batch_output.jsonl", words_data=words_data)
@@ -161,7 +277,7 @@ def process_existing_batch_results(words_data):
 def main():
     print("Choose an option:")
     print("1. Process existing batch results")
-    print("2. Sequentially create, upload, poll, and process batches (send requests to OpenAI)")
+    print("2. Create, upload, poll, and process batches concurrently (send requests to OpenAI)")
 
     choice = input("Enter the number of the option you want to execute: ")
 
@@ -179,42 +295,41 @@ def main():
         words_data = read_csv_hardcoded(chunk_files, limit_definition_length=200)
         process_existing_batch_results(words_data)
     elif choice == "2":
-        # Step 1: Create all batch input files
+        # Step 1: Create the batch input files, uploading and submitting each one as soon
+        # as it is written so the network uploads overlap building the next batches
         max_tokens = 2000000  # Token limit for each batch
         batch_file_list = []  # To store created batch files
-
-        for chunk_file in chunk_files:
-            print(f"Processing chunk: {chunk_file}")
-            words_data = read_csv_hardcoded([chunk_file], limit_definition_length=250)
-
-            # Create batches for the current chunk
-            create_batch_input_file_by_tokens(
-                words_data,
-                file_name_prefix=f"chunk_{chunk_file.split('_')[-1].split('.')[0]}",
-                max_tokens=max_tokens,
-                model="gpt-4o-mini"
-            )
-
-            # Collect all batch files for uploading
-            chunk_batch_files = sorted(glob.glob(f"chunk_{chunk_file.split('_')[-1].split('.')[0]}_batch_*.jsonl"))
-            batch_file_list.extend(chunk_batch_files)
-
-        # Step 2: Sequentially upload, poll, and process batches
-        print(f"Sequentially processing {len(batch_file_list)} batch files...")
-        for batch_file in batch_file_list:
-            print(f"Uploading batch file: {batch_file}")
-            batch_input_file_id = upload_batch_file(file_name=batch_file)
-            batch_id = create_batch(batch_input_file_id)
-            print(f"Batch ID {batch_id} created for file: {batch_file}")
-
-            # Poll until the batch is completed
-            print(f"Polling for batch ID {batch_id}...")
-            output_file_id = poll_batch_status(batch_id)
-
-            # Retrieve and process the results
-            output_file_name = f"batch_output_for_{batch_file}.jsonl"
-            retrieve_batch_results(output_file_id, output_file_name=output_file_name)
-            process_batch_results(output_file_name=output_file_name, words_data=words_data)
+        batch_words = {}  # Batch file -> words_data of the chunk it was built from
+        submissions = []  # Futures of the batch IDs, in batch file order
+
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_UPLOADS) as upload_executor:
+            for chunk_file in chunk_files:
+                print(f"Processing chunk: {chunk_file}")
+                words_data = read_csv_hardcoded([chunk_file], limit_definition_length=250)
+
+                # Create batches for the current chunk
+                for batch_file, batch_data in create_batch_input_file_by_tokens(
+                    words_data,
+                    file_name_prefix=f"chunk_{chunk_file.split('_')[-1].split('.')[0]}",
+                    max_tokens=max_tokens,
+                    model="gpt-4o-mini"
+                ):
+                    batch_file_list.append(batch_file)
+                    batch_words[batch_file] = words_data
+                    submissions.append(upload_executor.submit(submit_batch, batch_file, batch_data))
+
+            batch_ids = [submission.result() for submission in submissions]
+
+        # Step 2: Wait on every submitted batch at once.
+        # The Batch API runs many batches in parallel, so total time is the slowest
+        # batch rather than the sum of all of them. The calls are I/O bound, so threads suffice.
+        print(f"Waiting on {len(batch_ids)} batches...")
+        with ThreadPoolExecutor(max_workers=max(1, len(batch_ids))) as executor:
+            output_file_names = list(executor.map(wait_and_retrieve, batch_ids, batch_file_list))
+
+        # Step 3: Process the results in order, each against its own chunk's rows
+        for batch_file, output_file_name in zip(batch_file_list, output_file_names):
+            process_batch_results(output_file_name=output_file_name, words_data=batch_words[batch_file])
 
         print("All batches created, uploaded, and processed successfully.")
     else:
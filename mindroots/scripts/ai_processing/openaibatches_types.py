@@ -1,10 +1,54 @@
 import os
 import csv
+import functools
+import io
 import json
+import mmap
+import random
 import time
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 
+try:
+    import orjson
+
+    # Function to serialize one request as a JSONL line (orjson returns UTF-8 bytes directly)
+    def jsonl_line(obj):
+        return orjson.dumps(obj) + b"\n"
+
+    # Serializer for a single JSON value, as bytes
+    json_dumps = orjson.dumps
+
+    # Parser for raw JSONL line bytes
+    json_loads = orjson.loads
+except ImportError:
+    # One encoder reused for every line; compact separators and raw UTF-8 match orjson's output
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def jsonl_line(obj):
+        return _encode(obj).encode('utf-8') + b"\n"
+
+    def json_dumps(obj):
+        return _encode(obj).encode('utf-8')
+
+    json_loads = json.loads
+
+try:
+    import simdjson
+
+    # One parser reused for every line, so its internal buffers are allocated once
+    _simdjson_parser = simdjson.Parser()
+
+    # Function to pull (custom_id, content) from one output line, materializing only those two fields
+    def extract_response(line):
+        doc = _simdjson_parser.parse(line)
+        return doc["custom_id"], doc.at_pointer("/response/body/choices/0/message/content")
+except ImportError:
+    def extract_response(line):
+        result = json_loads(line)
+        return result['custom_id'], result['response']['body']['choices'][0]['message']['content']
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -17,40 +61,70 @@ if not api_key:
 # Instantiate the OpenAI client with the API key
 client = OpenAI(api_key=api_key)
 
+# Fixed seconds between batch status checks (e.g. 2 for test runs); when unset,
+# the wait follows the tiered schedule in _get_poll_interval
+POLL_INTERVAL = float(os.getenv('OPENAI_BATCH_POLL_INTERVAL') or 0) or None
+
+# Batch input files uploaded at once; more parallel uploads only compete for bandwidth
+MAX_CONCURRENT_UPLOADS = 4
+
+# Print every parsed result as well as returning it
+VERBOSE = False
+
 # Step 1: Read the CSV file and fetch Arabic words
 def read_csv(file_path):
     words_data = []
     with open(file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            word = row['word']
-            words_data.append(word)
+        reader = csv.reader(csvfile)
+        word_idx = next(reader).index('word')  # Resolve the column once from the header
+        words_data.extend(row[word_idx] for row in reader if row)
     return words_data
 
+# System prompt shared by every request in the batch
+SYSTEM_PROMPT = "You are a helpful assistant trained to identify the grammatical nature of Arabic words. Your task is to classify the word or phrase into one of three categories.  Please limnit your response to only the a single word: noun, verb, phrase or letter.  If there is not enough information then respond with 'NA'."
+
+# Function to pre-serialize a batch request line. The envelope and system prompt are the same
+# for every word, so only the request index (%d) and the user message (%s) are left to splice in.
+# Cached, so each template is serialized once per run rather than once per batch file.
+@functools.lru_cache(maxsize=None)
+def request_line_template(model, system_content):
+    request = {
+        "custom_id": "__CUSTOM_ID__",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": "__USER_CONTENT__"}
+            ]
+        }
+    }
+    line = jsonl_line(request).replace(b"%", b"%%")
+    return line.replace(b'"__CUSTOM_ID__"', b'"request-%d"', 1).replace(b'"__USER_CONTENT__"', b"%s", 1)
+
 # Step 2: Create batch input file for OpenAI Batch API
 def create_batch_input_file(words_data, file_name="batchinput.jsonl", start_idx=0, batch_size=1000):
-    with open(file_name, 'w', encoding='utf-8') as f:
-        for idx, word in enumerate(words_data[start_idx:start_idx + batch_size]):
-            batch_request = {
-                "custom_id": f"request-{start_idx + idx}",
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": {
-                    "model": "gpt-4o-mini",
-                    "messages": [
-                        {"role": "system", "content": "You are a helpful assistant trained to identify the grammatical nature of Arabic words. Your task is to classify the word or phrase into one of three categories.  Please limnit your response to only the a single word: noun, verb, phrase or letter.  If there is not enough information then respond with 'NA'."},
-                        {"role": "user", "content": f"Please classify the following Arabic word or phrase: '{word}' as either 'noun', 'verb', or 'phrase'."}
-                    ]
-                }
-            }
-            f.write(json.dumps(batch_request) + "\n")
+    template = request_line_template("gpt-4o-mini", SYSTEM_PROMPT)
+
+    # Serialize the whole batch in memory; it is written to disk once and uploaded from RAM
+    buf = bytearray()
+    for idx, word in enumerate(words_data[start_idx:start_idx + batch_size], start=start_idx):
+        buf += template % (idx, json_dumps(f"Please classify the following Arabic word or phrase: '{word}' as either 'noun', 'verb', or 'phrase'."))
+    with open(file_name, 'wb') as f:
+        f.write(buf)
     print(f"Batch input file '{file_name}' created with {len(words_data[start_idx:start_idx + batch_size])} entries.")
+    return buf
 
 
 # Step 3: Upload the batch file to OpenAI
-def upload_batch_file(file_name="batchinput.jsonl"):
-    with open(file_name, 'rb') as f:
-        batch_input_file = client.files.create(file=f, purpose="batch")
+def upload_batch_file(file_name="batchinput.jsonl", data=None):
+    if data is not None:
+        # Upload the serialized batch straight from memory instead of re-reading the file
+        batch_input_file = client.files.create(file=(os.path.basename(file_name), io.BytesIO(data)), purpose="batch")
+    else:
+        with open(file_name, 'rb') as f:
+            batch_input_file = client.files.create(file=f, purpose="batch")
     print(f"File '{file_name}' uploaded with ID {batch_input_file.id}")
     return batch_input_file.id
 
@@ -65,24 +139,54 @@ def create_batch(batch_input_file_id):
     print(f"Batch created with ID {batch.id}.")
     return batch.id
 
+# Function to pick the poll interval from how long the batch has been running:
+# short batches are noticed within seconds, long ones cost few retrieve calls
+def _get_poll_interval(elapsed):
+    if elapsed < 120:
+        return 5
+    if elapsed < 600:
+        return 15
+    if elapsed < 3600:
+        return 30
+    return 60
+
 # Step 5: Poll for batch completion status
-def poll_batch_status(batch_id):
-    status = None
-    while status != "completed":
-        batch = client.batches.retrieve(batch_id)
+def poll_batch_status(batch_id, max_retries=5, poll_interval=POLL_INTERVAL):
+    start = time.monotonic()
+    failures = 0  # Consecutive transient errors from retrieve
+    while True:
+        try:
+            batch = client.batches.retrieve(batch_id)
+        except (APIConnectionError, RateLimitError, InternalServerError) as e:
+            failures += 1
+            if failures > max_retries:
+                raise
+            backoff = min(2 ** failures, 60)
+            print(f"Checking batch {batch_id} failed ({e}); retrying in {backoff}s.")
+            time.sleep(backoff)
+            continue
+        failures = 0
         status = batch.status
         print(f"Batch {batch_id} is currently {status}.")
-        if status == "failed" or status == "cancelled":
-            raise Exception(f"Batch {batch_id} failed or was cancelled.")
-        time.sleep(60)  # Wait for 1 minute before checking again
+        if status == "completed":
+            break
+        if status in ("failed", "cancelled", "expired"):
+            raise Exception(f"Batch {batch_id} did not complete: {status}")
+        interval = poll_interval or _get_poll_interval(time.monotonic() - start)
+        time.sleep(interval + random.uniform(0, interval * 0.1))  # Jitter keeps concurrent pollers apart
     print(f"Batch {batch_id} completed.")
     return batch.output_file_id
 
 # Step 6: Retrieve the results of the batch
 def retrieve_batch_results(output_file_id, output_file_name="batch_output.jsonl"):
-    result = client.files.content(output_file_id)
-    with open(output_file_name, 'w', encoding='utf-8') as f:
-        f.write(result.text)
+    # Stream the download to disk in 1 MiB chunks instead of holding the whole output in memory;
+    # it lands under a .part name first, so an interrupted download never passes for a finished one
+    partial_name = output_file_name + ".part"
+    with client.files.with_streaming_response.content(output_file_id) as response, \
+            open(partial_name, 'wb') as f:
+        for chunk in response.iter_bytes(chunk_size=1 << 20):
+            f.write(chunk)
+    os.replace(partial_name, output_file_name)
     print(f"Batch results saved to '{output_file_name}'.")
 
 # Step 7: Process the results and classify the words
@@ -93,26 +197,39 @@ def process_batch_results(output_file_name="batch_output.jsonl"):
       (entry_id, wazn, form)
     """
     results = []
-    with open(output_file_name, 'r', encoding='utf-8') as f:
-        for line in f:
-            record = json.loads(line)
+    # Memory-map the file and hand raw line bytes straight to the parser
+    # (mmap cannot map an empty file, so skip it)
+    if not os.path.getsize(output_file_name):
+        return results
+    with open(output_file_name, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b''):
+            if not line.strip():
+                continue
             try:
-                content_json = record["response"]["body"]["choices"][0]["message"]["content"].strip()
-                parsed = json.loads(content_json)
+                _, content_json = extract_response(line)
+                parsed = json_loads(content_json.strip())
                 entry_id = parsed["id"]
                 wazn     = parsed["wazn"]
                 form     = parsed["form"]
                 results.append((entry_id, wazn, form))
-                print(f"{entry_id:10} | {wazn:20} | {form}")
-            except (json.JSONDecodeError, KeyError) as e:
+                if VERBOSE:
+                    print(f"{entry_id:10} | {wazn:20} | {form}")
+            except (ValueError, KeyError, IndexError) as e:
                 print(f"Skipping malformed line: {e}")
+    print(f"Parsed {len(results)} results from '{output_file_name}'.")
     return results
 
 
 
 
 def process_existing_batch_results(words_data):
-    process_batch_results(output_file_name="batch_output.jsonl", words_data=words_data)
+    process_batch_results(output_file_name="batch_output.jsonl")
+
+# Function to upload one serialized batch and submit it, returning the batch ID
+def submit_batch(batch_file_name, batch_data):
+    batch_input_file_id = upload_batch_file(file_name=batch_file_name, data=batch_data)
+    return create_batch(batch_input_file_id)
 
 
 
@@ -135,15 +252,21 @@ def main():
         # Set the batch size for testing
         batch_size = 5000  # Change this value to the number of rows you want to process (e.g., 50 or 100)
         
-        # Test with only the first few batches
-        for start_idx in range(0, total_words, batch_size):
-            batch_file_name = f"batchinput_{start_idx//batch_size + 1}.jsonl"
+        # Build every batch input, then upload and submit them in parallel
+        start_indices = range(0, total_words, batch_size)
+        batch_file_names = [f"batchinput_{start_idx//batch_size + 1}.jsonl" for start_idx in start_indices]
+        batch_inputs = [
             create_batch_input_file(words_data, file_name=batch_file_name, start_idx=start_idx, batch_size=batch_size)
-            batch_input_file_id = upload_batch_file(file_name=batch_file_name)
-            batch_id = create_batch(batch_input_file_id)
+            for start_idx, batch_file_name in zip(start_indices, batch_file_names)
+        ]
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_UPLOADS) as executor:
+            batch_ids = list(executor.map(submit_batch, batch_file_names, batch_inputs))
+
+        # All batches now run on OpenAI's side at once; collect them in order
+        for start_idx, batch_id in zip(start_indices, batch_ids):
             output_file_id = poll_batch_status(batch_id)
             retrieve_batch_results(output_file_id, output_file_name=f"batch_output_{start_idx//batch_size + 1}.jsonl")
-            process_batch_results(output_file_name=f"batch_output_{start_idx//batch_size + 1}.jsonl", words_data=words_data)
+            process_batch_results(output_file_name=f"batch_output_{start_idx//batch_size + 1}.jsonl")
             
             
     else:
@@ -1,10 +1,40 @@
 import os
-import csv
+import functools
+import hashlib
 import json
+import mmap
+import pandas as pd
+import random
+import sqlite3
 import time
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import APIConnectionError, InternalServerError, OpenAI, RateLimitError
 from dotenv import load_dotenv
 
+try:
+    import orjson
+
+    # Function to serialize one request as a JSONL line (orjson returns UTF-8 bytes directly)
+    def jsonl_line(obj):
+        return orjson.dumps(obj) + b"\n"
+
+    # Serializer for a single JSON value, as bytes
+    json_dumps = orjson.dumps
+
+    # Parser for raw JSONL line bytes
+    json_loads = orjson.loads
+except ImportError:
+    # One encoder reused for every line; compact separators and raw UTF-8 match orjson's output
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def jsonl_line(obj):
+        return _encode(obj).encode('utf-8') + b"\n"
+
+    def json_dumps(obj):
+        return _encode(obj).encode('utf-8')
+
+    json_loads = json.loads
+
 # ─── Environment & Client Setup ────────────────────────────────────────────────
 # Load API credentials and initialize the OpenAI client. This keeps secrets
 # out of source control and centralizes configuration.
@@ -14,6 +44,13 @@ if not api_key:
     raise ValueError("OpenAI API key is missing. Set it in your .env file or environment variables.")
 client = OpenAI(api_key=api_key)
 
+# Fixed seconds between batch status checks (e.g. 2 for test runs); when unset,
+# the wait follows the tiered schedule in _get_poll_interval
+POLL_INTERVAL = float(os.getenv('OPENAI_BATCH_POLL_INTERVAL') or 0) or None
+
+# Batches kept in flight at once; the Batch API runs them in parallel
+MAX_CONCURRENT_BATCHES = 8
+
 def get_batch_indexes(directory=".", input_prefix="batchinput_", output_prefix="batch_output_", suffix=".jsonl"):
     input_batches = set()
     output_batches = set()
@@ -33,6 +70,26 @@ def get_batch_indexes(directory=".", input_prefix="batchinput_", output_prefix="
                 continue
     return input_batches, output_batches
 
+def retry_output_files(batch_index, directory="."):
+    """
+    Output files of the re-sends of one batch (batch_output_{i}_retry{n}.jsonl), in
+    the order they were made. Re-sends get their own files, so a finished
+    batch_output_{i}.jsonl is never overwritten by a handful of retried entries.
+    """
+    prefix, suffix = f"batch_output_{batch_index}_retry", ".jsonl"
+    retries = []
+    for filename in os.listdir(directory):
+        if filename.startswith(prefix) and filename.endswith(suffix):
+            try:
+                retries.append((int(filename[len(prefix):-len(suffix)]), filename))
+            except ValueError:
+                continue
+    return [filename for _, filename in sorted(retries)]
+
+def batch_output_files(batch_index):
+    """Every output file of one batch: the first run's, then its re-sends."""
+    return [f"batch_output_{batch_index}.jsonl"] + retry_output_files(batch_index)
+
 
 # ─── Step 1: Ingest Word Data ────────────────────────────────────────────────────
 def read_csv(file_path, limit_definition_length=500):
@@ -40,73 +97,137 @@ def read_csv(file_path, limit_definition_length=500):
     Read raw word entries from a CSV and truncate definitions.
     Returns a list of tuples: (entry_id, arabic_word, truncated_definition).
     """
-    words_data = []
-    with open(file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            entry_id  = row['entry_id_xml']       # carry your real node ID
-            word      = row['word']
-            definition = row['definitions_xml']
-            if len(definition) > limit_definition_length:
-                definition = definition[:limit_definition_length] + "..."
-            words_data.append((entry_id, word, definition))
-    return words_data
+    columns = ['entry_id_xml', 'word', 'definitions_xml']  # entry_id_xml carries your real node ID
+    df = pd.read_csv(file_path, usecols=columns, dtype=str, keep_default_na=False, encoding='utf-8')
+
+    # Truncate over-long definitions for the whole column at once
+    definitions = df['definitions_xml']
+    too_long = definitions.str.len() > limit_definition_length
+    df.loc[too_long, 'definitions_xml'] = definitions[too_long].str.slice(0, limit_definition_length) + "..."
+
+    # usecols keeps file order, so select the columns in tuple order explicitly
+    return list(df[columns].itertuples(index=False, name=None))
+
+# ─── Response Cache ──────────────────────────────────────────────────────────────
+CACHE_PATH = "weights_cache.sqlite3"
+MODEL = "gpt-4o-mini"
+MAX_ATTEMPTS = 3  # Malformed answers per entry before it is given up on instead of re-sent
+
+def user_message(entry_id, word):
+    """The user turn sent for one entry; part of both the request and its cache key."""
+    return f'ID: "{entry_id}"\nWord: "{word}"'
+
+def request_key(model, user_content):
+    """
+    Cache key for one request: SHA-256 over everything that decides the answer
+    (model, system prompt, user message). Editing the prompt therefore retires
+    old answers instead of silently reusing them.
+    """
+    return hashlib.sha256(f"{model}\0{SYSTEM_PROMPT}\0{user_content}".encode('utf-8')).hexdigest()
+
+def open_cache(path=CACHE_PATH):
+    """
+    Open (creating if needed) the on-disk cache of parsed answers, so re-runs
+    skip entries that were already answered instead of paying for them again.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers (e.g. a second terminal) never block the writer
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses "
+        "(key TEXT PRIMARY KEY, entry_id TEXT, wazn TEXT, form TEXT)"
+    )
+    # One row per output file in which a request's answer could not be parsed; keyed by
+    # file, so processing the same file again does not count as another attempt
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS failures "
+        "(key TEXT, output_file TEXT, entry_id TEXT, error TEXT, PRIMARY KEY (key, output_file))"
+    )
+    return conn
+
+def cached_keys(conn):
+    """Keys of every request already answered."""
+    return {key for (key,) in conn.execute("SELECT key FROM responses")}
+
+def settled_keys(conn, max_attempts=MAX_ATTEMPTS):
+    """
+    Keys that need no further request: the answered ones, plus those whose answer
+    came back malformed in max_attempts output files (given up, not re-billed).
+    """
+    given_up = conn.execute("SELECT key FROM failures GROUP BY key HAVING count(*) >= ?", (max_attempts,))
+    return cached_keys(conn) | {key for (key,) in given_up}
+
+def pending_entries(entries, done_keys):
+    """The (entry_id, word, definition) entries whose request has no cached answer yet."""
+    return [entry for entry in entries if request_key(MODEL, user_message(entry[0], entry[1])) not in done_keys]
 
 # ─── Step 2: Prepare LLM Batch Requests ─────────────────────────────────────────
-import json
+# System prompt shared by every request in the batch
+SYSTEM_PROMPT = (
+    "أنت خبير في الصرف العربي. أعطَ الكلمة المعطاة فقط الوزن الصرفي القياسي الكامل بالتشكيل، "
+    "مع تمثيله أيضًا في سطر واحد باستخدام الرموز:\n"
+    " - استخدم الرقم 3 لحرف ع\n"
+    " - استخدم 33 لتكرار ع مع الشدة\n\n"
+    "يجب أن تُرجع فقط كائن JSON بهذا الشكل:\n"
+    "{\n"
+    "  \"id\": \"<نفس المعرف>\",\n"
+    "  \"wazn\": \"<وزن كامل بالتشكيل>\",\n"
+    "  \"form\": \"<transliteration>\"\n"
+    "}\n\n"
+    "إذا لم يوجد وزن معروف، استخدم:\n"
+    "{\"id\": \"<نفس المعرف>\", \"wazn\": \"NA\", \"form\": \"NA\"}\n\n"
+    "**أمثلة واضحة:**\n"
+    "{\"id\":\"001\",\"wazn\":\"فَعَلَ\",\"form\":\"fa3ala\"} ← كَتَبَ\n"
+    "{\"id\":\"002\",\"wazn\":\"فَعَّلَ\",\"form\":\"fa33ala\"} ← عَلَّمَ\n"
+    "{\"id\":\"003\",\"wazn\":\"أَفْعَلَ\",\"form\":\"af3ala\"} ← أَكْرَمَ\n"
+    "{\"id\":\"004\",\"wazn\":\"فَاعَلَ\",\"form\":\"fā3ala\"} ← صَاحَبَ\n"
+    "{\"id\":\"005\",\"wazn\":\"مُفْعَلٌ\",\"form\":\"muf3alun\"} ← مُجْتَمَعٌ\n"
+    "{\"id\":\"006\",\"wazn\":\"فَعَّال\",\"form\":\"fa33āl\"} ← فَتَّاح\n"
+    "{\"id\":\"007\",\"wazn\":\"مِفْعَال\",\"form\":\"mif3āl\"} ← مِقْدَام\n"
+    "{\"id\":\"008\",\"wazn\":\"فَعُول\",\"form\":\"fa3ūl\"} ← شَكُور\n"
+    "{\"id\":\"009\",\"wazn\":\"فَعيل\",\"form\":\"fa3īl\"} ← عَلِيم\n"
+    "{\"id\":\"010\",\"wazn\":\"فَعِل\",\"form\":\"fa3il\"} ← حَذِر\n"
+    "{\"id\":\"011\",\"wazn\":\"فِعَالٌ\",\"form\":\"fi3āl\"} ← كِتَابٌ\n"
+    "{\"id\":\"012\",\"wazn\":\"فُعُلٌ\",\"form\":\"fu3ul\"} ← كُتُبٌ\n"
+    "{\"id\":\"013\",\"wazn\":\"فُعَّال\",\"form\":\"fu33āl\"} ← كُتَّاب\n"
+    "{\"id\":\"014\",\"wazn\":\"فَعيلٌ\",\"form\":\"fa3īlun\"} ← سَمِيعٌ\n"
+    "{\"id\":\"015\",\"wazn\":\"فَعُولٌ\",\"form\":\"fa3ūlun\"} ← رَسُولٌ\n"
+    "{\"id\":\"016\",\"wazn\":\"فَعْلَةٌ\",\"form\":\"fa3lah\"} ← جَلْسَةٌ\n"
+    "{\"id\":\"017\",\"wazn\":\"مَفْعُولٌ\",\"form\":\"maf3ūlun\"} ← مَقْبُولٌ\n"
+    "{\"id\":\"018\",\"wazn\":\"مِفْعَلٌ\",\"form\":\"mif3al\"} ← مِفْتَاحٌ\n"
+    "{\"id\":\"019\",\"wazn\":\"فَعَّالَةٌ\",\"form\":\"fa33ālah\"} ← طَبَّاخَةٌ\n\n"
+    "لا تُرجِع أي شرح. فقط كائن JSON."
+)
+
+@functools.lru_cache(maxsize=None)
+def request_line_template(model, system_content):
+    """
+    Pre-serialize a batch request line once per run. The envelope and the long
+    system prompt never change, so each request only splices in its JSON-encoded
+    custom_id and user message (the two %s slots).
+    """
+    request = {
+        "custom_id": "__CUSTOM_ID__",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": "__USER_CONTENT__"}
+            ]
+        }
+    }
+    line = jsonl_line(request).replace(b"%", b"%%")
+    return line.replace(b'"__CUSTOM_ID__"', b"%s", 1).replace(b'"__USER_CONTENT__"', b"%s", 1)
 
 def create_batch_input_file(words_data, file_name="batchinput.jsonl", start_idx=0, batch_size=1000):
-    system_prompt = (
-        "أنت خبير في الصرف العربي. أعطَ الكلمة المعطاة فقط الوزن الصرفي القياسي الكامل بالتشكيل، "
-        "مع تمثيله أيضًا في سطر واحد باستخدام الرموز:\n"
-        " - استخدم الرقم 3 لحرف ع\n"
-        " - استخدم 33 لتكرار ع مع الشدة\n\n"
-        "يجب أن تُرجع فقط كائن JSON بهذا الشكل:\n"
-        "{\n"
-        "  \"id\": \"<نفس المعرف>\",\n"
-        "  \"wazn\": \"<وزن كامل بالتشكيل>\",\n"
-        "  \"form\": \"<transliteration>\"\n"
-        "}\n\n"
-        "إذا لم يوجد وزن معروف، استخدم:\n"
-        "{\"id\": \"<نفس المعرف>\", \"wazn\": \"NA\", \"form\": \"NA\"}\n\n"
-        "**أمثلة واضحة:**\n"
-        "{\"id\":\"001\",\"wazn\":\"فَعَلَ\",\"form\":\"fa3ala\"} ← كَتَبَ\n"
-        "{\"id\":\"002\",\"wazn\":\"فَعَّلَ\",\"form\":\"fa33ala\"} ← عَلَّمَ\n"
-        "{\"id\":\"003\",\"wazn\":\"أَفْعَلَ\",\"form\":\"af3ala\"} ← أَكْرَمَ\n"
-        "{\"id\":\"004\",\"wazn\":\"فَاعَلَ\",\"form\":\"fā3ala\"} ← صَاحَبَ\n"
-        "{\"id\":\"005\",\"wazn\":\"مُفْعَلٌ\",\"form\":\"muf3alun\"} ← مُجْتَمَعٌ\n"
-        "{\"id\":\"006\",\"wazn\":\"فَعَّال\",\"form\":\"fa33āl\"} ← فَتَّاح\n"
-        "{\"id\":\"007\",\"wazn\":\"مِفْعَال\",\"form\":\"mif3āl\"} ← مِقْدَام\n"
-        "{\"id\":\"008\",\"wazn\":\"فَعُول\",\"form\":\"fa3ūl\"} ← شَكُور\n"
-        "{\"id\":\"009\",\"wazn\":\"فَعيل\",\"form\":\"fa3īl\"} ← عَلِيم\n"
-        "{\"id\":\"010\",\"wazn\":\"فَعِل\",\"form\":\"fa3il\"} ← حَذِر\n"
-        "{\"id\":\"011\",\"wazn\":\"فِعَالٌ\",\"form\":\"fi3āl\"} ← كِتَابٌ\n"
-        "{\"id\":\"012\",\"wazn\":\"فُعُلٌ\",\"form\":\"fu3ul\"} ← كُتُبٌ\n"
-        "{\"id\":\"013\",\"wazn\":\"فُعَّال\",\"form\":\"fu33āl\"} ← كُتَّاب\n"
-        "{\"id\":\"014\",\"wazn\":\"فَعيلٌ\",\"form\":\"fa3īlun\"} ← سَمِيعٌ\n"
-        "{\"id\":\"015\",\"wazn\":\"فَعُولٌ\",\"form\":\"fa3ūlun\"} ← رَسُولٌ\n"
-        "{\"id\":\"016\",\"wazn\":\"فَعْلَةٌ\",\"form\":\"fa3lah\"} ← جَلْسَةٌ\n"
-        "{\"id\":\"017\",\"wazn\":\"مَفْعُولٌ\",\"form\":\"maf3ūlun\"} ← مَقْبُولٌ\n"
-        "{\"id\":\"018\",\"wazn\":\"مِفْعَلٌ\",\"form\":\"mif3al\"} ← مِفْتَاحٌ\n"
-        "{\"id\":\"019\",\"wazn\":\"فَعَّالَةٌ\",\"form\":\"fa33ālah\"} ← طَبَّاخَةٌ\n\n"
-        "لا تُرجِع أي شرح. فقط كائن JSON."
-    )
+    template = request_line_template(MODEL, SYSTEM_PROMPT)
 
-    with open(file_name, 'w', encoding='utf-8') as f:
-        for entry_id, word, definition in words_data[start_idx:start_idx + batch_size]:
-            batch_request = {
-                "custom_id": entry_id,
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": {
-                    "model": "gpt-4o-mini",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f'ID: "{entry_id}"\nWord: "{word}"'}
-                    ]
-                }
-            }
-            f.write(json.dumps(batch_request, ensure_ascii=False) + "\n")
+    buf = bytearray()
+    for entry_id, word, definition in words_data[start_idx:start_idx + batch_size]:
+        buf += template % (json_dumps(entry_id), json_dumps(user_message(entry_id, word)))
+    with open(file_name, 'wb') as f:
+        f.write(buf)
 
     print(f"✅ Batch input file '{file_name}' created with {min(batch_size, len(words_data) - start_idx)} entries.")
 
@@ -139,19 +260,47 @@ def create_batch(batch_input_file_id):
 
 
 # ─── Step 5: Poll for Completion ─────────────────────────────────────────────────
-def poll_batch_status(batch_id):
+def _get_poll_interval(elapsed):
+    """
+    Seconds to wait before the next status check, by how long the batch has run.
+    Short batches are noticed within seconds; long ones cost few retrieve calls.
+    """
+    if elapsed < 120:
+        return 5
+    if elapsed < 600:
+        return 15
+    if elapsed < 3600:
+        return 30
+    return 60
+
+
+def poll_batch_status(batch_id, max_retries=5, poll_interval=POLL_INTERVAL):
     """
     Periodically check the status of the batch job until it finishes.
     Abstractly: wait for LLM work to complete → handle failures → return output handle.
     """
-    status = None
-    while status != "completed":
-        batch = client.batches.retrieve(batch_id)
+    start = time.monotonic()
+    failures = 0  # Consecutive transient errors from retrieve
+    while True:
+        try:
+            batch = client.batches.retrieve(batch_id)
+        except (APIConnectionError, RateLimitError, InternalServerError) as e:
+            failures += 1
+            if failures > max_retries:
+                raise
+            backoff = min(2 ** failures, 60)
+            print(f"Checking batch {batch_id} failed ({e}); retrying in {backoff}s.")
+            time.sleep(backoff)
+            continue
+        failures = 0
         status = batch.status
         print(f"Batch {batch_id} status: {status}")
-        if status in ("failed", "cancelled"):
+        if status == "completed":
+            break
+        if status in ("failed", "cancelled", "expired"):
             raise Exception(f"Batch {batch_id} did not complete: {status}")
-        time.sleep(60)  # back off between polls
+        interval = poll_interval or _get_poll_interval(time.monotonic() - start)
+        time.sleep(interval + random.uniform(0, interval * 0.1))  # Jitter keeps concurrent pollers apart
     print(f"Batch {batch_id} completed.")
     return batch.output_file_id
 
@@ -162,35 +311,82 @@ def retrieve_batch_results(output_file_id, output_file_name="batch_output.jsonl"
     Download the completed batch’s results as JSONL.
     Abstractly: pull LLM responses back to local storage for post-processing.
     """
-    result = client.files.content(output_file_id)
-    with open(output_file_name, 'w', encoding='utf-8') as f:
-        f.write(result.text)
+    # Stream the download to disk in 1 MiB chunks instead of holding the whole output in memory;
+    # it lands under a .part name first, so an interrupted download never passes for a finished one
+    partial_name = output_file_name + ".part"
+    with client.files.with_streaming_response.content(output_file_id) as response, \
+            open(partial_name, 'wb') as f:
+        for chunk in response.iter_bytes(chunk_size=1 << 20):
+            f.write(chunk)
+    os.replace(partial_name, output_file_name)
     print(f"Results saved to '{output_file_name}'.")
 
 
 # ─── Step 7: Post‐Process & Integrate ─────────────────────────────────────────────
-def process_batch_results(output_file_name="batch_output.jsonl"):
+def process_batch_results(output_file_name="batch_output.jsonl", words_data=None, cache=None):
     """
     Read each JSONL line from the batch output, parse the JSON string returned
     by the model, and return a list of tuples:
       (entry_id, wazn, form)
+    Given words_data and a cache connection, each answer is also stored in the
+    cache under the key of the request that produced it, and each malformed
+    answer is recorded as a failed attempt for that request.
     """
     results = []
-    with open(output_file_name, 'r', encoding='utf-8') as f:
-        for line in f:
-            record = json.loads(line)
+    cache_rows = []
+    failure_rows = []
+    words_by_id = {entry_id: word for entry_id, word, _ in words_data} if cache is not None and words_data else {}
+    # Memory-mapped lines go to the parser as raw bytes (mmap cannot map an empty file)
+    if not os.path.getsize(output_file_name):
+        return results
+    with open(output_file_name, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b''):
+            if not line.strip():
+                continue
+            record = None
             try:
+                record = json_loads(line)  # A line cut short by an interrupted download is skipped too
                 content_json = record["response"]["body"]["choices"][0]["message"]["content"].strip()
-                parsed = json.loads(content_json)
+                parsed = json_loads(content_json)
                 entry_id = parsed["id"]
                 wazn     = parsed["wazn"]
                 form     = parsed["form"]
                 results.append((entry_id, wazn, form))
                 print(f"{entry_id:10} | {wazn:20} | {form}")
-            except (json.JSONDecodeError, KeyError) as e:
+            except (ValueError, KeyError, TypeError) as e:  # Decode errors are ValueErrors; failed requests have no body
                 print(f"Skipping malformed line: {e}")
+                custom_id = record.get("custom_id") if isinstance(record, dict) else None
+                word = words_by_id.get(custom_id)
+                if word is not None:
+                    key = request_key(MODEL, user_message(custom_id, word))
+                    failure_rows.append((key, output_file_name, custom_id, repr(e)))
+                continue
+
+            # custom_id is the entry ID the request was built from, whatever the model echoed
+            word = words_by_id.get(record["custom_id"])
+            if word is not None:
+                key = request_key(MODEL, user_message(record["custom_id"], word))
+                cache_rows.append((key, entry_id, wazn, form))
+
+    if cache_rows or failure_rows:
+        with cache:  # Commits on success
+            cache.executemany("INSERT OR IGNORE INTO responses VALUES (?, ?, ?, ?)", cache_rows)
+            cache.executemany("INSERT OR IGNORE INTO failures VALUES (?, ?, ?, ?)", failure_rows)
     return results
 
+# ─── Step 8: Run One Batch End to End ────────────────────────────────────────────
+def run_batch(input_file, output_file):
+    """
+    Send one prepared input file through the Batch API and download its output.
+    Each call is independent, so several run side by side on worker threads.
+    """
+    file_id = upload_batch_file(file_name=input_file)
+    batch_id = create_batch(file_id)
+    out_id = poll_batch_status(batch_id)
+    retrieve_batch_results(out_id, output_file_name=output_file)
+    return output_file
+
 def main():
     print("Options:\n1. Process existing results\n2. Run full pipeline (resumable)")
     choice = input("Select 1 or 2: ").strip()
@@ -199,40 +395,69 @@ def main():
     batch_size = 1000
     total = len(words_data)
 
-    input_batches, output_batches = get_batch_indexes()
+    _, output_batches = get_batch_indexes()
+    cache = open_cache()
 
     if choice == "1":
-        # This can loop through all batch_output files if needed
+        # This can loop through all batch_output files (and their re-sends) if needed
         for batch_num in sorted(output_batches):
-            output_name = f"batch_output_{batch_num}.jsonl"
-            process_batch_results(output_file_name=output_name)
+            for output_name in batch_output_files(batch_num):
+                process_batch_results(output_file_name=output_name, words_data=words_data, cache=cache)
 
     elif choice == "2":
-        for start in range(0, total, batch_size):
-            batch_index = (start // batch_size) + 1
-            input_file = f"batchinput_{batch_index}.jsonl"
-            output_file = f"batch_output_{batch_index}.jsonl"
+        # Batches run concurrently on threads (the API calls are I/O bound);
+        # input files are still built here, in order, on the main thread
+        # Resume is per entry: the cache, not file existence, decides what still needs sending
+        done_keys = settled_keys(cache)
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+            futures = []
+            for start in range(0, total, batch_size):
+                batch_index = (start // batch_size) + 1
+                input_file = f"batchinput_{batch_index}.jsonl"
+                output_file = f"batch_output_{batch_index}.jsonl"
 
-            if batch_index in output_batches:
-                print(f"✔️ Skipping batch {batch_index} (already retrieved)")
-                continue
+                pending = pending_entries(words_data[start:start + batch_size], done_keys)
+                if pending and batch_index in output_batches:
+                    # An earlier run retrieved this batch but may have stopped before caching it
+                    for existing in batch_output_files(batch_index):
+                        print(f"↪️ Recovering answers from existing {existing}")
+                        process_batch_results(output_file_name=existing, words_data=words_data, cache=cache)
+                    done_keys = settled_keys(cache)
+                    pending = pending_entries(pending, done_keys)
+
+                if not pending:
+                    print(f"✔️ Skipping batch {batch_index} (all entries cached or given up)")
+                    continue
 
-            # If the input file doesn't exist, create it
-            if batch_index not in input_batches:
-                print(f"📝 Creating new batch input file {input_file}")
-                create_batch_input_file(words_data, file_name=input_file, start_idx=start, batch_size=batch_size)
-            else:
-                print(f"↪️ Reusing existing input file {input_file}")
+                if batch_index in output_batches:
+                    # The existing output still holds this batch's good answers, so a re-send
+                    # goes to the next free _retry{n} name instead of replacing it
+                    retry = len(retry_output_files(batch_index)) + 1
+                    while os.path.exists(f"batch_output_{batch_index}_retry{retry}.jsonl"):
+                        retry += 1
+                    input_file = f"batchinput_{batch_index}_retry{retry}.jsonl"
+                    output_file = f"batch_output_{batch_index}_retry{retry}.jsonl"
 
-            # Send + retrieve output
-            file_id = upload_batch_file(file_name=input_file)
-            batch_id = create_batch(file_id)
-            out_id = poll_batch_status(batch_id)
-            retrieve_batch_results(out_id, output_file_name=output_file)
-            process_batch_results(output_file_name=output_file)
+                # Only the entries still missing an answer are (re)sent
+                print(f"📝 Creating batch input file {input_file} ({len(pending)} pending entries)")
+                create_batch_input_file(pending, file_name=input_file, batch_size=len(pending))
+
+                # Send + retrieve output
+                futures.append((batch_index, executor.submit(run_batch, input_file, output_file)))
+
+            # Process results in batch order; a failed batch is left for the next (resumed) run
+            for batch_index, future in futures:
+                try:
+                    output_file = future.result()
+                except Exception as e:
+                    print(f"❌ Batch {batch_index} failed: {e}")
+                    continue
+                process_batch_results(output_file_name=output_file, words_data=words_data, cache=cache)
 
     else:
         print("Invalid choice. Exiting.")
+
+    cache.close()
         
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,40 +6,63 @@ This script demonstrates how the radical IDs in sem_root.csv correspond to
 positions in the Arabic alphabet defined in sem_lang.csv.
 """
 
-import csv
-from typing import Dict, List, Optional
-
-def load_arabic_alphabet() -> Dict[int, str]:
-    """Load the Arabic alphabet mapping from sem_lang.csv."""
-    with open('sem_lang.csv', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row['lang'] == 'Arabic':
-                arabic_chars = row['script'].split(',')
-                # Create mapping from index to character
-                return {i: char for i, char in enumerate(arabic_chars)}
-    raise ValueError("Arabic language not found in sem_lang.csv")
+from collections import defaultdict
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+WORD_CHUNK_SIZE = 50_000  # sem_word.csv rows parsed per chunk while collecting examples
+
+def load_arabic_alphabet() -> List[str]:
+    """Load the Arabic alphabet from sem_lang.csv, as a list indexed by radical ID."""
+    langs = pd.read_csv('sem_lang.csv', usecols=['lang', 'script'], dtype=str,
+                        keep_default_na=False, encoding='utf-8')
+    arabic = langs.loc[langs['lang'] == 'Arabic', 'script']
+    if arabic.empty:
+        raise ValueError("Arabic language not found in sem_lang.csv")
+    # Radical IDs are dense positions, so the list itself is the mapping
+    return arabic.iloc[0].split(',')
 
 def reconstruct_root(rad1: int, rad2: int, rad3: int, rad4: Optional[int], 
-                    alphabet: Dict[int, str]) -> str:
+                    alphabet: List[str]) -> str:
     """Reconstruct an Arabic root from radical IDs."""
     root_chars = []
     
     for rad_id in [rad1, rad2, rad3]:
-        if rad_id in alphabet:
+        if 0 <= rad_id < len(alphabet):
             root_chars.append(alphabet[rad_id])
         else:
             root_chars.append(f"?{rad_id}")
     
     # Add 4th radical if present
     if rad4 is not None and rad4 != '':
-        if int(rad4) in alphabet:
+        if 0 <= int(rad4) < len(alphabet):
             root_chars.append(alphabet[int(rad4)])
         else:
             root_chars.append(f"?{rad4}")
     
     return '-'.join(root_chars)
 
+def reconstruct_roots(rads: np.ndarray, has_rad4: np.ndarray,
+                      alphabet: List[str]) -> np.ndarray:
+    """
+    Vectorized reconstruct_root: rebuild every root at once from an (n, 4) array
+    of radical IDs. has_rad4 marks the rows whose 4th column is a real radical.
+    """
+    lookup = np.array(alphabet)
+    in_alphabet = (rads >= 0) & (rads < len(lookup))
+    chars = lookup[np.where(in_alphabet, rads, 0)].astype(object)
+
+    # IDs outside the alphabet are rare; mark them the same way reconstruct_root does
+    for row, col in zip(*np.nonzero(~in_alphabet)):
+        if col < 3 or has_rad4[row]:
+            chars[row, col] = f"?{rads[row, col]}"
+
+    chars = chars.astype(str)
+    roots = np.char.add(np.char.add(np.char.add(chars[:, 0], '-'), np.char.add(chars[:, 1], '-')), chars[:, 2])
+    return np.where(has_rad4, np.char.add(np.char.add(roots, '-'), chars[:, 3]), roots)
+
 def analyze_roots():
     """Analyze the sem_root.csv file and reconstruct Arabic roots."""
     print("Loading Arabic alphabet...")
@@ -53,90 +76,98 @@ def analyze_roots():
     
     print("Analyzing roots from sem_root.csv...")
     
-    with open('sem_root.csv', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        total_roots = 0
-        reconstructed_roots = []
-        
-        for row in reader:
-            total_roots += 1
-            root_id = row['id']
-            rad1 = int(row['rad1'])
-            rad2 = int(row['rad2'])
-            rad3 = int(row['rad3'])
-            rad4 = row['rad4'] if row['rad4'] else None
-            concept = row['concept']
-            
-            # Reconstruct the root
-            reconstructed_root = reconstruct_root(rad1, rad2, rad3, rad4, alphabet)
-            
-            reconstructed_roots.append({
-                'id': root_id,
-                'root': reconstructed_root,
-                'concept': concept,
-                'rad_ids': (rad1, rad2, rad3, rad4)
-            })
-            
-            # Print first 20 examples
-            if total_roots <= 20:
-                print(f"Root {root_id}: {reconstructed_root} (concept: {concept})")
-                print(f"  Radical IDs: {rad1}, {rad2}, {rad3}" + 
-                      (f", {rad4}" if rad4 else ""))
-        
-        print(f"\nTotal roots processed: {total_roots}")
-        
-        # Print some statistics
-        trilateral_count = sum(1 for r in reconstructed_roots if r['rad_ids'][3] is None)
-        quadrilateral_count = sum(1 for r in reconstructed_roots if r['rad_ids'][3] is not None)
-        
-        print(f"Trilateral roots: {trilateral_count}")
-        print(f"Quadrilateral roots: {quadrilateral_count}")
-        
-        return reconstructed_roots
+    # Text columns stay strings; an empty rad4 means a trilateral root
+    df = pd.read_csv('sem_root.csv', encoding='utf-8', keep_default_na=False,
+                     dtype={'id': str, 'rad4': str, 'concept': str})
+    total_roots = len(df)
+
+    has_rad4 = (df['rad4'] != '').to_numpy()
+    rads = np.column_stack([
+        df['rad1'].to_numpy(dtype='int64'),
+        df['rad2'].to_numpy(dtype='int64'),
+        df['rad3'].to_numpy(dtype='int64'),
+        pd.to_numeric(df['rad4'].where(has_rad4, '0')).to_numpy(dtype='int64'),
+    ])
+
+    # Reconstruct every root in one pass over the radical ID array
+    roots = reconstruct_roots(rads, has_rad4, alphabet)
+
+    reconstructed_roots = [
+        {
+            'id': root_id,
+            'root': reconstructed_root,
+            'concept': concept,
+            'rad_ids': (rad1, rad2, rad3, rad4 or None)
+        }
+        for root_id, reconstructed_root, concept, rad1, rad2, rad3, rad4 in zip(
+            df['id'], roots.tolist(), df['concept'],
+            rads[:, 0].tolist(), rads[:, 1].tolist(), rads[:, 2].tolist(), df['rad4'])
+    ]
+
+    # Print first 20 examples
+    for r in reconstructed_roots[:20]:
+        rad1, rad2, rad3, rad4 = r['rad_ids']
+        print(f"Root {r['id']}: {r['root']} (concept: {r['concept']})")
+        print(f"  Radical IDs: {rad1}, {rad2}, {rad3}" + 
+              (f", {rad4}" if rad4 else ""))
+
+    print(f"\nTotal roots processed: {total_roots}")
+
+    # Print some statistics
+    quadrilateral_count = int(has_rad4.sum())
+    trilateral_count = total_roots - quadrilateral_count
+
+    print(f"Trilateral roots: {trilateral_count}")
+    print(f"Quadrilateral roots: {quadrilateral_count}")
+
+    return reconstructed_roots
 
 def verify_with_words():
     """Cross-reference roots with actual words to verify reconstruction."""
     print("\nVerifying reconstruction with actual words...")
     
-    # Load some word examples
-    word_examples = {}
-    with open('sem_word.csv', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            root_id = int(row['root'])
-            if root_id not in word_examples:
-                word_examples[root_id] = []
-            if len(word_examples[root_id]) < 3:  # Keep first 3 examples per root
-                word_examples[root_id].append({
-                    'word': row['word'],
-                    'meaning': row['meaning'],
-                    'lang': row['lang']
+    # Only the first 10 roots are shown, so only their words are needed
+    sample = pd.read_csv('sem_root.csv', nrows=10, dtype=str, keep_default_na=False, encoding='utf-8')
+    target_root_ids = set(sample['id'].astype('int64'))
+
+    # Load some word examples: scan sem_word.csv in chunks, keep rows for the target
+    # roots only, and stop once every target root has its first 3 examples
+    word_examples = defaultdict(list)
+    complete = 0
+    for chunk in pd.read_csv('sem_word.csv', usecols=['root', 'word', 'meaning', 'lang'], dtype=str,
+                             keep_default_na=False, encoding='utf-8', chunksize=WORD_CHUNK_SIZE):
+        roots = chunk['root'].astype('int64')
+        matches = chunk[roots.isin(target_root_ids)]
+        for root_id, word, meaning, lang in zip(roots[matches.index].tolist(), matches['word'],
+                                                matches['meaning'], matches['lang']):
+            examples = word_examples[root_id]
+            if len(examples) < 3:  # Keep first 3 examples per root
+                examples.append({
+                    'word': word,
+                    'meaning': meaning,
+                    'lang': lang
                 })
+                complete += len(examples) == 3
+        if complete == len(target_root_ids):
+            break
     
     # Load reconstructed roots
     alphabet = load_arabic_alphabet()
     
     print("Examples of reconstructed roots with their words:")
-    with open('sem_root.csv', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        for i, row in enumerate(reader):
-            if i >= 10:  # Only show first 10
-                break
-                
-            root_id = int(row['id'])
-            rad1, rad2, rad3 = int(row['rad1']), int(row['rad2']), int(row['rad3'])
-            rad4 = row['rad4'] if row['rad4'] else None
-            
-            reconstructed_root = reconstruct_root(rad1, rad2, rad3, rad4, alphabet)
-            
-            print(f"\nRoot {root_id}: {reconstructed_root} (concept: {row['concept']})")
-            
-            if root_id in word_examples:
-                for word in word_examples[root_id]:
-                    lang_name = {1: 'Arabic', 2: 'Hebrew', 3: 'Sabaic'}.get(int(word['lang']), f"Lang {word['lang']}")
-                    print(f"  {word['word']} ({lang_name}): {word['meaning']}")
+    for row in sample.to_dict('records'):
+        root_id = int(row['id'])
+        rad1, rad2, rad3 = int(row['rad1']), int(row['rad2']), int(row['rad3'])
+        rad4 = row['rad4'] if row['rad4'] else None
+
+        reconstructed_root = reconstruct_root(rad1, rad2, rad3, rad4, alphabet)
+
+        print(f"\nRoot {root_id}: {reconstructed_root} (concept: {row['concept']})")
+
+        if root_id in word_examples:
+            for word in word_examples[root_id]:
+                lang_name = {1: 'Arabic', 2: 'Hebrew', 3: 'Sabaic'}.get(int(word['lang']), f"Lang {word['lang']}")
+                print(f"  {word['word']} ({lang_name}): {word['meaning']}")
 
 if __name__ == "__main__":
     print("Semitic Roots Analysis")
@@ -17,77 +17,100 @@ def explore_database():
     with driver.session() as session:
         print("=== COMPREHENSIVE DATABASE EXPLORATION ===\n")
         
+        # Everything below comes back in one round trip: each CALL subquery reduces
+        # to a single row, so the result is one record holding every section's data
+        data = session.run("""
+            CALL {
+                // All counts in one pass over corpus 2 (an item counts as linked once, however many words it has)
+                MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2
+                WITH ci,
+                     EXISTS { (ci)-[:HAS_WORD]->(:Word) } AS is_linked
+                RETURN count(ci) AS total,
+                       count(ci.n_root) AS with_n_root,
+                       count(ci.root) AS with_root,
+                       count(CASE WHEN ci.root = null THEN 1 END) AS root_null_literal,
+                       count(CASE WHEN ci.root = 'None' THEN 1 END) AS root_none_string,
+                       count(CASE WHEN ci.root = '' THEN 1 END) AS root_empty,
+                       count(CASE WHEN ci.root IS NULL THEN 1 END) AS root_is_null,
+                       count(CASE WHEN is_linked THEN 1 END) AS linked,
+                       count(CASE WHEN ci.root IS NOT NULL AND NOT is_linked THEN 1 END) AS root_unlinked,
+                       count(CASE WHEN ci.root IS NOT NULL AND ci.root <> 'None' AND NOT is_linked THEN 1 END) AS valid_root_unlinked
+            }
+            CALL {
+                MATCH (ci:CorpusItem) 
+                WHERE ci.corpus_id = 2
+                UNWIND keys(ci) AS prop
+                WITH prop, count(*) AS n
+                ORDER BY prop
+                RETURN collect({prop: prop, count: n}) AS props
+            }
+            CALL {
+                MATCH (ci:CorpusItem) 
+                WHERE ci.corpus_id = 2
+                WITH ci LIMIT 10
+                RETURN collect({item_id: ci.item_id, lemma: ci.lemma, root: ci.root, all_props: properties(ci)}) AS samples
+            }
+            CALL {
+                MATCH (ci:CorpusItem) 
+                WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL AND ci.root <> 'None' 
+                  AND NOT (ci)-[:HAS_WORD]->(:Word)
+                WITH ci LIMIT 5
+                RETURN collect({item_id: ci.item_id, lemma: ci.lemma, root: ci.root}) AS valid_samples
+            }
+            RETURN *
+        """).single()
+        
         # 1. Basic counts
         print("1. BASIC COUNTS:")
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 RETURN count(ci) as total")
-        total = result.single()['total']
+        total = data['total']
         print(f"   Total CorpusItem nodes with corpus_id=2: {total}")
         
         # 2. Property exploration - what properties actually exist?
         print("\n2. PROPERTY ANALYSIS:")
-        result = session.run("""
-            MATCH (ci:CorpusItem) 
-            WHERE ci.corpus_id = 2
-            WITH ci, keys(ci) as props
-            UNWIND props as prop
-            RETURN DISTINCT prop, count(*) as count
-            ORDER BY prop
-        """)
         print("   Properties found on CorpusItem nodes:")
-        for record in result:
+        for record in data['props']:
             print(f"     {record['prop']}: {record['count']} nodes")
         
         # 3. Check specific root properties
         print("\n3. ROOT PROPERTY CHECKS:")
         
         # n_root checks
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.n_root IS NOT NULL RETURN count(ci) as with_n_root")
-        with_n_root = result.single()['with_n_root']
+        with_n_root = data['with_n_root']
         print(f"   CorpusItems with n_root IS NOT NULL: {with_n_root}")
         
         # Since n_root doesn't exist, skip the n_root property check
         print(f"   CorpusItems with n_root property existing: 0 (property doesn't exist)")
         
         # root checks  
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL RETURN count(ci) as with_root")
-        with_root = result.single()['with_root']
+        with_root = data['with_root']
         print(f"   CorpusItems with root IS NOT NULL: {with_root}")
         
         # 4. Sample data with all properties
         print("\n4. SAMPLE DATA (first 10 items):")
-        result = session.run("""
-            MATCH (ci:CorpusItem) 
-            WHERE ci.corpus_id = 2
-            RETURN ci.item_id, ci.lemma, ci.root, properties(ci) as all_props
-            LIMIT 10
-        """)
-        for i, record in enumerate(result, 1):
+        for i, record in enumerate(data['samples'], 1):
             print(f"   Item {i}:")
-            print(f"     item_id: {record['ci.item_id']}")
-            print(f"     lemma: '{record['ci.lemma']}'")  
-            print(f"     root: '{record['ci.root']}'")
+            print(f"     item_id: {record['item_id']}")
+            print(f"     lemma: '{record['lemma']}'")  
+            print(f"     root: '{record['root']}'")
             print(f"     all_props: {json.dumps(dict(record['all_props']), ensure_ascii=False, indent=8)}")
             print()
         
         # 5. Check for null vs empty vs missing patterns
         print("5. NULL/EMPTY/MISSING PATTERNS:")
         
-        queries = [
-            ("root = null (literal)", "MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root = null RETURN count(ci) as cnt"),
-            ("root = 'None' (string)", "MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root = 'None' RETURN count(ci) as cnt"),
-            ("root = '' (empty)", "MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root = '' RETURN count(ci) as cnt"),
-            ("root IS NULL", "MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root IS NULL RETURN count(ci) as cnt")
+        patterns = [
+            ("root = null (literal)", 'root_null_literal'),
+            ("root = 'None' (string)", 'root_none_string'),
+            ("root = '' (empty)", 'root_empty'),
+            ("root IS NULL", 'root_is_null')
         ]
         
-        for desc, query in queries:
-            result = session.run(query)
-            count = result.single()['cnt']
-            print(f"   {desc}: {count}")
+        for desc, key in patterns:
+            print(f"   {desc}: {data[key]}")
         
         # 6. Check linking status
         print("\n6. LINKING STATUS:")
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND (ci)-[:HAS_WORD]->(:Word) RETURN count(ci) as linked")
-        linked = result.single()['linked']
+        linked = data['linked']
         print(f"   Already linked items: {linked}")
         print(f"   Unlinked items: {total - linked}")
         
@@ -95,28 +118,18 @@ def explore_database():
         print("\n7. POTENTIALLY PROCESSABLE ITEMS:")
         
         # Try different combinations to find what we can actually process
-        test_queries = [
-            ("Has root, not linked", "MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL AND NOT (ci)-[:HAS_WORD]->(:Word) RETURN count(ci) as cnt"),
-            ("Has root != 'None', not linked", "MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL AND ci.root <> 'None' AND NOT (ci)-[:HAS_WORD]->(:Word) RETURN count(ci) as cnt")
+        combinations = [
+            ("Has root, not linked", 'root_unlinked'),
+            ("Has root != 'None', not linked", 'valid_root_unlinked')
         ]
         
-        for desc, query in test_queries:
-            result = session.run(query)
-            count = result.single()['cnt']
-            print(f"   {desc}: {count}")
+        for desc, key in combinations:
+            print(f"   {desc}: {data[key]}")
         
         # 8. Sample of items with valid roots
         print("\n8. SAMPLE ITEMS WITH VALID ROOTS:")
-        result = session.run("""
-            MATCH (ci:CorpusItem) 
-            WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL AND ci.root <> 'None' 
-              AND NOT (ci)-[:HAS_WORD]->(:Word)
-            RETURN ci.item_id, ci.lemma, ci.root
-            LIMIT 5
-        """)
-        
-        for record in result:
-            print(f"   item_id: {record['ci.item_id']}, lemma: '{record['ci.lemma']}', root: '{record['ci.root']}'")
+        for record in data['valid_samples']:
+            print(f"   item_id: {record['item_id']}, lemma: '{record['lemma']}', root: '{record['root']}'")
 
 if __name__ == "__main__":
     explore_database()
@@ -16,36 +16,47 @@ def quick_check():
     with driver.session() as session:
         print("=== QUICK DIAGNOSIS ===\n")
         
+        # Backs the corpus_id filter below; without it every query is a CorpusItem label scan
+        session.run("CREATE INDEX corpus_item_corpus_id IF NOT EXISTS FOR (ci:CorpusItem) ON (ci.corpus_id)").consume()
+        
+        # All counts in one pass over corpus 2 (an item counts as linked once, however many words it has)
+        counts = session.run("""
+            MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2
+            WITH ci,
+                 EXISTS { (ci)-[:HAS_WORD]->(:Word) } AS is_linked,
+                 ci.root IS NOT NULL AND ci.root <> 'None' AS has_valid_root
+            RETURN count(ci) AS total,
+                   count(CASE WHEN is_linked THEN 1 END) AS linked,
+                   count(ci.root) AS with_root,
+                   count(CASE WHEN has_valid_root THEN 1 END) AS valid_root,
+                   count(ci.n_root) AS with_n_root,
+                   count(CASE WHEN has_valid_root AND NOT is_linked THEN 1 END) AS processable
+        """).single()
+        
         # 1. Key counts
         print("1. KEY COUNTS:")
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 RETURN count(ci) as total")
-        total = result.single()['total']
+        total = counts['total']
         print(f"   Total corpus items: {total}")
         
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND (ci)-[:HAS_WORD]->(:Word) RETURN count(ci) as linked")
-        linked = result.single()['linked']
+        linked = counts['linked']
         print(f"   Already linked: {linked}")
         print(f"   Unlinked: {total - linked}")
         
         # 2. Root property status
         print("\n2. ROOT PROPERTY STATUS:")
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL RETURN count(ci) as with_root")
-        with_root = result.single()['with_root']
+        with_root = counts['with_root']
         print(f"   Items with root property: {with_root}")
         
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL AND ci.root <> 'None' RETURN count(ci) as valid_root")
-        valid_root = result.single()['valid_root']
+        valid_root = counts['valid_root']
         print(f"   Items with valid (non-'None') root: {valid_root}")
         
         # 3. Check if n_root exists (should be 0 based on previous output)
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.n_root IS NOT NULL RETURN count(ci) as with_n_root")
-        with_n_root = result.single()['with_n_root']
+        with_n_root = counts['with_n_root']
         print(f"   Items with n_root property: {with_n_root}")
         
         # 4. Items ready to process
         print("\n3. PROCESSABLE ITEMS:")
-        result = session.run("MATCH (ci:CorpusItem) WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL AND ci.root <> 'None' AND NOT (ci)-[:HAS_WORD]->(:Word) RETURN count(ci) as processable")
-        processable = result.single()['processable']
+        processable = counts['processable']
         print(f"   Unlinked items with valid roots: {processable}")
         
         # 5. Sample processable items
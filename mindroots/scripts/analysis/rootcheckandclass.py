@@ -1,4 +1,4 @@
-from py2neo import Graph
+from neo4j import GraphDatabase
 from dotenv import load_dotenv
 import os
 
@@ -12,9 +12,17 @@ password = os.getenv('NEO4J_PASS')
 
 class RootUpdater:
 
+    # Constant query text, so Neo4j parses and plans it once for the whole run
+    UPDATE_ROOTS_QUERY = """
+        UNWIND $rows AS row
+        MATCH (r:Root {root_id: row.id})
+        SET r += row.props,
+            r.root_type = row.type
+        """
+
     def __init__(self, uri, user, password):
-        # Connect to the Neo4j database
-        self.graph = Graph(uri, auth=(user, password))
+        # Connect to the Neo4j database; one driver (and connection pool) for the whole run
+        self.driver = GraphDatabase.driver(uri, auth=(user, password), max_connection_pool_size=16)
         self.type_counters = {}
 
     def initialize_counters(self):
@@ -23,24 +31,28 @@ class RootUpdater:
             "Geminate", "Triliteral", "Quadriliteral",
             "Quintiliteral", "Hexaliteral", "Heptaliteral", "BeyondSeptiliteral"
         ]
-        for root_type in root_types:
-            # Query the database for the highest existing ID for each root type
-            result = self.graph.run(
-                f"""
-                MATCH (r:Root)
-                WHERE r.root_type = $root_type AND r.{root_type}_ID IS NOT NULL
-                RETURN MAX(r.{root_type}_ID) AS max_id
-                """,
-                root_type=root_type
-            ).evaluate()
-            self.type_counters[root_type] = result + 1 if result else 1
+        with self.driver.session() as session:
+            for root_type in root_types:
+                # Query the database for the highest existing ID for each root type
+                result = session.run(
+                    f"""
+                    MATCH (r:Root)
+                    WHERE r.root_type = $root_type AND r.{root_type}_ID IS NOT NULL
+                    RETURN MAX(r.{root_type}_ID) AS max_id
+                    """,
+                    root_type=root_type
+                ).single()['max_id']
+                self.type_counters[root_type] = result + 1 if result else 1
         print(f"Type counters initialized: {self.type_counters}\n")
 
-    def update_roots(self):
+    def update_roots(self, batch_size=1000):
         print("Fetching root nodes from the database...")
-        roots = self.graph.run("MATCH (r:Root) RETURN r.root_id AS id, r.arabic AS arabic").data()
+        with self.driver.session() as session:
+            roots = session.run("MATCH (r:Root) RETURN r.root_id AS id, r.arabic AS arabic").data()
         print(f"Found {len(roots)} root nodes to process.\n")
 
+        rows = []
+
         for record in roots:
             root_id = record['id']
             arabic = record['arabic']
@@ -59,29 +71,39 @@ class RootUpdater:
             type_id = self.type_counters[root_type]
             self.type_counters[root_type] += 1
 
-            # Update the root node in the database
-            self.graph.run(
-                f"""
-                MATCH (r:Root {{root_id: $root_id}})
-                SET r += $properties,
-                    r.root_type = $root_type,
-                    r.{type_id_field} = $type_id
-                """,
-                root_id=root_id,
-                properties=r_properties,
-                root_type=root_type,
-                type_id=type_id
-            )
-
-            # Log the updated properties
-            updated_properties = {
-                "root_id": root_id,
+            rows.append({
+                "id": root_id,
                 "arabic": arabic,
-                "r_values": r_properties,
-                "root_type": root_type,
-                type_id_field: type_id
-            }
-            print(f"Updated Root {root_id}: {updated_properties}")
+                "props": r_properties,
+                "type": root_type,
+                "type_id_field": type_id_field,
+                "type_id": type_id
+            })
+
+        # Update the root nodes in the database, one UNWIND write transaction per chunk of rows
+        with self.driver.session() as session:
+            for start in range(0, len(rows), batch_size):
+                chunk = rows[start:start + batch_size]
+                session.execute_write(lambda tx: tx.run(self.UPDATE_ROOTS_QUERY, rows=[
+                    {
+                        "id": row["id"],
+                        # The type ID property name rides in the map, so the query text never changes
+                        "props": {**row["props"], row["type_id_field"]: row["type_id"]},
+                        "type": row["type"]
+                    }
+                    for row in chunk
+                ]).consume())
+
+                # Log the updated properties
+                for row in chunk:
+                    updated_properties = {
+                        "root_id": row["id"],
+                        "arabic": row["arabic"],
+                        "r_values": row["props"],
+                        "root_type": row["type"],
+                        row["type_id_field"]: row["type_id"]
+                    }
+                    print(f"Updated Root {row['id']}: {updated_properties}")
 
         print("\nProcessing completed!")
 
@@ -106,6 +128,9 @@ class RootUpdater:
         else:  # Beyond Septiliteral
             return 'BeyondSeptiliteral', 'BeyondSeptiliteral_ID'
 
+    def close(self):
+        self.driver.close()
+
     def print_summary(self):
         print("\n--- Summary Report ---")
         print(f"Type counters after processing: {self.type_counters}")
@@ -121,4 +146,5 @@ if __name__ == "__main__":
     updater.initialize_counters()
     updater.update_roots()
     updater.print_summary()
+    updater.close()
     print("Root nodes have been successfully updated.")
\ No newline at end of file
@@ -1,72 +1,126 @@
 import csv
-import json
+import mmap
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+WRITE_BUFFER_SIZE = 1024  # Rows buffered before each writerows() call
+
+def parse_batch_output(batch_output_path):
+    # Parse one batch output JSONL file into (entry_id, translations) pairs, in line order.
+    # entry_id is None unless the LLM response echoes one; malformed responses keep
+    # translations as None so the caller can report them.
+    parsed = []
+    if os.path.getsize(batch_output_path) == 0:
+        return parsed  # mmap cannot map an empty file
+
+    # Memory-map the file and hand raw line bytes straight to the JSON parser
+    with open(batch_output_path, 'rb') as batchfile, \
+            mmap.mmap(batchfile.fileno(), 0, access=mmap.ACCESS_READ) as batch_mm:
+        for line in iter(batch_mm.readline, b''):
+            if not line.strip():
+                continue
+            result = _json.loads(line)
+
+            # Extract LLM response (should be a JSON string; surrounding whitespace is valid JSON)
+            content = result['response']['body']['choices'][0]['message']['content']
+            if content.startswith('```'):
+                # Unwrap a markdown code fence around the JSON object
+                content = content.strip().removeprefix('```json').removesuffix('```')
+            try:
+                gpt_output = _json.loads(content)
+            except _json.JSONDecodeError:
+                parsed.append((None, None))
+                continue
+
+            parsed.append((
+                gpt_output.get('entry_id_xml') or gpt_output.get('id'),
+                (
+                    gpt_output.get('english', ''),
+                    gpt_output.get('spanish', ''),
+                    gpt_output.get('urdu', ''),
+                    gpt_output.get('transliteration', '')
+                )
+            ))
+    return parsed
 
 def map_batch_output_to_csv(csv_file_path, output_dir, batch_files, output_csv):
     # Read the original CSV file
     with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        csv_rows = list(reader)  # Store all rows for index-based mapping
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        word_idx, entry_id_idx = header.index('word'), header.index('entry_id_xml')
+        # Store (word, entry_id_xml) for all rows for index-based mapping
+        csv_rows = [(row[word_idx], row[entry_id_idx]) for row in reader if row]
+
+    # Index rows by entry_id_xml for responses that carry their own ID
+    csv_index = {row[1]: row for row in csv_rows}
+
+    batch_output_paths = [os.path.join(output_dir, batch_file) for batch_file in batch_files]
 
     # Open the final output CSV file
-    with open(output_csv, 'w', newline='', encoding='utf-8') as mappedfile:
+    with open(output_csv, 'w', newline='', encoding='utf-8') as mappedfile, \
+            ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
         fieldnames = ['word', 'entry_id_xml', 'english', 'spanish', 'urdu', 'transliteration']
-        writer = csv.DictWriter(mappedfile, fieldnames=fieldnames)
-        writer.writeheader()
+        writer = csv.writer(mappedfile)
+        writer.writerow(fieldnames)
 
+        buffer = []  # Mapped rows waiting to be written
         current_index = 0  # Track where we are in `csv_rows`
 
-        for batch_file in batch_files:
-            batch_output_path = os.path.join(output_dir, batch_file)
+        # Batch files are parsed in parallel; executor.map yields them in submission order
+        for parsed in executor.map(parse_batch_output, batch_output_paths):
+            for entry_id, translations in parsed:
+                # Every batch line stands for one CSV row, malformed or not
+                position = current_index
+                current_index += 1
 
-            # Read the batch output JSONL file
-            with open(batch_output_path, 'r', encoding='utf-8') as batchfile:
-                batch_lines = batchfile.readlines()
+                if translations is None:
+                    print(f"Skipping malformed entry at index {position}")
+                    continue
 
-            for line in batch_lines:
-                # Ensure we don't exceed CSV row count
-                if current_index >= len(csv_rows):
-                    print(f"Warning: More batch output entries than CSV rows! Stopping at {current_index}.")
+                if entry_id is not None:
+                    # Match by ID when the response carries one
+                    csv_row = csv_index.get(str(entry_id))
+                    if csv_row is None:
+                        print(f"Warning: ID {entry_id} not found in CSV.")
+                        continue
+                elif position < len(csv_rows):
+                    # Otherwise fall back to positional mapping
+                    csv_row = csv_rows[position]
+                else:
+                    print(f"Warning: More batch output entries than CSV rows! Stopping at {position}.")
                     break
 
-                csv_row = csv_rows[current_index]
-                result = json.loads(line)
-                
-                # Extract LLM response (should be a JSON string)
-                try:
-                    gpt_output = json.loads(result['response']['body']['choices'][0]['message']['content'].strip())
-                except json.JSONDecodeError:
-                    print(f"Skipping malformed entry at index {current_index}")
-                    continue
+                # Create a mapped row (same order as `fieldnames`)
+                buffer.append(csv_row + translations)
 
-                # Create a mapped row
-                mapped_row = {
-                    'word': csv_row['word'],
-                    'entry_id_xml': csv_row['entry_id_xml'],
-                    'english': gpt_output.get('english', ''),
-                    'spanish': gpt_output.get('spanish', ''),
-                    'urdu': gpt_output.get('urdu', ''),
-                    'transliteration': gpt_output.get('transliteration', '')
-                }
+                # Write mapped rows to the output CSV file in chunks
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    writer.writerows(buffer)
+                    buffer.clear()
 
-                # Write the mapped row to the output CSV file
-                writer.writerow(mapped_row)
-
-                # Increment index
-                current_index += 1
+        # Flush remaining rows
+        if buffer:
+            writer.writerows(buffer)
 
     print(f"Final mapped output saved to '{output_csv}'.")
 
 # Example usage
-csv_file_path = "clean_defs.csv"  # Master CSV with 55,000 words
-output_dir = "./"  # Directory where batch_output files are located
-batch_files = [  # List of batch output files
-    "batch_chunk1_output.jsonl",
-    "batch_chunk2_output.jsonl",
-    "batch_chunk3_output.jsonl",
-    "batch_chunk4_output.jsonl",
-    "batch_chunk5_output.jsonl"
-]
-output_csv = "final_translations.csv"  # Final output CSV
-
-map_batch_output_to_csv(csv_file_path, output_dir, batch_files, output_csv)
\ No newline at end of file
+if __name__ == "__main__":
+    csv_file_path = "clean_defs.csv"  # Master CSV with 55,000 words
+    output_dir = "./"  # Directory where batch_output files are located
+    batch_files = [  # List of batch output files
+        "batch_chunk1_output.jsonl",
+        "batch_chunk2_output.jsonl",
+        "batch_chunk3_output.jsonl",
+        "batch_chunk4_output.jsonl",
+        "batch_chunk5_output.jsonl"
+    ]
+    output_csv = "final_translations.csv"  # Final output CSV
+
+    map_batch_output_to_csv(csv_file_path, output_dir, batch_files, output_csv)
@@ -1,25 +1,89 @@
 import csv
-import json
+import mmap
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+WRITE_BUFFER_SIZE = 1024  # Rows buffered before each writerows() call
+
+# Fast path for the expected {"id": "...", "wazn": "...", "form": "..."} response.
+# Escaped strings, reordered keys or non-string values fall back to a full JSON parse.
+WAZN_RE = re.compile(r'"id"\s*:\s*"([^"\\]*)".*?"wazn"\s*:\s*"([^"\\]*)".*?"form"\s*:\s*"([^"\\]*)"', re.S)
+
+def parse_batch_output(batch_path):
+    # Parse one batch output JSONL file into (entry_id, wazn, form) tuples
+    batch_filename = os.path.basename(batch_path)
+    parsed = []
+    if os.path.getsize(batch_path) == 0:
+        return parsed  # mmap cannot map an empty file
+
+    # Memory-map the file and hand raw line bytes straight to the JSON parser
+    with open(batch_path, 'rb') as batchfile, \
+            mmap.mmap(batchfile.fileno(), 0, access=mmap.ACCESS_READ) as batch_mm:
+        for line in iter(batch_mm.readline, b''):
+            if not line.strip():
+                continue
+            try:
+                response = _json.loads(line)
+                # Surrounding whitespace is valid JSON, so the content is not stripped
+                content = response["response"]["body"]["choices"][0]["message"]["content"]
+                if content.startswith('```'):
+                    # Unwrap a markdown code fence around the JSON object
+                    content = content.strip().removeprefix('```json').removesuffix('```')
+                match = WAZN_RE.search(content)
+                if match:
+                    parsed.append(match.groups())
+                    continue
+                result = _json.loads(content)
+                parsed.append((result["id"], result.get("wazn", ""), result.get("form", "")))
+            except (_json.JSONDecodeError, KeyError) as e:
+                print(f"Skipping malformed line in {batch_filename}: {e}")
+    return parsed
+
+def retry_output_paths(output_dir, batch_index):
+    # Re-sends of a batch land in batch_output_{i}_retry{n}.jsonl next to the first run's
+    # output (see openaibatches_weights.py); return them in the order they were made
+    prefix, suffix = f"batch_output_{batch_index}_retry", ".jsonl"
+    retries = []
+    for filename in os.listdir(output_dir):
+        if filename.startswith(prefix) and filename.endswith(suffix):
+            try:
+                retries.append((int(filename[len(prefix):-len(suffix)]), filename))
+            except ValueError:
+                continue
+    return [os.path.join(output_dir, filename) for _, filename in sorted(retries)]
 
 def map_batch_output_to_wazn(csv_file_path, output_dir, output_csv, batch_count=45):
     # Define which original fields to keep (exclude definitions or anything unnecessary)
     fields_to_keep = ['entry_id_xml', 'word', 'arabic', 'english']  # Add/remove as needed
 
-    # Load the original word list
+    # Load the original word list, indexed by entry_id_xml for fast lookup
+    # (only a tuple of the kept fields is stored, so definitions are never held in memory)
     with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        csv_rows = list(reader)
-
-    # Index rows by entry_id_xml for fast lookup
-    csv_index = {row['entry_id_xml']: row for row in csv_rows}
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        entry_id_idx = header.index('entry_id_xml')
+        # Kept fields missing from the header, or from a short row, are written as ''
+        # (as DictReader's row.get(field, '') did)
+        field_idx = [header.index(field) if field in header else None for field in fields_to_keep]
+        csv_index = {
+            row[entry_id_idx]: tuple('' if i is None or i >= len(row) else row[i] for i in field_idx)
+            for row in reader if row
+        }
 
     # Output fieldnames: keep only selected + wazn + form
     fieldnames = fields_to_keep + ['wazn', 'form']
     with open(output_csv, 'w', newline='', encoding='utf-8') as mappedfile:
-        writer = csv.DictWriter(mappedfile, fieldnames=fieldnames)
-        writer.writeheader()
+        writer = csv.writer(mappedfile)
+        writer.writerow(fieldnames)
+        buffer = []  # Mapped rows waiting to be written
 
+        batch_paths = []
         for i in range(1, batch_count + 1):
             batch_filename = f"batch_output_{i}.jsonl"
             batch_path = os.path.join(output_dir, batch_filename)
@@ -27,36 +91,42 @@ def map_batch_output_to_wazn(csv_file_path, output_dir, output_csv, batch_count=
             if not os.path.exists(batch_path):
                 print(f"⚠️ Missing batch file: {batch_filename}")
                 continue
+            batch_paths.append(batch_path)
+            batch_paths.extend(retry_output_paths(output_dir, i))
 
-            with open(batch_path, 'r', encoding='utf-8') as batchfile:
-                for line in batchfile:
-                    try:
-                        response = json.loads(line)
-                        content = response["response"]["body"]["choices"][0]["message"]["content"].strip()
-                        parsed = json.loads(content)
-                        entry_id = parsed["id"]
-                        wazn = parsed.get("wazn", "")
-                        form = parsed.get("form", "")
-                    except (json.JSONDecodeError, KeyError) as e:
-                        print(f"Skipping malformed line in {batch_filename}: {e}")
-                        continue
+        # An entry answered in both a first run and a re-send is written once, first answer wins
+        written = set()
 
+        # Batch files are parsed in parallel; executor.map yields them in submission order
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for parsed in executor.map(parse_batch_output, batch_paths):
+                for entry_id, wazn, form in parsed:
                     original_row = csv_index.get(entry_id)
                     if not original_row:
                         print(f"⚠️ ID {entry_id} not found in CSV.")
                         continue
+                    if entry_id in written:
+                        continue
+                    written.add(entry_id)
 
                     # Construct output row with only relevant fields
-                    mapped_row = {field: original_row.get(field, '') for field in fields_to_keep}
-                    mapped_row.update({"wazn": wazn, "form": form})
-                    writer.writerow(mapped_row)
+                    buffer.append(original_row + (wazn, form))
+
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        writer.writerows(buffer)
+                        buffer.clear()
+
+        # Flush remaining rows
+        if buffer:
+            writer.writerows(buffer)
 
     print(f"✅ Final output written to '{output_csv}' without definitions.")
 
 # Example usage
-map_batch_output_to_wazn(
-    csv_file_path="clean_defs.csv",
-    output_dir="./",
-    output_csv="compact_wazn_output.csv",
-    batch_count=45
-)
\ No newline at end of file
+if __name__ == "__main__":
+    map_batch_output_to_wazn(
+        csv_file_path="clean_defs.csv",
+        output_dir="./",
+        output_csv="compact_wazn_output.csv",
+        batch_count=45
+    )
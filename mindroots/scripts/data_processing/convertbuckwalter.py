@@ -1,6 +1,7 @@
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
 import os
+from functools import lru_cache
 import pyarabic.trans as trans
 from rich.console import Console
 import time
@@ -15,60 +16,84 @@ console = Console()
 SEGMENT_RANGE = range(1, 8)  # s1 to s7
 CORPUS_ID = 2
 BATCH_SIZE = 100  # Process nodes in batches
-THROTTLE_DELAY = 0.1  # 100ms delay between batches for Aura throttling
+TARGET_LATENCY = 0.5  # Seconds per batch before throttling kicks in (Aura)
 
+class AdaptiveThrottle:
+    """
+    Pace batches by measured latency instead of fixed sleeps (a pacing-only
+    version of the ingestion scripts' _neo4j.AdaptiveThrottle). Transient errors
+    are left to execute_write, which already retries them.
+    """
+
+    def __init__(self, target_latency=0.5, slowdown_factor=2.0, smoothing=0.2, max_delay=10.0):
+        self.target_latency = target_latency
+        self.slowdown_factor = slowdown_factor
+        self.smoothing = smoothing
+        self.max_delay = max_delay
+        self.ema_latency = 0.0
+
+    def call(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.ema_latency += self.smoothing * (time.perf_counter() - start - self.ema_latency)
+        return result
+
+    def pause(self):
+        delay = min(max(0.0, self.ema_latency - self.target_latency) * self.slowdown_factor, self.max_delay)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+@lru_cache(maxsize=4096)  # Roots repeat heavily across CorpusItems
 def buckwalter_to_arabic_spaced(bw):
     if bw:
         arabic = trans.convert(bw, 'tim', 'arabic')
-        # Split into individual letters and join with hyphens
-        letters = list(arabic)
-        return '-'.join(letters)
+        # Join the individual letters with hyphens
+        return '-'.join(arabic)
     return None
 
 def update_roots(tx):
-    count = 0
+    # Pick the first non-empty root (in s1 to s7 order) on the server; the CASE turns ''
+    # into null so coalesce skips empty segments as well as missing ones
+    segment_roots = ', '.join(f"CASE WHEN ci.s{i}_root <> '' THEN ci.s{i}_root END" for i in SEGMENT_RANGE)
     query = f"""
     MATCH (ci:CorpusItem)
     WHERE ci.corpus_id = $corpus_id AND ci.root IS NULL
-    AND ({' OR '.join([f'ci.s{i}_root IS NOT NULL' for i in SEGMENT_RANGE])})
-    RETURN elementId(ci) AS eid, {{ {', '.join([f's{i}_root: ci.s{i}_root' for i in SEGMENT_RANGE])} }} AS roots
-    ORDER BY elementId(ci)
+    WITH ci, coalesce({segment_roots}) AS first_root
+    WHERE first_root IS NOT NULL
+    RETURN elementId(ci) AS eid, first_root
     LIMIT $batch_size
     """
     results = tx.run(query, corpus_id=CORPUS_ID, batch_size=BATCH_SIZE)
 
-    for record in results:
-        element_id = record["eid"]
-        roots = record["roots"]
-
-        # Pick the first non-null root (in s1 to s7 order)
-        for sx_root in roots.values():
-            if sx_root:
-                arabic_root = buckwalter_to_arabic_spaced(sx_root)
-                break
-        else:
-            continue  # No root found, skip
+    updates = [
+        {"eid": record["eid"], "root": buckwalter_to_arabic_spaced(record["first_root"])}
+        for record in results
+    ]
 
-        tx.run("""
-        MATCH (ci) WHERE elementId(ci) = $eid
-        SET ci.root = $root
-        """, eid=element_id, root=arabic_root)
+    if not updates:
+        return 0
 
-        console.log(f"[green]✔ Set root on node {element_id}: {arabic_root}")
-        count += 1
+    # Set all roots of the batch in a single round-trip
+    tx.run("""
+    UNWIND $updates AS u
+    MATCH (ci) WHERE elementId(ci) = u.eid
+    SET ci.root = u.root
+    """, updates=updates)
 
-    return count
+    return len(updates)
 
 def main():
     console.log("[blue]Starting Buckwalter → Arabic root conversion (processing all nodes)...")
 
     total = 0
     batch_count = 0
+    throttle = AdaptiveThrottle(target_latency=TARGET_LATENCY)
     
     try:
         while True:
             with driver.session() as session:
-                updated = session.write_transaction(update_roots)
+                updated = throttle.call(session.execute_write, update_roots)
                 if updated == 0:
                     break
                 
@@ -77,9 +102,8 @@ def main():
                 
                 console.log(f"[cyan]Batch {batch_count}: Updated {updated} nodes (Total: {total})")
                 
-                # Throttle to be gentle on Neo4j Aura
-                if updated > 0:
-                    time.sleep(THROTTLE_DELAY)
+                # Throttle only when Neo4j Aura slows down
+                throttle.pause()
     
     except Exception as e:
         console.log(f"[red]❌ Error occurred: {e}")
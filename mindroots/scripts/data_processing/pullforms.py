@@ -1,6 +1,5 @@
 import os
 import csv
-import time
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
 from rich.console import Console
@@ -14,7 +13,6 @@ password = os.getenv("NEO4J_PASS")
 
 # === Config ===
 BATCH_SIZE = 5000
-THROTTLE_SECONDS = 0.3
 OUTPUT_FILE = "word_nodes_wazn_export2.csv"
 
 # === Neo4j driver ===
@@ -23,10 +21,59 @@ driver = GraphDatabase.driver(uri, auth=(user, password))
 # === Rich logging ===
 console = Console()
 
+# === Stream rows ===
+# Write query results straight from the driver's record stream to the CSV, without
+# building a list per page. Each query returns the CSV columns followed by elementId(w),
+# which is not written. Returns (rows written, highest (entry_id, elementId) key seen).
+def stream_rows(tx, csv_file, writer, start, query, last_key=None, **params):
+    # Rewind to where this page starts, so a driver retry of the transaction
+    # rewrites the page instead of appending it twice
+    csv_file.seek(start)
+    csv_file.truncate()
+
+    count = 0
+    for record in tx.run(query, **params):
+        values = record.values()
+        writer.writerow(values[:-1])
+        count += 1
+        # Rows of one page come back in word order only by convention, so take the max
+        key = (values[3], values[-1])
+        if key[0] is not None and (last_key is None or key > last_key):
+            last_key = key
+    return count, last_key
+
 # === Fetch batch ===
-def fetch_batch(session, skip, limit):
+# Keyset pagination: each page seeks past the last exported entry_id through the
+# word_entry_id index instead of SKIPping over every row already written. entry_id is
+# not unique, so elementId(w) breaks ties; words sharing an entry_id across a page
+# boundary are then not dropped
+FIRST_PAGE_FILTER = "w.entry_id IS NOT NULL"
+NEXT_PAGE_FILTER = "w.entry_id > $last_id OR (w.entry_id = $last_id AND elementId(w) > $last_eid)"
+
+def write_batch(tx, csv_file, writer, start, last_key, limit):
+    last_id, last_eid = last_key or (None, None)
+    query = f"""
+    MATCH (w:Word)
+    WHERE {FIRST_PAGE_FILTER if last_key is None else NEXT_PAGE_FILTER}
+    WITH w ORDER BY w.entry_id, elementId(w) LIMIT $limit
+    OPTIONAL MATCH (r:Root)-[:HAS_WORD]->(w)
+    RETURN 
+        w.wazn AS form,
+        w.arabic AS word_arabic,
+        w.english AS gloss,
+        w.entry_id AS id,
+        w.itype AS itype,
+        r.arabic AS root_arabic,
+        elementId(w) AS eid
+    """
+    return stream_rows(tx, csv_file, writer, start, query, last_key=last_key,
+                       last_id=last_id, last_eid=last_eid, limit=limit)
+
+# === Fetch words without an entry_id (not reachable by the keyset pages) ===
+def write_unkeyed(tx, csv_file, writer, start):
     query = """
     MATCH (w:Word)
+    WHERE w.entry_id IS NULL
     OPTIONAL MATCH (r:Root)-[:HAS_WORD]->(w)
     RETURN 
         w.wazn AS form,
@@ -34,33 +81,39 @@ def fetch_batch(session, skip, limit):
         w.english AS gloss,
         w.entry_id AS id,
         w.itype AS itype,
-        r.arabic AS root_arabic
-    SKIP $skip LIMIT $limit
+        r.arabic AS root_arabic,
+        elementId(w) AS eid
     """
-    result = session.run(query, skip=skip, limit=limit)
-    return [record.values() for record in result]
+    count, _ = stream_rows(tx, csv_file, writer, start, query)
+    return count
 
 # === CSV Export ===
 def export_all_words():
-    with driver.session() as session, open(OUTPUT_FILE, mode="w", newline='', encoding="utf-8") as csv_file:
+    # A 1 MiB write buffer keeps the per-row writes from turning into syscalls
+    with driver.session() as session, \
+            open(OUTPUT_FILE, mode="w", newline='', encoding="utf-8", buffering=1 << 20) as csv_file:
+        session.run("CREATE INDEX word_entry_id IF NOT EXISTS FOR (w:Word) ON (w.entry_id)").consume()
+
         writer = csv.writer(csv_file)
         writer.writerow(["form", "word_arabic", "gloss", "id", "itype", "root_arabic"])        
-        skip = 0
+        last_key = None  # (entry_id, elementId) of the last exported word
         total_rows = 0
 
         console.rule("[bold cyan]🔄 Starting Export")
         while True:
-            console.log(f"Fetching rows [yellow]{skip}[/yellow] to [yellow]{skip + BATCH_SIZE - 1}[/yellow]...")
-            rows = fetch_batch(session, skip, BATCH_SIZE)
+            console.log(f"Fetching up to [yellow]{BATCH_SIZE}[/yellow] words after id [yellow]{last_key and last_key[0]}[/yellow]...")
+            # Read transactions are retried by the driver on transient errors, so no fixed throttle is needed
+            rows, last_key = session.execute_read(write_batch, csv_file, writer, csv_file.tell(), last_key, BATCH_SIZE)
 
             if not rows:
                 break
 
-            writer.writerows(rows)
-            total_rows += len(rows)
-            skip += BATCH_SIZE
-            console.log(f"[green]✓ Wrote {len(rows)} rows.[/green]")
-            time.sleep(THROTTLE_SECONDS)
+            total_rows += rows
+            console.log(f"[green]✓ Wrote {rows} rows.[/green]")
+
+        rows = session.execute_read(write_unkeyed, csv_file, writer, csv_file.tell())
+        total_rows += rows
+        console.log(f"[green]✓ Wrote {rows} rows for words without an entry_id.[/green]")
 
         console.rule("[bold green]✅ Export Complete")
         console.log(f"[bold]Total rows exported:[/bold] {total_rows} → [blue]{OUTPUT_FILE}[/blue]")
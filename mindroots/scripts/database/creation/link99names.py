@@ -1,5 +1,4 @@
-from py2neo import Graph
-import re
+from neo4j import GraphDatabase
 import csv
 
 from dotenv import load_dotenv
@@ -18,53 +17,76 @@ if not all([uri, user, password]):
     raise ValueError("Missing Neo4j connection details. Ensure NEO4J_URI, NEO4J_USER, and NEO4J_PASS are set in your .env file.")
 
 # Connect to Neo4j
-graph = Graph(uri, auth=(user, password))
+driver = GraphDatabase.driver(uri, auth=(user, password))
 
+# Print every match as well as writing it to the CSV
+VERBOSE = False
 
-# Function to remove specific diacritics and the article "ال"
-def refine_strip_diacritics_and_article(arabic_text):
+
+# Cypher expression removing the article "ال" / "ٱل" and surrounding diacritics from `var`
+def refine_strip_diacritics_and_article_cypher(var):
+    expr = var
     # Remove the article "ال" or "ٱل"
-    arabic_text = re.sub(r'^(ٱ?ل)', '', arabic_text)
-    
+    expr = f"apoc.text.regreplace({expr}, '^(ٱ?ل)', '')"
     # Remove the first two diacritics after the article, if present
-    arabic_text = re.sub(r'^[ًٌٍَُِّْ]{0,2}', '', arabic_text)
-    
+    expr = f"apoc.text.regreplace({expr}, '^[ًٌٍَُِّْ]{{0,2}}', '')"
     # Remove Shadda (ّ) if present on the first letter after article removal
-    arabic_text = re.sub(r'^(ّ)', '', arabic_text)
-    
+    expr = f"apoc.text.regreplace({expr}, '^(ّ)', '')"
     # Remove the last diacritic from the string
-    arabic_text = re.sub(r'[ًٌٍَُِّْ]$', '', arabic_text)
-    
-    return arabic_text
+    expr = f"apoc.text.regreplace({expr}, '[ًٌٍَُِّْ]$', '')"
+    return expr
+
+# Function to match the corpus item against the indexed Word property, returning plain tuples
+def match_corpus_item(tx):
+    result = tx.run(f"""
+        MATCH (item:CorpusItem {{item_id: 22, corpus_id: 1}})
+        WITH item, {refine_strip_diacritics_and_article_cypher('item.arabic')} AS stripped
+        MATCH (word:Word {{arabic_no_article: stripped}})
+        RETURN item.item_id, stripped, item.arabic, word.word_id, word.arabic_no_article, word.arabic
+    """)
+    return result.values()
+
+with driver.session() as session:
+    # Index the stripped form so matching is an index lookup rather than a scan of every Word
+    session.run("CREATE INDEX word_arabic_no_article IF NOT EXISTS FOR (w:Word) ON (w.arabic_no_article)").consume()
+
+    # One-time backfill of the stripped form on Word nodes that do not have it yet
+    # (CALL ... IN TRANSACTIONS needs an auto-commit transaction, hence session.run)
+    session.run(f"""
+        MATCH (word:Word)
+        WHERE word.arabic IS NOT NULL AND word.arabic_no_article IS NULL
+        CALL {{
+            WITH word
+            SET word.arabic_no_article = {refine_strip_diacritics_and_article_cypher('word.arabic')}
+        }} IN TRANSACTIONS OF 10000 ROWS
+    """).consume()
 
-# Fetch the specific corpus item with item_id = 22
-corpus_item = graph.run("MATCH (item:CorpusItem {item_id: 22, corpus_id: 1}) RETURN item.item_id AS id, item.arabic AS arabic").data()
+    # Match the specific corpus item with item_id = 22 against the indexed Word property
+    matches = session.execute_read(match_corpus_item)
 
-# Fetch all word nodes
-word_nodes = graph.run("MATCH (word:Word) RETURN word.word_id AS id, word.arabic AS arabic").data()
+driver.close()
 
-# Log result to CSV
-with open('corpus_item_22_refined_output.csv', 'w', newline='', encoding='utf-8') as csvfile:
+# Log result to CSV in one buffered write
+with open('corpus_item_22_refined_output.csv', 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
     csvwriter = csv.writer(csvfile)
     csvwriter.writerow(['CorpusItemID', 'StrippedCorpusItemArabic', 'WordID', 'StrippedWordArabic', 'OriginalWordArabic', 'OriginalCorpusItemArabic'])
-    
-    for word_node in word_nodes:
-        if corpus_item:
-            original_corpus_arabic = corpus_item[0]['arabic']
-            stripped_corpus_arabic = refine_strip_diacritics_and_article(original_corpus_arabic)
-        
-            original_word_arabic = word_node['arabic']
-            stripped_word_arabic = refine_strip_diacritics_and_article(original_word_arabic)
-            
-            if stripped_corpus_arabic == stripped_word_arabic:
-                # If match, log to CSV
-                csvwriter.writerow([corpus_item[0]['id'], stripped_corpus_arabic, word_node['id'], stripped_word_arabic, original_word_arabic, original_corpus_arabic])
-                print(f"Match found! Corpus Item ID: {corpus_item[0]['id']} matches Word ID: {word_node['id']}")
-                print(f"Original Corpus Item Arabic: {original_corpus_arabic}")
-                print(f"Original Word Arabic: {original_word_arabic}")
-                print(f"Stripped Corpus Item Arabic: {stripped_corpus_arabic}")
-                print(f"Stripped Word Arabic: {stripped_word_arabic}")
-            else:
-                print(f"No match for: {original_word_arabic}")
-
-print("Processing complete. Results saved to corpus_item_22_refined_output.csv.")
\ No newline at end of file
+    csvwriter.writerows(
+        (item_id, stripped_item, word_id, stripped_word, word_arabic, item_arabic)
+        for item_id, stripped_item, item_arabic, word_id, stripped_word, word_arabic in matches
+    )
+
+# Per-match details are only printed when VERBOSE is set
+if VERBOSE:
+    for item_id, stripped_item, item_arabic, word_id, stripped_word, word_arabic in matches:
+        print(f"Match found! Corpus Item ID: {item_id} matches Word ID: {word_id}")
+        print(f"Original Corpus Item Arabic: {item_arabic}")
+        print(f"Original Word Arabic: {word_arabic}")
+        print(f"Stripped Corpus Item Arabic: {stripped_item}")
+        print(f"Stripped Word Arabic: {stripped_word}")
+
+if matches:
+    print(f"{len(matches)} matching Word nodes found for corpus item 22.")
+else:
+    print("No matching Word nodes found for corpus item 22.")
+
+print("Processing complete. Results saved to corpus_item_22_refined_output.csv.")
@@ -0,0 +1,87 @@
+"""
+Shared Neo4j driver for the ingestion scripts.
+
+Scripts in this directory import get_driver() instead of building their own
+GraphDatabase.driver, so a process (or a REPL session that imports several of
+them) keeps a single connection pool. The driver is closed at interpreter exit.
+AdaptiveThrottle is the shared pacing helper for scripts writing to Aura.
+
+Installing neo4j-rust-ext (pip install neo4j-rust-ext) alongside neo4j swaps in
+a Rust Bolt encoder/decoder with no code change; the driver detects it itself.
+"""
+
+import atexit
+import functools
+import os
+import time
+
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+load_dotenv()
+
+# Naming the database on each session skips the driver's home-database lookup
+DATABASE = os.getenv('NEO4J_DATABASE', 'neo4j')
+
+
+@functools.lru_cache(maxsize=1)
+def get_driver():
+    """Return the process-wide Neo4j driver, creating it on first use."""
+    uri = os.getenv('NEO4J_URI')
+    user = os.getenv('NEO4J_USER')
+    password = os.getenv('NEO4J_PASS')
+
+    if not all([uri, user, password]):
+        raise ValueError("Missing Neo4j environment variables")
+
+    driver = GraphDatabase.driver(
+        uri,
+        auth=(user, password),
+        max_connection_pool_size=50,
+        connection_acquisition_timeout=60,
+        max_connection_lifetime=3600
+    )
+    atexit.register(driver.close)
+    return driver
+
+
+class AdaptiveThrottle:
+    """
+    Pace Neo4j calls by measured latency instead of fixed sleeps.
+
+    Each call is timed and folded into an exponential moving average. pause()
+    only sleeps once that average rises above target_latency. With max_retries
+    set, transient driver errors are retried with exponential backoff; leave it
+    at 0 when wrapping session.execute_read/execute_write, which already retry.
+    """
+
+    def __init__(self, target_latency=0.5, slowdown_factor=2.0, smoothing=0.2, max_delay=10.0, max_retries=0):
+        self.target_latency = target_latency
+        self.slowdown_factor = slowdown_factor
+        self.smoothing = smoothing
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.ema_latency = 0.0
+
+    def call(self, fn, *args, **kwargs):
+        backoff = 1.0
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except (TransientError, ServiceUnavailable, SessionExpired):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_delay)
+                continue
+            latency = time.perf_counter() - start
+            self.ema_latency += self.smoothing * (latency - self.ema_latency)
+            return result
+
+    def pause(self):
+        delay = min(max(0.0, self.ema_latency - self.target_latency) * self.slowdown_factor, self.max_delay)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
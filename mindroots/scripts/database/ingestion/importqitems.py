@@ -1,5 +1,4 @@
 import time
-import re
 import unicodedata
 from neo4j import GraphDatabase
 import csv
@@ -22,11 +21,12 @@ if not all([uri, user, password]):
 # Connect to Neo4j
 driver = GraphDatabase.driver(uri, auth=(user, password))
 
+# Full Arabic diacritics range including Shadda (U+064B–U+0655), deleted with str.translate
+ARABIC_DIACRITICS_TABLE = dict.fromkeys(range(0x064B, 0x0656))
+
 # Function to strip diacritics including shadda and other common Arabic marks
 def strip_diacritics(text):
-    arabic_diacritics = re.compile(r'[\u064B-\u0652\u0653-\u0655]')  # Full range including Shadda
-    text = unicodedata.normalize('NFKD', text)
-    return arabic_diacritics.sub('', text)
+    return unicodedata.normalize('NFKD', text).translate(ARABIC_DIACRITICS_TABLE)
 
 # Function to add corpus item and link to the word in the graph
 def add_corpus_item_and_link_to_word(tx, word_data, item_id, unmatched_log):
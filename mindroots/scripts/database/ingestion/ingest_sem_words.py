@@ -9,7 +9,7 @@ INTEGRATION LOGIC:
 1. Load word data from sem_word.csv
 2. Resolve sem_id (root references) using parent-child relationships
 3. Check for existing words to prevent duplicates
-4. Create Word nodes and link to Root nodes via sem_id
+4. Create Word nodes and link to Root nodes via sem_id (batched with UNWIND)
 5. Track detailed statistics and provide rich visual feedback
 
 WORD NODE PROPERTIES:
@@ -26,12 +26,12 @@ Date: 2025-08-14
 
 import csv
 import os
-import time
 import logging
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from neo4j import GraphDatabase
+from _neo4j import AdaptiveThrottle
 
 # Rich imports with fallback
 try:
@@ -48,6 +48,17 @@ except ImportError:
 # Load environment variables
 load_dotenv()
 
+# Language ID to name mapping (sem_word.csv `lang` column)
+SEM_LANG_NAMES = {
+    1: 'Arabic', 2: 'Hebrew', 3: 'Sabaic', 4: 'Ugaritic', 5: 'Aramaic',
+    6: 'Amharic', 7: 'Phoenician', 8: 'Syriac', 9: 'Geez', 10: 'Akkadian',
+    11: 'Qatabanic', 12: 'Eblaite', 13: 'Mehri', 14: 'Safaitic', 15: 'Moabite',
+    16: 'Palmyrene', 17: 'Mandaic', 18: 'Hismaic', 19: 'Nabataean', 20: 'Taymanitic',
+    21: 'Dadanitic', 22: 'Hasaitic', 23: 'Hadramitic', 24: 'Minaic', 25: 'Amorite',
+    26: 'Thamudic_B', 27: 'Harsusi', 29: 'Maltese', 30: 'Ammonite', 31: 'Hatran'
+}
+
+
 class SemiticWordsIntegrator:
     def __init__(self):
         # Rich console setup first (needed for logging)
@@ -72,9 +83,8 @@ class SemiticWordsIntegrator:
         }
         
         # Processing settings
-        self.batch_size = 150  # Conservative for Aura
-        self.delay_between_batches = 1.5  # 1.5 second delay
-        self.delay_between_operations = 0.05  # 50ms delay
+        self.batch_size = 500  # Words per UNWIND write
+        self.throttle = AdaptiveThrottle(target_latency=0.5)  # Sleeps only when Aura slows down
             
     def setup_logging(self):
         """Configure comprehensive dual logging with Rich support."""
@@ -310,7 +320,7 @@ class SemiticWordsIntegrator:
                     
                     self.stats['duplicates_updated'] = self.stats.get('duplicates_updated', 0) + 1
                     # Throttling
-                    time.sleep(self.delay_between_operations)
+                    self.throttle.pause()
                     return True
                 else:
                     self.logger.warning(f"⚠️ Failed to update word: {word}")
@@ -320,87 +330,75 @@ class SemiticWordsIntegrator:
             self.logger.error(f"❌ Failed to update word {word} with sem_lang: {e}")
             return False
             
-    def create_word_and_link(self, word_data: Dict, sem_id: int, sem_word_id: int, create_missing_roots: bool = True) -> bool:
+    def create_words_batch(self, batch: List[Dict], create_missing_roots: bool = True) -> int:
         """
-        Create Word node and link to Root via sem_id.
+        Create a batch of Word nodes and link each to its Root via sem_id.
         
-        Returns True if successful, False if failed.
+        All words are written with a single UNWIND query in one transaction.
+        Returns the number of words created.
         """
+        if not batch:
+            return 0
+            
         try:
             root_clause = "MERGE" if create_missing_roots else "MATCH"
             
-            # Language ID to name mapping
-            lang_id = int(word_data.get("lang", 0))
-            lang_names = {
-                1: 'Arabic', 2: 'Hebrew', 3: 'Sabaic', 4: 'Ugaritic', 5: 'Aramaic',
-                6: 'Amharic', 7: 'Phoenician', 8: 'Syriac', 9: 'Geez', 10: 'Akkadian',
-                11: 'Qatabanic', 12: 'Eblaite', 13: 'Mehri', 14: 'Safaitic', 15: 'Moabite',
-                16: 'Palmyrene', 17: 'Mandaic', 18: 'Hismaic', 19: 'Nabataean', 20: 'Taymanitic',
-                21: 'Dadanitic', 22: 'Hasaitic', 23: 'Hadramitic', 24: 'Minaic', 25: 'Amorite',
-                26: 'Thamudic_B', 27: 'Harsusi', 29: 'Maltese', 30: 'Ammonite', 31: 'Hatran'
-            }
-            sem_lang = lang_names.get(lang_id, f"Language_{lang_id}")
-            
-            # Create word with link to root
+            # Create words with links to roots
             query = f"""
-            {root_clause} (r:Root {{sem_id: $sem_id}})
+            UNWIND $batch AS row
+            {root_clause} (r:Root {{sem_id: row.sem_id}})
             CREATE (w:Word {{
-                word: $word,
-                lang: toInteger($lang),
-                sem_lang: $sem_lang,
-                category: toInteger($category),
-                concept: $concept,
-                meaning: $meaning,
-                sem_word_id: $sem_word_id
+                word: row.word,
+                lang: toInteger(row.lang),
+                sem_lang: row.sem_lang,
+                category: toInteger(row.category),
+                concept: row.concept,
+                meaning: row.meaning,
+                sem_word_id: row.sem_word_id
             }})
             CREATE (w)-[:BELONGS_TO_SEMITIC_ROOT]->(r)
-            RETURN w.word as created_word, r.arabic as root_arabic
+            RETURN row.sem_word_id as sem_word_id, w.word as created_word, row.sem_lang as sem_lang,
+                   r.arabic as root_arabic, row.sem_id as sem_id
             """
             
             with self.driver.session() as session:
-                result = session.run(query, {
-                    "sem_id": sem_id,
-                    "word": word_data.get("word"),
-                    "lang": word_data.get("lang"),
-                    "sem_lang": sem_lang,
-                    "category": word_data.get("category"),
-                    "concept": word_data.get("concept"),
-                    "meaning": word_data.get("meaning"),
-                    "sem_word_id": sem_word_id
-                })
+                records = self.throttle.call(session.execute_write, lambda tx: tx.run(query, batch=batch).data())
                 
-                record = result.single()
+            for record in records:
+                created_word = record['created_word']
+                root_arabic = record.get('root_arabic') or 'unknown'
                 
-                if record:
-                    created_word = record['created_word']
-                    root_arabic = record.get('root_arabic', 'unknown')
-                    
-                    self.logger.info(f"✨ Created word: '{created_word}' ({sem_lang}) → root {root_arabic} | sem_id: {sem_id}")
-                    
-                    if RICH_AVAILABLE and self.console:
-                        self.console.print(f"[green]✨[/green] [cyan]{created_word}[/cyan] ([dim]{sem_lang}[/dim]) → [yellow]{root_arabic}[/yellow]")
-                    
-                    self.stats['words_created'] += 1
-                    self.stats['root_links_created'] += 1
+                self.logger.info(f"✨ Created word: '{created_word}' ({record['sem_lang']}) → root {root_arabic} | sem_id: {record['sem_id']}")
+                
+                if RICH_AVAILABLE and self.console:
+                    self.console.print(f"[green]✨[/green] [cyan]{created_word}[/cyan] ([dim]{record['sem_lang']}[/dim]) → [yellow]{root_arabic}[/yellow]")
                     
-                    # Throttling
-                    time.sleep(self.delay_between_operations)
-                    return True
-                else:
-                    self.logger.warning(f"⚠️ Failed to create word for sem_word_id {sem_word_id}")
-                    return False
+            created = len(records)
+            self.stats['words_created'] += created
+            self.stats['root_links_created'] += created
+            
+            # Words without a matching root (MATCH mode) produce no record
+            if created < len(batch):
+                created_ids = {record['sem_word_id'] for record in records}
+                for row in batch:
+                    if row['sem_word_id'] not in created_ids:
+                        self.logger.warning(f"⚠️ Failed to create word for sem_word_id {row['sem_word_id']}")
+                self.stats['errors'] += len(batch) - created
+                
+            return created
                     
         except Exception as e:
-            self.logger.error(f"❌ Failed to create word for sem_word_id {sem_word_id}: {e}")
-            return False
+            self.logger.error(f"❌ Failed to create batch of {len(batch)} words: {e}")
+            self.stats['errors'] += len(batch)
+            return 0
             
-    def process_words(self, csv_path: str, batch_size: int = 150, create_missing_roots: bool = True, limit: Optional[int] = None):
+    def process_words(self, csv_path: str, batch_size: int = 500, create_missing_roots: bool = True, limit: Optional[int] = None):
         """
         Main processing function to integrate words from sem_word.csv.
         
         Args:
             csv_path: Path to sem_word.csv
-            batch_size: Number of words to process per batch
+            batch_size: Number of new words written per UNWIND batch
             create_missing_roots: Create root nodes if they don't exist
             limit: Optional limit for testing
         """
@@ -430,6 +428,8 @@ class SemiticWordsIntegrator:
                 
             # Process words
             batch_count = 0
+            pending_words = []  # New words waiting for the next batch write
+            pending_keys = set()  # (word, lang, sem_id) already queued
             
             for idx, (row_id, row) in enumerate(rows_by_id.items(), start=1):
                 if limit and idx > limit:
@@ -462,16 +462,7 @@ class SemiticWordsIntegrator:
                     if duplicate_status['is_duplicate']:
                         if duplicate_status['needs_update']:
                             # Update existing word with sem_lang
-                            lang_id = int(row.get("lang", 0))
-                            lang_names = {
-                                1: 'Arabic', 2: 'Hebrew', 3: 'Sabaic', 4: 'Ugaritic', 5: 'Aramaic',
-                                6: 'Amharic', 7: 'Phoenician', 8: 'Syriac', 9: 'Geez', 10: 'Akkadian',
-                                11: 'Qatabanic', 12: 'Eblaite', 13: 'Mehri', 14: 'Safaitic', 15: 'Moabite',
-                                16: 'Palmyrene', 17: 'Mandaic', 18: 'Hismaic', 19: 'Nabataean', 20: 'Taymanitic',
-                                21: 'Dadanitic', 22: 'Hasaitic', 23: 'Hadramitic', 24: 'Minaic', 25: 'Amorite',
-                                26: 'Thamudic_B', 27: 'Harsusi', 29: 'Maltese', 30: 'Ammonite', 31: 'Hatran'
-                            }
-                            sem_lang = lang_names.get(lang_id, f"Language_{lang_id}")
+                            sem_lang = SEM_LANG_NAMES.get(lang, f"Language_{lang}")
                             
                             success = self.update_word_with_sem_lang(
                                 duplicate_status['element_id'], 
@@ -491,28 +482,47 @@ class SemiticWordsIntegrator:
                         self.stats['total_processed'] += 1
                         continue
                         
-                    # Create word and link to root
-                    success = self.create_word_and_link(row, sem_id, row_id, create_missing_roots)
-                    
-                    if not success:
-                        self.stats['errors'] += 1
+                    # A word queued earlier in this batch is not in the database yet
+                    word_key = (word_text, lang, sem_id)
+                    if word_key in pending_keys:
+                        self.logger.info(f"⚪ SKIP complete: '{word_text}' already queued for creation")
+                        self.stats['duplicates_skipped'] += 1
+                        self.stats['total_processed'] += 1
+                        continue
                         
+                    # Queue word for creation and link to root
+                    pending_keys.add(word_key)
+                    pending_words.append({
+                        "sem_id": sem_id,
+                        "word": row.get("word"),
+                        "lang": row.get("lang"),
+                        "sem_lang": SEM_LANG_NAMES.get(lang, f"Language_{lang}"),
+                        "category": row.get("category"),
+                        "concept": row.get("concept"),
+                        "meaning": row.get("meaning"),
+                        "sem_word_id": row_id
+                    })
+                    
                     self.stats['total_processed'] += 1
                     
                     # Update progress
                     if RICH_AVAILABLE and hasattr(self, 'progress') and self.progress:
                         self.progress.update(progress_task, advance=1)
                         
-                    # Batch throttling
-                    if self.stats['total_processed'] % batch_size == 0:
+                    # Batch write + throttling
+                    if len(pending_words) >= batch_size:
+                        self.create_words_batch(pending_words, create_missing_roots)
+                        pending_words = []
+                        pending_keys.clear()
+                        
                         batch_count += 1
                         remaining = total_words - self.stats['total_processed']
                         self.logger.info(f"🔄 Batch {batch_count} complete ({self.stats['total_processed']}/{total_words}) | {remaining} remaining")
                         
+                        delay = self.throttle.pause()
+                        
                         if RICH_AVAILABLE and self.console:
-                            self.console.print(f"[blue]⏳[/blue] Batch pause ({self.delay_between_batches}s) | [green]{self.stats['words_created']} created[/green] | [blue]{self.stats['duplicates_updated']} updated[/blue] | [yellow]{self.stats['duplicates_skipped']} skipped[/yellow]")
-                            
-                        time.sleep(self.delay_between_batches)
+                            self.console.print(f"[blue]⏳[/blue] Batch pause ({delay:.1f}s) | [green]{self.stats['words_created']} created[/green] | [blue]{self.stats['duplicates_updated']} updated[/blue] | [yellow]{self.stats['duplicates_skipped']} skipped[/yellow]")
                         
                 except Exception as e:
                     self.logger.error(f"❌ Error processing word {row_id}: {e}")
@@ -520,6 +530,12 @@ class SemiticWordsIntegrator:
                     self.stats['total_processed'] += 1
                     continue
                     
+            # Write the final partial batch
+            if pending_words:
+                self.create_words_batch(pending_words, create_missing_roots)
+                batch_count += 1
+                self.logger.info(f"🔄 Batch {batch_count} complete ({self.stats['total_processed']}/{total_words})")
+                
             # Stop progress bar
             if RICH_AVAILABLE and hasattr(self, 'progress') and self.progress:
                 self.progress.stop()
@@ -588,7 +604,7 @@ def main():
         # Process words (remove limit for full processing)
         integrator.process_words(
             csv_path="sem_word.csv",
-            batch_size=150,
+            batch_size=500,
             create_missing_roots=True,
             limit=None  # Remove this line or set to None for full processing
         )
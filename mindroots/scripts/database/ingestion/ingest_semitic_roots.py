@@ -11,6 +11,7 @@ INTEGRATION LOGIC:
    - Check if root exists in Neo4j (match on 'arabic' property)
    - If exists: Add 'sem_id' property with the sem_root.csv ID
    - If not exists: Create new Root node with all standard properties + sem_id
+   Lookups and writes are batched with UNWIND (one query each per batch).
 
 ROOT NODE PROPERTIES (based on existing schema):
 - r1, r2, r3: Individual radical characters  
@@ -30,13 +31,11 @@ Date: 2025-08-13
 
 import csv
 import logging
-import time
 from datetime import datetime
-from typing import Dict, Optional
-import os
+from typing import Dict, List, Optional
 import sys
-from neo4j import GraphDatabase
 from dotenv import load_dotenv
+from _neo4j import AdaptiveThrottle, get_driver
 
 # Try to import rich for enhanced logging
 try:
@@ -57,7 +56,9 @@ class SemiticRootsIntegrator:
     def __init__(self):
         self.setup_logging()
         self.connect_to_neo4j()
-        self.arabic_alphabet = {}
+        self.arabic_alphabet = []
+        self.transliteration = []
+        self._root_cache: Dict[str, Optional[Dict]] = {}  # arabic root → status, None if not in Neo4j
         self.stats = {
             'total_processed': 0,
             'existing_updated': 0,
@@ -73,9 +74,8 @@ class SemiticRootsIntegrator:
             self.progress = None
         
         # Throttling settings for Neo4j Aura
-        self.batch_size = 25  # Process in smaller batches
-        self.delay_between_batches = 2.0  # 2 second delay between batches
-        self.delay_between_operations = 0.1  # 100ms delay between individual operations
+        self.batch_size = 500  # Roots per UNWIND lookup/write
+        self.throttle = AdaptiveThrottle(target_latency=0.5)  # Sleeps only when Aura slows down
         
     def setup_logging(self):
         """Configure comprehensive dual logging with Rich support."""
@@ -125,14 +125,8 @@ class SemiticRootsIntegrator:
     def connect_to_neo4j(self):
         """Connect to Neo4j database."""
         try:
-            uri = os.getenv('NEO4J_URI')
-            user = os.getenv('NEO4J_USER') 
-            password = os.getenv('NEO4J_PASS')
-            
-            if not all([uri, user, password]):
-                raise ValueError("Missing Neo4j environment variables")
-                
-            self.driver = GraphDatabase.driver(uri, auth=(user, password))
+            # Shared driver (and connection pool) from _neo4j, closed at exit
+            self.driver = get_driver()
             
             # Test connection and get database info
             with self.driver.session() as session:
@@ -157,7 +151,7 @@ class SemiticRootsIntegrator:
             self.logger.error(f"Failed to connect to Neo4j: {e}")
             raise
             
-    def load_arabic_alphabet(self) -> Dict[int, str]:
+    def load_arabic_alphabet(self) -> List[str]:
         """Load Arabic alphabet mapping from sem_lang.csv."""
         try:
             with open('sem_lang.csv', 'r', encoding='utf-8') as f:
@@ -167,9 +161,9 @@ class SemiticRootsIntegrator:
                         arabic_chars = row['script'].split(',')
                         translit_chars = row['translit'].split(',')
                         
-                        # Create mappings
-                        self.arabic_alphabet = {i: char for i, char in enumerate(arabic_chars)}
-                        self.transliteration = {i: trans for i, trans in enumerate(translit_chars)}
+                        # Lists indexed by radical ID
+                        self.arabic_alphabet = arabic_chars
+                        self.transliteration = translit_chars
                         
                         self.logger.info(f"Loaded Arabic alphabet with {len(self.arabic_alphabet)} characters")
                         return self.arabic_alphabet
@@ -188,15 +182,18 @@ class SemiticRootsIntegrator:
             Dict with 'arabic', 'english', 'r1', 'r2', 'r3', 'r4', 'root_type'
         """
         try:
-            # Get Arabic characters
-            r1 = self.arabic_alphabet.get(rad1, f"?{rad1}")
-            r2 = self.arabic_alphabet.get(rad2, f"?{rad2}")  
-            r3 = self.arabic_alphabet.get(rad3, f"?{rad3}")
+            alphabet, translit = self.arabic_alphabet, self.transliteration
+            n_alphabet, n_translit = len(alphabet), len(translit)
+            
+            # Get Arabic characters (unknown radical IDs render as ?<id>)
+            r1 = alphabet[rad1] if 0 <= rad1 < n_alphabet else f"?{rad1}"
+            r2 = alphabet[rad2] if 0 <= rad2 < n_alphabet else f"?{rad2}"
+            r3 = alphabet[rad3] if 0 <= rad3 < n_alphabet else f"?{rad3}"
             
             # Get transliterations
-            t1 = self.transliteration.get(rad1, f"?{rad1}")
-            t2 = self.transliteration.get(rad2, f"?{rad2}")
-            t3 = self.transliteration.get(rad3, f"?{rad3}")
+            t1 = translit[rad1] if 0 <= rad1 < n_translit else f"?{rad1}"
+            t2 = translit[rad2] if 0 <= rad2 < n_translit else f"?{rad2}"
+            t3 = translit[rad3] if 0 <= rad3 < n_translit else f"?{rad3}"
             
             result = {
                 'r1': r1,
@@ -210,8 +207,8 @@ class SemiticRootsIntegrator:
             # Handle quadriliteral roots
             if rad4 and rad4.strip():
                 rad4_int = int(rad4)
-                r4 = self.arabic_alphabet.get(rad4_int, f"?{rad4}")
-                t4 = self.transliteration.get(rad4_int, f"?{rad4}")
+                r4 = alphabet[rad4_int] if 0 <= rad4_int < n_alphabet else f"?{rad4}"
+                t4 = translit[rad4_int] if 0 <= rad4_int < n_translit else f"?{rad4}"
                 
                 result.update({
                     'r4': r4,
@@ -226,184 +223,299 @@ class SemiticRootsIntegrator:
             self.logger.error(f"Failed to reconstruct root from {rad1},{rad2},{rad3},{rad4}: {e}")
             raise
             
-    def check_root_status(self, arabic_root: str, sem_id: int) -> Dict[str, any]:
+    def fetch_root_status(self, tx, arabic_roots: List[str]) -> Dict[str, Dict]:
         """
-        Check root status in Neo4j database.
+        Look up a batch of reconstructed roots in Neo4j with a single query.
         
         Returns:
-            Dict with 'exists', 'element_id', 'already_processed', 'current_sem_id'
+            Dict keyed by arabic root with 'element_id', 'current_sem_id', 'root_id'
+            (roots missing from the database are absent from the dict)
         """
-        try:
-            with self.driver.session() as session:
-                query = """
-                MATCH (r:Root {arabic: $arabic_root})
-                RETURN elementId(r) as element_id, r.sem_id as current_sem_id
-                """
-                result = session.run(query, arabic_root=arabic_root)
-                record = result.single()
-                
-                if record:
-                    current_sem_id = record['current_sem_id']
-                    already_processed = current_sem_id is not None
-                    
-                    # Check if this exact sem_id already exists (duplicate prevention)
-                    if already_processed and current_sem_id == sem_id:
-                        self.logger.debug(f"Root {arabic_root} already processed with sem_id {sem_id}")
-                        return {
-                            'exists': True,
-                            'element_id': record['element_id'],
-                            'already_processed': True,
-                            'current_sem_id': current_sem_id,
-                            'is_duplicate': True
-                        }
-                    
-                    return {
-                        'exists': True,
-                        'element_id': record['element_id'],
-                        'already_processed': already_processed,
-                        'current_sem_id': current_sem_id,
-                        'is_duplicate': False
-                    }
-                else:
-                    return {
-                        'exists': False,
-                        'element_id': None,
-                        'already_processed': False,
-                        'current_sem_id': None,
-                        'is_duplicate': False
-                    }
-                    
-        except Exception as e:
-            self.logger.error(f"Failed to check root status: {arabic_root} - {e}")
-            raise
+        query = """
+        UNWIND $arabic_roots AS arabic_root
+        MATCH (r:Root {arabic: arabic_root})
+        RETURN arabic_root, elementId(r) as element_id, r.sem_id as current_sem_id, r.root_id as root_id
+        """
+        status = {}
+        for record in tx.run(query, arabic_roots=list(set(arabic_roots))):
+            # Keep the first match, as a single() lookup per root would
+            status.setdefault(record['arabic_root'], {
+                'element_id': record['element_id'],
+                'current_sem_id': record['current_sem_id'],
+                'root_id': record['root_id']
+            })
+        return status
+        
+    def preload_root_cache(self):
+        """Fill the root cache with every existing Root in one query."""
+        query = """
+        MATCH (r:Root)
+        WHERE r.arabic IS NOT NULL
+        RETURN r.arabic as arabic_root, elementId(r) as element_id, r.sem_id as current_sem_id, r.root_id as root_id
+        """
+        with self.driver.session() as session:
+            for record in session.run(query):
+                self._root_cache.setdefault(record['arabic_root'], {
+                    'element_id': record['element_id'],
+                    'current_sem_id': record['current_sem_id'],
+                    'root_id': record['root_id']
+                })
+        self.logger.info(f"🗂️ Cached {len(self._root_cache)} existing roots")
             
-    def get_next_root_id(self) -> int:
+    def get_next_root_id(self, tx) -> int:
         """Get next available root_id."""
         try:
-            with self.driver.session() as session:
-                query = "MATCH (r:Root) RETURN COALESCE(MAX(r.root_id), 0) + 1 as next_id"
-                result = session.run(query)
-                return result.single()['next_id']
+            query = "MATCH (r:Root) RETURN COALESCE(MAX(r.root_id), 0) + 1 as next_id"
+            result = tx.run(query)
+            return result.single()['next_id']
                 
         except Exception as e:
             self.logger.error(f"Failed to get next root ID: {e}")
             raise
             
-    def get_next_triliteral_id(self) -> int:
+    def get_next_triliteral_id(self, tx) -> int:
         """Get next available Triliteral_ID."""
         try:
-            with self.driver.session() as session:
-                query = """
-                MATCH (r:Root {root_type: 'Triliteral'}) 
-                RETURN COALESCE(MAX(r.Triliteral_ID), 0) + 1 as next_id
-                """
-                result = session.run(query)
-                return result.single()['next_id']
+            query = """
+            MATCH (r:Root {root_type: 'Triliteral'}) 
+            RETURN COALESCE(MAX(r.Triliteral_ID), 0) + 1 as next_id
+            """
+            result = tx.run(query)
+            return result.single()['next_id']
                 
         except Exception as e:
             self.logger.error(f"Failed to get next Triliteral ID: {e}")
             raise
             
-    def update_existing_root(self, root_element_id: str, sem_id: int, concept: str, arabic_root: str, current_sem_id: any):
-        """Update existing root with sem_id and concept."""
-        try:
-            with self.driver.session() as session:
-                # Prepare update based on current state
-                if current_sem_id is None:
-                    # First time adding sem_id
-                    query = """
-                    MATCH (r:Root) 
-                    WHERE elementId(r) = $root_element_id
-                    SET r.sem_id = $sem_id, r.concept = $concept
-                    RETURN r.arabic as arabic, r.root_id as root_id
-                    """
-                    action = "Added sem_id"
-                else:
-                    # Updating existing sem_id (overwrite scenario)
-                    query = """
-                    MATCH (r:Root) 
-                    WHERE elementId(r) = $root_element_id
-                    SET r.sem_id = $sem_id, r.concept = $concept
-                    RETURN r.arabic as arabic, r.root_id as root_id
-                    """
-                    action = f"Updated sem_id from {current_sem_id}"
-                
-                result = session.run(query, 
-                                   root_element_id=root_element_id, 
-                                   sem_id=sem_id, 
-                                   concept=concept)
-                record = result.single()
+    def ensure_id_counters(self, session):
+        """
+        Make sure the IdCounter nodes for root_id and Triliteral_ID exist.
+        
+        Missing counters are seeded once from the current MAX over Root; after
+        that, IDs are handed out by allocate_ids without scanning :Root again.
+        """
+        session.run("CREATE CONSTRAINT id_counter_name IF NOT EXISTS FOR (n:IdCounter) REQUIRE n.name IS UNIQUE").consume()
+        
+        for name, seed in (('root_id', self.get_next_root_id), ('Triliteral_ID', self.get_next_triliteral_id)):
+            record = session.run("MATCH (n:IdCounter {name: $name}) RETURN n.value as value", name=name).single()
+            if record is None:
+                value = session.execute_read(seed) - 1
+                session.run("""
+                MERGE (n:IdCounter {name: $name})
+                ON CREATE SET n.value = $value
+                """, name=name, value=value).consume()
+                self.logger.info(f"🔢 Seeded IdCounter {name} at {value}")
                 
-                if record:
-                    self.logger.info(f"✅ {action} → Root {arabic_root} | sem_id: {sem_id} | concept: '{concept}' | db_id: {record['root_id']}")
-                    if RICH_AVAILABLE:
-                        self.console.print(f"[green]✓[/green] Updated [cyan]{arabic_root}[/cyan] → sem_id: [yellow]{sem_id}[/yellow] | [dim]{concept}[/dim]")
-                    self.stats['existing_updated'] += 1
-                    # Throttling for Aura
-                    time.sleep(self.delay_between_operations)
-                else:
-                    self.logger.warning(f"⚠️ Failed to update root with element ID: {root_element_id}")
-                    
-        except Exception as e:
-            self.logger.error(f"❌ Failed to update existing root {arabic_root}: {e}")
-            raise
+    @staticmethod
+    def allocate_ids(tx, name: str, count: int) -> int:
+        """Reserve `count` consecutive IDs from an IdCounter node and return the first one."""
+        result = tx.run("""
+        MATCH (n:IdCounter {name: $name})
+        SET n.value = n.value + $count
+        RETURN n.value - $count + 1 as first_id
+        """, name=name, count=count)
+        return result.single()['first_id']
             
-    def create_new_root(self, root_data: Dict, sem_id: int, concept: str):
-        """Create new root node."""
-        try:
-            # Get next IDs
-            root_id = self.get_next_root_id()
-            triliteral_id = None
-            if root_data['root_type'] == 'Triliteral':
-                triliteral_id = self.get_next_triliteral_id()
+    @staticmethod
+    def write_root_batch(tx, creates: List[Dict], updates: List[Dict]) -> Dict[str, str]:
+        """
+        Create new roots and update existing ones with two UNWIND statements in one transaction.
+        
+        Returns:
+            Dict mapping the arabic root of each created node to its element_id
+        """
+        created = {}
+        if creates:
+            result = tx.run("""
+            UNWIND $creates AS properties
+            CREATE (r:Root)
+            SET r = properties
+            RETURN r.arabic as arabic_root, elementId(r) as element_id
+            """, creates=creates)
+            created = {record['arabic_root']: record['element_id'] for record in result}
+        if updates:
+            tx.run("""
+            UNWIND $updates AS u
+            MATCH (r:Root)
+            WHERE elementId(r) = u.element_id
+            SET r.sem_id = u.sem_id, r.concept = u.concept
+            """, updates=updates)
+        return created
+            
+    def _process_batch_tx(self, tx, batch: List[Dict]):
+        """
+        Transaction function integrating one batch of parsed sem_root.csv rows.
+        
+        Existence checks are answered from the root cache (only uncached roots are
+        queried), writes are done with one UNWIND query, and new root_id /
+        Triliteral_ID values are reserved as blocks from the IdCounter nodes, all
+        in one transaction. Nothing on self is modified here, so execute_write can
+        safely retry it; process_root_batch applies the returned results.
+        """
+        arabic_roots = [row['root_data']['arabic'] for row in batch]
+        misses = {arabic_root for arabic_root in arabic_roots if arabic_root not in self._root_cache}
+        fetched = self.fetch_root_status(tx, list(misses)) if misses else {}
                 
-            # Prepare properties
-            properties = {
-                'r1': root_data['r1'],
-                'r2': root_data['r2'],
-                'r3': root_data['r3'],
-                'arabic': root_data['arabic'],
-                'n_root': root_data['arabic'],  # Same as arabic for now
-                'english': root_data['english'],
-                'node_type': 'Root',
-                'root_type': root_data['root_type'],
-                'root_id': root_id,
-                'sem_id': sem_id,
-                'concept': concept
-            }
+        # Work on copies so a failed batch leaves the cache untouched
+        status = {}
+        for arabic_root in arabic_roots:
+            record = fetched.get(arabic_root) if arabic_root in misses else self._root_cache[arabic_root]
+            if record is not None:
+                status[arabic_root] = dict(record)
             
-            # Add r4 for quadriliterals
-            if 'r4' in root_data:
-                properties['r4'] = root_data['r4']
+        # Reserve one block of IDs for the roots this batch will create (first occurrence of each)
+        new_root_types = {}
+        for row in batch:
+            arabic_root = row['root_data']['arabic']
+            if arabic_root not in status:
+                new_root_types.setdefault(arabic_root, row['root_data']['root_type'])
+        new_triliterals = sum(1 for root_type in new_root_types.values() if root_type == 'Triliteral')
+        next_root_id = self.allocate_ids(tx, 'root_id', len(new_root_types)) if new_root_types else None
+        next_triliteral_id = self.allocate_ids(tx, 'Triliteral_ID', new_triliterals) if new_triliterals else None
+        
+        creates = {}  # arabic root → properties of roots created in this batch
+        updates = []
+        messages = []  # Deferred log lines, emitted once the batch is committed
+        stats = {'existing_updated': 0, 'new_created': 0, 'already_processed': 0}
+        
+        for row in batch:
+            root_data = row['root_data']
+            arabic_root = root_data['arabic']
+            sem_id = row['sem_id']
+            concept = row['concept']
+            
+            self.logger.debug(f"Processing sem_id {sem_id}: {arabic_root} (concept: {concept})")
+            
+            # Root created earlier in this batch: overwrite its sem_id before it is written
+            if arabic_root in creates:
+                properties = creates[arabic_root]
+                if properties['sem_id'] == sem_id:
+                    messages.append(('skip', arabic_root, sem_id, concept, None))
+                    stats['already_processed'] += 1
+                else:
+                    messages.append(('update', arabic_root, sem_id, concept, (properties['sem_id'], properties['root_id'])))
+                    properties['sem_id'] = sem_id
+                    properties['concept'] = concept
+                    stats['existing_updated'] += 1
+                continue
+                
+            record = status.get(arabic_root)
             
-            # Add Triliteral_ID for triliterals
-            if triliteral_id:
-                properties['Triliteral_ID'] = triliteral_id
+            if record is None:
+                # Create new root
+                properties = {
+                    'r1': root_data['r1'],
+                    'r2': root_data['r2'],
+                    'r3': root_data['r3'],
+                    'arabic': arabic_root,
+                    'n_root': arabic_root,  # Same as arabic for now
+                    'english': root_data['english'],
+                    'node_type': 'Root',
+                    'root_type': root_data['root_type'],
+                    'root_id': next_root_id,
+                    'sem_id': sem_id,
+                    'concept': concept
+                }
+                next_root_id += 1
                 
-            self.logger.debug(f"Creating new {root_data['root_type'].lower()} root: {root_data['arabic']} with properties: {properties}")
+                # Add r4 for quadriliterals
+                if 'r4' in root_data:
+                    properties['r4'] = root_data['r4']
+                    
+                # Add Triliteral_ID for triliterals
+                if root_data['root_type'] == 'Triliteral':
+                    properties['Triliteral_ID'] = next_triliteral_id
+                    next_triliteral_id += 1
+                    
+                self.logger.debug(f"Creating new {root_data['root_type'].lower()} root: {arabic_root} with properties: {properties}")
+                creates[arabic_root] = properties
+                messages.append(('create', arabic_root, sem_id, concept, properties))
+                stats['new_created'] += 1
                 
-            with self.driver.session() as session:
-                query = """
-                CREATE (r:Root $properties)
-                RETURN r.arabic as arabic, r.root_id as root_id
-                """
-                result = session.run(query, properties=properties)
-                record = result.single()
+            elif record['current_sem_id'] == sem_id:
+                # Skip duplicate processing
+                messages.append(('skip', arabic_root, sem_id, concept, None))
+                stats['already_processed'] += 1
                 
-                if record:
-                    trilateral_info = f" | Triliteral_ID: {triliteral_id}" if triliteral_id else ""
-                    self.logger.info(f"✨ Created NEW root → {record['arabic']} | sem_id: {sem_id} | concept: '{concept}' | db_id: {record['root_id']}{trilateral_info}")
-                    if RICH_AVAILABLE:
-                        self.console.print(f"[bold green]✨ NEW[/bold green] [cyan]{record['arabic']}[/cyan] → sem_id: [yellow]{sem_id}[/yellow] | [dim]{concept}[/dim]")
-                    self.stats['new_created'] += 1
-                    # Throttling for Aura
-                    time.sleep(self.delay_between_operations)
-                else:
-                    self.logger.warning(f"⚠️ Failed to create root: {root_data['arabic']}")
+            else:
+                # Update existing root
+                updates.append({'element_id': record['element_id'], 'sem_id': sem_id, 'concept': concept})
+                messages.append(('update', arabic_root, sem_id, concept, (record['current_sem_id'], record['root_id'])))
+                record['current_sem_id'] = sem_id
+                stats['existing_updated'] += 1
+                
+        created = self.write_root_batch(tx, list(creates.values()), updates)
+        return misses, status, creates, created, stats, messages
+        
+    def process_root_batch(self, session, batch: List[Dict]):
+        """Integrate one batch in a single write transaction, then update cache, stats and logs."""
+        misses, status, creates, created, stats, messages = session.execute_write(self._process_batch_tx, batch)
+            
+        # Batch committed: record the new state of every touched root in the cache
+        self._root_cache.update(dict.fromkeys(misses))
+        self._root_cache.update(status)
+        for arabic_root, properties in creates.items():
+            self._root_cache[arabic_root] = {
+                'element_id': created.get(arabic_root),
+                'current_sem_id': properties['sem_id'],
+                'root_id': properties['root_id']
+            }
+            
+        for key, value in stats.items():
+            self.stats[key] += value
+            
+        for action, arabic_root, sem_id, concept, extra in messages:
+            if action == 'skip':
+                self.logger.info(f"♾️ SKIP duplicate → {arabic_root} already has sem_id {sem_id}")
+                if RICH_AVAILABLE:
+                    self.console.print(f"[yellow]♾️ SKIP[/yellow] [cyan]{arabic_root}[/cyan] already processed")
+            elif action == 'update':
+                previous_sem_id, root_id = extra
+                update_action = "Added sem_id" if previous_sem_id is None else f"Updated sem_id from {previous_sem_id}"
+                self.logger.info(f"✅ {update_action} → Root {arabic_root} | sem_id: {sem_id} | concept: '{concept}' | db_id: {root_id}")
+                if RICH_AVAILABLE:
+                    self.console.print(f"[green]✓[/green] Updated [cyan]{arabic_root}[/cyan] → sem_id: [yellow]{sem_id}[/yellow] | [dim]{concept}[/dim]")
+            else:
+                trilateral_info = f" | Triliteral_ID: {extra['Triliteral_ID']}" if 'Triliteral_ID' in extra else ""
+                self.logger.info(f"✨ Created NEW root → {arabic_root} | sem_id: {sem_id} | concept: '{concept}' | db_id: {extra['root_id']}{trilateral_info}")
+                if RICH_AVAILABLE:
+                    self.console.print(f"[bold green]✨ NEW[/bold green] [cyan]{arabic_root}[/cyan] → sem_id: [yellow]{sem_id}[/yellow] | [dim]{concept}[/dim]")
                     
-        except Exception as e:
-            self.logger.error(f"❌ Failed to create new root {root_data['arabic']}: {e}")
-            raise
+    def load_sem_roots(self, limit: Optional[int] = None) -> List[Dict]:
+        """Parse sem_root.csv and reconstruct the Arabic root of every row."""
+        rows = []
+        with open('sem_root.csv', 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            ID, RAD1, RAD2, RAD3, RAD4, CONCEPT = (
+                header.index(name) for name in ('id', 'rad1', 'rad2', 'rad3', 'rad4', 'concept')
+            )
+            
+            # Blank lines are skipped, as DictReader did
+            for i, row in enumerate(filter(None, reader)):
+                if limit and i >= limit:
+                    self.logger.info(f"🏁 Reached limit of {limit} roots")
+                    break
+                    
+                try:
+                    # Parse row data
+                    sem_id = int(row[ID])
+                    rad1 = int(row[RAD1])
+                    rad2 = int(row[RAD2])
+                    rad3 = int(row[RAD3])
+                    rad4 = row[RAD4] if row[RAD4].strip() else None
+                    
+                    rows.append({
+                        'sem_id': sem_id,
+                        'concept': row[CONCEPT],
+                        'root_data': self.reconstruct_root(rad1, rad2, rad3, rad4)
+                    })
+                    
+                except Exception as e:
+                    self.logger.error(f"❌ Error processing row {i+1} (sem_id {row[ID] if len(row) > ID else 'unknown'}): {e}")
+                    self.stats['errors'] += 1
+                    
+        return rows
             
     def process_roots(self, limit: Optional[int] = None):
         """
@@ -414,13 +526,14 @@ class SemiticRootsIntegrator:
         """
         try:
             self.logger.info("📊 Starting root processing...")
-            self.logger.info(f"⚙️ Throttling: batch_size={self.batch_size}, batch_delay={self.delay_between_batches}s, op_delay={self.delay_between_operations}s")
+            self.logger.info(f"⚙️ Throttling: batch_size={self.batch_size}, target_latency={self.throttle.target_latency}s")
+            
+            # Parse the whole CSV up front; roots are then written batch by batch
+            rows = self.load_sem_roots(limit)
+            total_roots = len(rows)
             
-            # Count total roots for progress tracking
-            with open('sem_root.csv', 'r', encoding='utf-8') as f:
-                total_roots = sum(1 for _ in csv.DictReader(f)) - (1 if limit else 0)  # Subtract 1 for header
-                if limit:
-                    total_roots = min(total_roots, limit)
+            # Warm the root cache so existence checks need no per-batch round-trip
+            self.preload_root_cache()
             
             self.logger.info(f"🎯 Target: {total_roots} roots to process")
             
@@ -436,73 +549,39 @@ class SemiticRootsIntegrator:
                 progress_task = self.progress.add_task("Processing roots", total=total_roots)
                 self.progress.start()
             
-            with open('sem_root.csv', 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
+            # One session for the whole run; each batch is a single write transaction.
+            # Batches stay client-driven (not apoc.periodic.iterate) because roots are
+            # reconstructed from sem_lang.csv and checked against the cache in Python.
+            with self.driver.session() as session:
+                # New roots are numbered from IdCounter nodes rather than MAX() scans
+                self.ensure_id_counters(session)
                 
-                batch_count = 0
+                for batch_count, start in enumerate(range(0, total_roots, self.batch_size), start=1):
+                    batch = rows[start:start + self.batch_size]
                 
-                for i, row in enumerate(reader):
-                    if limit and i >= limit:
-                        self.logger.info(f"🏁 Reached limit of {limit} roots")
-                        break
-                        
                     try:
-                        # Parse row data
-                        sem_id = int(row['id'])
-                        rad1 = int(row['rad1'])
-                        rad2 = int(row['rad2'])
-                        rad3 = int(row['rad3'])
-                        rad4 = row['rad4'] if row['rad4'].strip() else None
-                        concept = row['concept']
-                        
-                        # Reconstruct root
-                        root_data = self.reconstruct_root(rad1, rad2, rad3, rad4)
-                        arabic_root = root_data['arabic']
-                        
-                        self.logger.debug(f"Processing sem_id {sem_id}: {arabic_root} (concept: {concept})")
-                        
-                        # Check root status (existence, duplicate prevention)
-                        root_status = self.check_root_status(arabic_root, sem_id)
-                        
-                        if root_status['is_duplicate']:
-                            # Skip duplicate processing
-                            self.logger.info(f"♾️ SKIP duplicate → {arabic_root} already has sem_id {sem_id}")
-                            if RICH_AVAILABLE:
-                                self.console.print(f"[yellow]♾️ SKIP[/yellow] [cyan]{arabic_root}[/cyan] already processed")
-                            self.stats['already_processed'] += 1
-                        elif root_status['exists']:
-                            # Update existing root
-                            self.update_existing_root(
-                                root_status['element_id'], 
-                                sem_id, 
-                                concept, 
-                                arabic_root, 
-                                root_status['current_sem_id']
-                            )
-                        else:
-                            # Create new root
-                            self.create_new_root(root_data, sem_id, concept)
-                            
-                        self.stats['total_processed'] += 1
-                        
-                        # Update progress bar
-                        if RICH_AVAILABLE and hasattr(self, 'progress'):
-                            self.progress.update(progress_task, advance=1)
-                        
-                        # Batch throttling for Neo4j Aura
-                        if self.stats['total_processed'] % self.batch_size == 0:
-                            batch_count += 1
-                            remaining = total_roots - self.stats['total_processed']
-                            self.logger.info(f"🔄 Batch {batch_count} complete ({self.stats['total_processed']}/{total_roots}) | {remaining} remaining")
-                            self.logger.info(f"⏳ Pausing {self.delay_between_batches}s for Neo4j Aura throttling...")
-                            if RICH_AVAILABLE:
-                                self.console.print(f"[blue]⏳[/blue] Batch pause ({self.delay_between_batches}s) | [green]{self.stats['existing_updated']} updated[/green] | [yellow]{self.stats['new_created']} created[/yellow]")
-                            time.sleep(self.delay_between_batches)
-                            
+                        self.throttle.call(self.process_root_batch, session, batch)
                     except Exception as e:
-                        self.logger.error(f"❌ Error processing row {i+1} (sem_id {row.get('id', 'unknown')}): {e}")
-                        self.stats['errors'] += 1
+                        self.logger.error(f"❌ Error processing batch {batch_count} (sem_ids {batch[0]['sem_id']}-{batch[-1]['sem_id']}): {e}")
+                        self.stats['errors'] += len(batch)
                         continue
+                    
+                    self.stats['total_processed'] += len(batch)
+                
+                    # Update progress bar
+                    if RICH_AVAILABLE and hasattr(self, 'progress'):
+                        self.progress.update(progress_task, advance=len(batch))
+                
+                    # Batch throttling for Neo4j Aura
+                    remaining = total_roots - start - len(batch)
+                    self.logger.info(f"🔄 Batch {batch_count} complete ({self.stats['total_processed']}/{total_roots}) | {remaining} remaining")
+                    if remaining:
+                        # Back-to-back batches unless write latency shows Aura is under pressure
+                        delay = self.throttle.pause()
+                        if delay:
+                            self.logger.info(f"⏳ Paused {delay:.1f}s for Neo4j Aura throttling...")
+                            if RICH_AVAILABLE:
+                                self.console.print(f"[blue]⏳[/blue] Batch pause ({delay:.1f}s) | [green]{self.stats['existing_updated']} updated[/green] | [yellow]{self.stats['new_created']} created[/yellow]")
                         
             # Stop progress bar
             if RICH_AVAILABLE and hasattr(self, 'progress'):
@@ -553,9 +632,9 @@ class SemiticRootsIntegrator:
         
     def close(self):
         """Clean up resources."""
+        # The shared driver is closed by _neo4j at interpreter exit
         if hasattr(self, 'driver'):
-            self.driver.close()
-            self.logger.info("Database connection closed")
+            self.logger.info("Integration finished; shared Neo4j driver stays open until exit")
 
 
 def main():
@@ -1,7 +1,9 @@
-import re
 import unicodedata
-from neo4j import GraphDatabase
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from neo4j.exceptions import ServiceUnavailable, TransientError
+from _neo4j import DATABASE, get_driver
 import os
 import time
 import logging
@@ -28,18 +30,29 @@ console_handler.setFormatter(console_formatter)
 logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
-uri = os.getenv('NEO4J_URI')
-user = os.getenv('NEO4J_USER')
-password = os.getenv('NEO4J_PASS')
+# Shared driver (and connection pool) from _neo4j, closed at exit
+driver = get_driver()
 
-driver = GraphDatabase.driver(uri, auth=(user, password))
+BATCH_SIZE = 1000  # CorpusItems linked per transaction
+WORKERS = int(os.getenv('LINK_WORKERS', '8'))  # Concurrent sessions, each linking its own disjoint set of roots
+INITIAL_BACKOFF = 0.1  # Seconds to wait after the first transient failure
+MAX_BACKOFF = 30.0
+
+# Arabic diacritics (U+064B–U+0655), deleted with str.translate
+ARABIC_DIACRITICS_TABLE = dict.fromkeys(range(0x064B, 0x0656))
+
+# Orthographic variants folded by normalize_arabic
+ARABIC_VARIANTS_TABLE = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا',  # Alif variants → plain alif
+    'ى': 'ي',  # Alif maqsura → ya
+    'ة': 'ه',  # Ta marbuta → ha
+})
 
 def strip_diacritics(text):
     if text is None:
         return None
-    arabic_diacritics = re.compile(r'[\u064B-\u0652\u0653-\u0655]')
-    text = unicodedata.normalize('NFKD', text)
-    return arabic_diacritics.sub('', text)
+    # NFKD splits hamza/madda letters into base letter + combining mark, which is then dropped
+    return unicodedata.normalize('NFKD', text).translate(ARABIC_DIACRITICS_TABLE)
 
 def normalize_arabic(text):
     """
@@ -56,167 +69,389 @@ def normalize_arabic(text):
     # First strip diacritics
     text = strip_diacritics(text)
     
-    # Normalize orthographic variants
+    # Normalize orthographic variants in one pass
     # Alif variants: أ (hamza above), إ (hamza below), آ (madda) → ا (plain alif)
-    text = re.sub(r'[أإآ]', 'ا', text)
-    
     # Ya variants: ى (alif maqsura) → ي (ya)
-    text = re.sub(r'ى', 'ي', text)
-    
     # Ta marbuta: ة → ه (convert to ha for more consistent matching)
-    text = re.sub(r'ة', 'ه', text)
+    return text.translate(ARABIC_VARIANTS_TABLE)
+
+def gather_batch(tx, valid_roots, roots):
+    # Read transaction: pull a batch of CorpusItems still waiting to be linked (see mark_unlinked_items)
+    # and look up existing word nodes for the ones whose root is valid
+    result = tx.run("""
+        MATCH (ci:UnlinkedCorpusItem)
+        WHERE ci.root IN $roots
+        RETURN ci.item_id AS item_id, ci.root AS root, ci.lemma AS lemma
+        LIMIT $batch_size
+    """, roots=roots, batch_size=BATCH_SIZE)
+    
+    rows = [{
+        'item_id': record['item_id'],
+        'root': record['root'],
+        'lemma': record['lemma'],
+        'lemma_no_diacritics': strip_diacritics(record['lemma']),
+        'lemma_normalized': normalize_arabic(record['lemma'])
+    } for record in result]
+    
+    # Items whose root fails validation never reach the word lookup
+    candidates = [row for row in rows if row['root'] in valid_roots]
+    lookup = {}
+    if candidates:
+        # The same word recurs across many verses: look up each distinct (root, lemma) only once
+        keys = {}  # (root, no_diacritics, normalized) → key
+        for row in candidates:
+            keys.setdefault((row['root'], row['lemma_no_diacritics'], row['lemma_normalized']), len(keys))
+        unique = [{
+            'key': key,
+            'root': root,
+            'lemma_no_diacritics': lemma_no_diacritics,
+            'lemma_normalized': lemma_normalized
+        } for (root, lemma_no_diacritics, lemma_normalized), key in keys.items()]
+        
+        # Search for existing word nodes for the whole batch in one round-trip,
+        # matching roots on both arabic and n_root and words on original and normalized forms.
+        # The root lookup is a UNION rather than an OR so each branch can seek its own index.
+        lookups = tx.run("""
+            UNWIND $rows AS row
+            CALL {
+                WITH row
+                CALL {
+                    WITH row
+                    MATCH (r:Root {arabic: row.root})
+                    RETURN r
+                    UNION
+                    WITH row
+                    MATCH (r:Root {n_root: row.root})
+                    RETURN r
+                }
+                RETURN collect(r) AS roots
+            }
+            CALL {
+                WITH row, roots
+                UNWIND roots AS r
+                MATCH (r)-[:HAS_WORD]->(w:Word)
+                WHERE w.arabic_no_diacritics = row.lemma_no_diacritics
+                   OR w.arabic_normalized = row.lemma_normalized
+                RETURN head(collect(elementId(w))) AS word_id
+            }
+            RETURN row.key AS key, word_id
+        """, rows=unique)
+        by_key = {record['key']: record['word_id'] for record in lookups}
+        
+        # Fan the results back out to every item sharing a key
+        lookup = {
+            row['item_id']: by_key[keys[(row['root'], row['lemma_no_diacritics'], row['lemma_normalized'])]]
+            for row in candidates
+        }
     
-    return text
+    return rows, lookup
 
-def link_items(tx):
+def apply_batch(tx, creations, pending, links, failures):
+    # Write transaction: create missing words, then link or mark every item of the batch
+    new_words = {}
+    if creations:
+        # Create new Word nodes under their roots in one round-trip
+        result = tx.run("""
+            UNWIND $creations AS c
+            CALL {
+                WITH c
+                MATCH (r:Root {arabic: c.root})
+                RETURN r
+                UNION
+                WITH c
+                MATCH (r:Root {n_root: c.root})
+                RETURN r
+            }
+            CREATE (w:Word {
+                arabic: c.lemma,
+                arabic_no_diacritics: c.lemma_no_diacritics,
+                arabic_normalized: c.lemma_normalized,
+                generated: true,
+                node_type: "Word",
+                type: "word"
+            })
+            CREATE (r)-[:HAS_WORD]->(w)
+            WITH c, head(collect(elementId(w))) AS word_id
+            RETURN c.key AS key, word_id
+        """, creations=creations)
+        new_words = {record['key']: record['word_id'] for record in result}
+    
+    outcomes = links + failures
+    for item_id, index in pending.items():
+        word_id = new_words.get(index)
+        if word_id is not None:
+            creation = creations[index]
+            outcomes.append({
+                'item_id': item_id,
+                'word_id': word_id,
+                'lemma_no_diacritics': creation['lemma_no_diacritics'],
+                'lemma_normalized': creation['lemma_normalized']
+            })
+        else:
+            # Mark this item as failed to avoid retrying it
+            outcomes.append({'item_id': item_id, 'reason': 'word_creation_failed'})
+    
+    if outcomes:
+        # Write links and failure markers for the whole batch in one statement:
+        # link rows carry a word_id, failure rows a reason. Either way the item is done.
+        # Element ids from the read transaction can be reused after a delete, so the word
+        # is re-checked against the lemma forms before linking; a stale id links nothing.
+        tx.run("""
+            UNWIND $outcomes AS o
+            MATCH (ci:CorpusItem {item_id: o.item_id, corpus_id: 2})
+            REMOVE ci:UnlinkedCorpusItem
+            FOREACH (_ IN CASE WHEN o.reason IS NOT NULL THEN [1] ELSE [] END |
+                SET ci.link_failed = true, ci.link_failed_reason = o.reason)
+            WITH ci, o
+            WHERE o.word_id IS NOT NULL
+            MATCH (w:Word)
+            WHERE elementId(w) = o.word_id
+              AND (w.arabic_no_diacritics = o.lemma_no_diacritics
+                   OR w.arabic_normalized = o.lemma_normalized)
+            MERGE (ci)-[:HAS_WORD]->(w)
+        """, outcomes=outcomes)
+    
+    return new_words
+
+def link_items(session, valid_roots, roots):
     # Statistics for this batch
     matched = 0
     created = 0
     failed = 0
     
     try:
-        # Pull a batch of CorpusItems that have a root, lemma, no existing link, and haven't failed linking
-        result = tx.run("""
-            MATCH (ci:CorpusItem)
-            WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL AND ci.lemma IS NOT NULL
-              AND NOT (ci)-[:HAS_WORD]->(:Word)
-              AND ci.link_failed IS NULL
-            RETURN ci.item_id AS item_id, ci.root AS root, ci.lemma AS lemma
-            LIMIT 50
-        """)
-        
-        items = list(result)
-        if not items:
+        # Lookups run as a read transaction (servable by a follower), the deltas as one write transaction
+        rows, lookup = session.execute_read(gather_batch, valid_roots, roots)
+        if not rows:
             logger.info("No more unlinked items found - processing complete")
             return 0
             
-        logger.info(f"Found {len(items)} unlinked items in this batch")
+        logger.info(f"Found {len(rows)} unlinked items in this batch")
         
-        for record in items:
-            item_id = record['item_id']
-            root = record['root']
-            lemma = record['lemma']
-            lemma_no_diacritics = strip_diacritics(lemma)
-            lemma_normalized = normalize_arabic(lemma)
-
-            logger.info(f"Processing item {item_id}: lemma='{lemma}' -> no_diacritics='{lemma_no_diacritics}', normalized='{lemma_normalized}', root='{root}'")
-
-            # Validate root exists first - check both arabic and n_root properties
-            logger.debug(f"🔍 Searching for root: '{root}'")
-            root_check = tx.run("""
-                MATCH (r:Root) 
-                WHERE r.arabic = $root OR r.n_root = $root 
-                RETURN r
-            """, root=root).single()
-            if not root_check:
-                logger.warning(f"❌ Root '{root}' not found for item {item_id}")
+        links = []  # {item_id, word_id} pairs to MERGE
+        failures = []  # {item_id, reason} for items to mark as failed
+        creations = []  # New words to create, one per distinct lemma under a root
+        pending = {}  # item_id → index into creations
+        queued = {}  # (root, form, lemma) → index into creations, for in-batch reuse
+        
+        for row in rows:
+            item_id = row['item_id']
+            logger.info(f"Processing item {item_id}: lemma='{row['lemma']}' -> no_diacritics='{row['lemma_no_diacritics']}', normalized='{row['lemma_normalized']}', root='{row['root']}'")
+            
+            # Validate root exists first against the preloaded arabic/n_root values
+            if row['root'] not in valid_roots:
+                logger.warning(f"❌ Root '{row['root']}' not found for item {item_id}")
                 # Mark this item as failed to avoid retrying it
-                tx.run("""
-                    MATCH (ci:CorpusItem {item_id: $item_id, corpus_id: 2})
-                    SET ci.link_failed = true, ci.link_failed_reason = 'root_not_found'
-                """, item_id=item_id)
+                failures.append({'item_id': item_id, 'reason': 'root_not_found'})
                 failed += 1
                 continue
-            else:
-                logger.debug(f"✅ Found root: '{root}'")
-
-            # Try to find existing word node under root using both original and normalized matching
-            logger.debug(f"🔍 Searching for word no_diacritics='{lemma_no_diacritics}' or normalized='{lemma_normalized}' under root '{root}'")
-            word_match = tx.run("""
-                MATCH (r:Root)-[:HAS_WORD]->(w:Word)
-                WHERE (r.arabic = $root OR r.n_root = $root) 
-                  AND (w.arabic_no_diacritics = $lemma_no_diacritics
-                       OR w.arabic_normalized = $lemma_normalized)
-                RETURN w LIMIT 1
-            """, root=root, lemma_no_diacritics=lemma_no_diacritics, lemma_normalized=lemma_normalized).single()
-
-            if word_match:
-                tx.run("""
-                    MATCH (ci:CorpusItem {item_id: $item_id, corpus_id: 2})
-                    MATCH (w:Word)
-                    WHERE elementId(w) = $wid
-                    MERGE (ci)-[:HAS_WORD]->(w)
-                """, item_id=item_id, wid=word_match['w'].element_id)
-                logger.info(f"✅ Linked item {item_id} to existing Word (id: {word_match['w'].element_id})")
+            
+            word_id = lookup[item_id]
+            if word_id is not None:
+                links.append({
+                    'item_id': item_id,
+                    'word_id': word_id,
+                    'lemma_no_diacritics': row['lemma_no_diacritics'],
+                    'lemma_normalized': row['lemma_normalized']
+                })
+                logger.info(f"✅ Linked item {item_id} to existing Word (id: {word_id})")
                 matched += 1
             else:
-                # Create new Word node under that root
-                lemma_normalized = normalize_arabic(lemma)
-                word_create = tx.run("""
-                    MATCH (r:Root)
-                    WHERE r.arabic = $root OR r.n_root = $root
-                    CREATE (w:Word {
-                        arabic: $lemma,
-                        arabic_no_diacritics: $lemma_no_diacritics,
-                        arabic_normalized: $lemma_normalized,
-                        generated: true,
-                        node_type: "Word",
-                        type: "word"
-                    })
-                    CREATE (r)-[:HAS_WORD]->(w)
-                    RETURN w
-                """, root=root, lemma=lemma, lemma_no_diacritics=lemma_no_diacritics, lemma_normalized=lemma_normalized).single()
-
-                if word_create:
-                    tx.run("""
-                        MATCH (ci:CorpusItem {item_id: $item_id, corpus_id: 2})
-                        MATCH (w:Word)
-                        WHERE elementId(w) = $wid
-                        MERGE (ci)-[:HAS_WORD]->(w)
-                    """, item_id=item_id, wid=word_create['w'].element_id)
-                    logger.info(f"🆕 Created and linked item {item_id} to new Word (id: {word_create['w'].element_id})")
-                    created += 1
+                # Reuse a word already queued for creation in this batch, as a sequential run would have found it
+                nd_key = (row['root'], 'nd', row['lemma_no_diacritics'])
+                normalized_key = (row['root'], 'normalized', row['lemma_normalized'])
+                index = queued.get(nd_key, queued.get(normalized_key))
+                if index is not None:
+                    pending[item_id] = index
                 else:
-                    logger.error(f"❌ Failed to create word for item {item_id}")
-                    # Mark this item as failed to avoid retrying it
-                    tx.run("""
-                        MATCH (ci:CorpusItem {item_id: $item_id, corpus_id: 2})
-                        SET ci.link_failed = true, ci.link_failed_reason = 'word_creation_failed'
-                    """, item_id=item_id)
-                    failed += 1
+                    queued.setdefault(nd_key, len(creations))
+                    queued.setdefault(normalized_key, len(creations))
+                    pending[item_id] = len(creations)
+                    creations.append({
+                        'key': len(creations),
+                        'root': row['root'],
+                        'lemma': row['lemma'],
+                        'lemma_no_diacritics': row['lemma_no_diacritics'],
+                        'lemma_normalized': row['lemma_normalized']
+                    })
+        
+        new_words = session.execute_write(apply_batch, creations, pending, links, failures)
+        
+        for item_id, index in pending.items():
+            word_id = new_words.get(index)
+            if word_id is not None:
+                logger.info(f"🆕 Created and linked item {item_id} to new Word (id: {word_id})")
+                created += 1
+            else:
+                logger.error(f"❌ Failed to create word for item {item_id}")
+                failed += 1
         
         logger.info(f"Batch complete - Matched: {matched}, Created: {created}, Failed: {failed}")
-        return len(items)
+        return len(rows)
         
     except Exception as e:
         logger.error(f"Database error in link_items: {e}")
         raise
 
-def main():
-    logger.info("Starting corpus item linking process...")
+# Indexes backing the root, word and corpus item lookups in link_items
+INDEXES = [
+    "CREATE INDEX root_arabic IF NOT EXISTS FOR (r:Root) ON (r.arabic)",
+    "CREATE INDEX root_n_root IF NOT EXISTS FOR (r:Root) ON (r.n_root)",
+    "CREATE INDEX word_nd IF NOT EXISTS FOR (w:Word) ON (w.arabic_no_diacritics)",
+    "CREATE INDEX word_normalized IF NOT EXISTS FOR (w:Word) ON (w.arabic_normalized)",
+    "CREATE INDEX ci_item IF NOT EXISTS FOR (ci:CorpusItem) ON (ci.item_id, ci.corpus_id)",
+    # Single-property index for MATCH (ci:CorpusItem {item_id: ...}) lookups without corpus_id
+    "CREATE INDEX corpusitem_id IF NOT EXISTS FOR (ci:CorpusItem) ON (ci.item_id)",
+]
+
+def create_indexes(session):
+    for statement in INDEXES:
+        session.run(statement).consume()
+    logger.info(f"Ensured {len(INDEXES)} lookup indexes")
+
+def mark_unlinked_items(session):
+    # Label the CorpusItems that have a root, lemma, no existing link, and haven't failed linking,
+    # so each batch is a label scan with LIMIT instead of a filter over the whole corpus.
+    # link_items removes the label once an item is linked or marked as failed.
+    session.run("""
+        MATCH (ci:CorpusItem)
+        WHERE ci.corpus_id = 2 AND ci.root IS NOT NULL AND ci.lemma IS NOT NULL
+          AND NOT (ci)-[:HAS_WORD]->(:Word)
+          AND ci.link_failed IS NULL
+          AND NOT ci:UnlinkedCorpusItem
+        CALL {
+            WITH ci
+            SET ci:UnlinkedCorpusItem
+        } IN TRANSACTIONS OF 10000 ROWS
+    """).consume()
+    count = session.run("MATCH (ci:UnlinkedCorpusItem) RETURN count(ci) AS count").single()['count']
+    logger.info(f"{count} corpus items waiting to be linked")
+
+def load_valid_roots(session):
+    # Every Root arabic and n_root value, so root validation needs no per-item query
+    result = session.run("""
+        MATCH (r:Root)
+        RETURN r.arabic AS arabic, r.n_root AS n_root
+    """)
+    valid_roots = set()
+    for record in result:
+        valid_roots.add(record['arabic'])
+        valid_roots.add(record['n_root'])
+    valid_roots.discard(None)
+    logger.info(f"Loaded {len(valid_roots)} root spellings")
+    return valid_roots
+
+def partition_roots(session):
+    # Split the roots of unlinked items across workers. gather_batch and apply_batch resolve a
+    # root spelling through both Root.arabic and Root.n_root, so spellings are first grouped by
+    # the Root nodes they resolve to. A whole group goes to one worker, so two workers never
+    # create the same Word or lock the same Root node.
+    result = session.run("""
+        MATCH (ci:UnlinkedCorpusItem)
+        WITH DISTINCT ci.root AS root
+        OPTIONAL MATCH (r:Root)
+        WHERE r.arabic = root OR r.n_root = root
+        RETURN root, collect(elementId(r)) AS root_ids
+    """)
+    
+    # Union-find over spellings and Root element ids: spellings sharing a Root join one group
+    parent = {}
+    def find(key):
+        parent.setdefault(key, key)
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+    
+    roots = []
+    for record in result:
+        roots.append(record['root'])
+        for root_id in record['root_ids']:
+            parent[find(('spelling', record['root']))] = find(('node', root_id))
     
+    groups = {}
+    for root in sorted(roots):
+        groups.setdefault(find(('spelling', root)), []).append(root)
+    partitions = [[] for _ in range(WORKERS)]
+    for i, group in enumerate(sorted(groups.values())):
+        partitions[i % WORKERS].extend(group)
+    return [partition for partition in partitions if partition]
+
+def link_partition(worker, roots, valid_roots, stop):
+    # Link every unlinked item under `roots` in its own session; returns (batches, items processed)
     total_processed = 0
     batch_count = 0
+    backoff = INITIAL_BACKOFF
+    
+    # fetch_size matches BATCH_SIZE so each batch's records come back in a single PULL
+    with driver.session(database=DATABASE, fetch_size=BATCH_SIZE) as session:
+        while not stop.is_set():
+            batch_count += 1
+            logger.info(f"[worker {worker}] Starting batch {batch_count}...")
+            
+            try:
+                items_processed = link_items(session, valid_roots, roots)
+            except (TransientError, ServiceUnavailable) as e:
+                # Back off only when the database pushes back, doubling up to MAX_BACKOFF
+                logger.warning(f"[worker {worker}] Transient error in batch {batch_count}, retrying in {backoff:.1f}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                batch_count -= 1
+                continue
+            backoff = INITIAL_BACKOFF
+            
+            if items_processed == 0:
+                batch_count -= 1
+                break
+            
+            total_processed += items_processed
+            logger.info(f"[worker {worker}] Batch {batch_count} complete. Running total: {total_processed} items processed")
+    
+    return batch_count, total_processed
+
+def main():
+    logger.info("Starting corpus item linking process...")
+    
+    stop = threading.Event()
+    futures = []
     
     try:
-        with driver.session() as session:
-            while True:
-                batch_count += 1
-                logger.info(f"Starting batch {batch_count}...")
-                
-                items_processed = session.execute_write(link_items)
-                total_processed += items_processed
-                
-                if items_processed == 0:
-                    logger.info(f"Processing complete!")
-                    logger.info(f"Final statistics:")
-                    logger.info(f"  - Total batches processed: {batch_count - 1}")
-                    logger.info(f"  - Total items processed: {total_processed}")
-                    break
-                
-                logger.info(f"Batch {batch_count} complete. Running total: {total_processed} items processed")
-                time.sleep(0.5)  # Avoid DB throttling
+        with driver.session(database=DATABASE) as session:
+            create_indexes(session)
+            mark_unlinked_items(session)
+            valid_roots = load_valid_roots(session)
+            partitions = partition_roots(session)
+        
+        # Batches are driven from Python rather than apoc.periodic.iterate: lemma normalization
+        # (strip_diacritics / normalize_arabic) and in-batch word reuse happen client-side,
+        # and each batch already costs only a few UNWIND round-trips
+        logger.info(f"Linking with {len(partitions)} workers")
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            futures = [
+                executor.submit(link_partition, worker, roots, valid_roots, stop)
+                for worker, roots in enumerate(partitions, start=1)
+            ]
+            try:
+                results = [future.result() for future in futures]
+            except BaseException:
+                # Let the other workers finish their current batch and stop
+                stop.set()
+                raise
+        
+        logger.info(f"Processing complete!")
+        logger.info(f"Final statistics:")
+        logger.info(f"  - Total batches processed: {sum(batches for batches, _ in results)}")
+        logger.info(f"  - Total items processed: {sum(items for _, items in results)}")
                 
     except KeyboardInterrupt:
+        done = [future.result() for future in futures if future.done() and not future.exception()]
         logger.info(f"Process interrupted by user")
         logger.info(f"Statistics at interruption:")
-        logger.info(f"  - Batches processed: {batch_count}")
-        logger.info(f"  - Total items processed: {total_processed}")
+        logger.info(f"  - Batches processed: {sum(batches for batches, _ in done)}")
+        logger.info(f"  - Total items processed: {sum(items for _, items in done)}")
     except Exception as e:
         logger.error(f"Fatal error in main: {e}")
         raise
-    finally:
-        driver.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,4 +1,3 @@
-import re
 import unicodedata
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
@@ -22,12 +21,20 @@ password = os.getenv('NEO4J_PASS')
 
 driver = GraphDatabase.driver(uri, auth=(user, password))
 
+# Arabic diacritics (U+064B–U+0655), deleted with str.translate
+ARABIC_DIACRITICS_TABLE = dict.fromkeys(range(0x064B, 0x0656))
+
+# Orthographic variants folded by normalize_arabic
+ARABIC_VARIANTS_TABLE = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا',  # Alif variants → plain alif
+    'ى': 'ي',  # Alif maqsura → ya
+    'ة': 'ه',  # Ta marbuta → ha
+})
+
 def strip_diacritics(text):
     if text is None:
         return None
-    arabic_diacritics = re.compile(r'[\u064B-\u0652\u0653-\u0655]')
-    text = unicodedata.normalize('NFKD', text)
-    return arabic_diacritics.sub('', text)
+    return unicodedata.normalize('NFKD', text).translate(ARABIC_DIACRITICS_TABLE)
 
 def normalize_arabic(text):
     """
@@ -44,17 +51,11 @@ def normalize_arabic(text):
     # First strip diacritics
     text = strip_diacritics(text)
     
-    # Normalize orthographic variants
+    # Normalize orthographic variants in one pass
     # Alif variants: أ (hamza above), إ (hamza below), آ (madda) → ا (plain alif)
-    text = re.sub(r'[أإآ]', 'ا', text)
-    
     # Ya variants: ى (alif maqsura) → ي (ya)
-    text = re.sub(r'ى', 'ي', text)
-    
     # Ta marbuta: ة → ه (convert to ha for more consistent matching)
-    text = re.sub(r'ة', 'ه', text)
-    
-    return text
+    return text.translate(ARABIC_VARIANTS_TABLE)
 
 def backfill_normalization(tx):
     """Backfill arabic_normalized property for existing Word nodes"""